@@ -0,0 +1,585 @@
+"""
+Historical replay of a signal file.
+
+Bars are read from local files in a data directory, one file per symbol and timeframe:
+
+    <SYMBOL>_D1.csv or <SYMBOL>_D1.npy        required, trading days and daily prices
+    <SYMBOL>_M1.csv or <SYMBOL>_M1.npy        optional, intraday prices and stoplosses
+    <SYMBOL>_ticks.csv or <SYMBOL>_ticks.npy  optional, used instead of M1 when present
+    symbols.json                              optional contract specs, {"EURUSD": {"digits": 5, ...}}
+
+CSV files are MetaTrader5 exports (tab separated, <DATE> <TIME> <OPEN> ...), they are
+converted to .npy next to the source file on the first run.
+
+The replay uses the same SeasonalSignal, ShortTermSignal and BreakoutSignal rules as
+live trading. A virtual clock jumps from one due signal to the next (next_check_time()
+of the signals), stoplosses between the jumps are found with a vectorized search over
+the bar arrays, so years of data take seconds:
+
+    python backtest.py "files/FTMO Test-FTMO.csv" --data data --start 2020-01-01 --end 2024-01-01
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from pydantic import BaseModel
+
+import fake_mt5
+
+try:
+    import MetaTrader5  # noqa: F401
+except ImportError:
+    # Signals import MetaTrader5 only for type hints, the replay doesn't talk to a terminal
+    fake_mt5.install()
+
+from market import MarketSnapshot
+from risk import RiskEngine
+from signals import (
+    BaseSignal, BreakoutSignal, OrderDirection, ResponseClose, ResponseOpen, SeasonalSignal, Status,
+    create_signal, month_start,
+)
+from utils import clock, exceptions
+from utils.logger_config import logger
+
+RATES_DTYPE = fake_mt5.RATES_DTYPE
+TICKS_DTYPE = fake_mt5.TICKS_DTYPE
+
+
+def local_epoch(seconds: np.ndarray) -> np.ndarray:
+    """
+    numpy parses naive exported times as UTC. Shift them to the unix time of the same
+    wall clock in the local timezone, the way datetime.timestamp() treats naive datetimes
+    """
+    days = seconds // 86400
+    unique, inverse = np.unique(days, return_inverse=True)
+    offsets = np.array(
+        [(datetime(1970, 1, 1) + timedelta(days=int(day))).timestamp() - day * 86400 for day in unique],
+        dtype=np.int64
+    )
+    return seconds + offsets[inverse]
+
+
+def read_export(path: Path) -> tuple[np.ndarray, dict[str, list[str]]]:
+    """
+    Read a MetaTrader5 csv export. Returns times in milliseconds and the other columns as strings
+    """
+    with path.open(newline="") as file:
+        reader = csv.reader(file, delimiter="\t")
+        header = [name.strip("<>").lower() for name in next(reader)]
+        columns = dict(zip(header, map(list, zip(*reader))))
+    dates = [date.replace(".", "-") for date in columns.pop("date")]
+    if "time" in columns:
+        dates = [f"{date}T{_time}" for date, _time in zip(dates, columns.pop("time"))]
+    milliseconds = np.array(dates, dtype="datetime64[ms]").astype(np.int64)
+    return local_epoch(milliseconds // 1000) * 1000 + milliseconds % 1000, columns
+
+
+def _column(values: list[str]) -> np.ndarray:
+    """
+    Float column where empty cells repeat the previous value (tick exports leave unchanged prices empty)
+    """
+    array = np.array([float(value) if value else np.nan for value in values])
+    filled = np.where(np.isnan(array), 0, np.arange(len(array)))
+    np.maximum.accumulate(filled, out=filled)
+    return array[filled]
+
+
+def load_bars(base: Path) -> np.ndarray | None:
+    npy = base.with_suffix(".npy")
+    if npy.exists():
+        return np.load(npy)
+    source = base.with_suffix(".csv")
+    if not source.exists():
+        return None
+    milliseconds, columns = read_export(source)
+    bars = np.zeros(len(milliseconds), dtype=RATES_DTYPE)
+    bars["time"] = milliseconds // 1000
+    for name in ("open", "high", "low", "close"):
+        bars[name] = _column(columns[name])
+    bars["tick_volume"] = _column(columns.get("tickvol", ["0"] * len(bars)))
+    bars["spread"] = _column(columns.get("spread", ["0"] * len(bars)))
+    np.save(npy, bars)
+    return bars
+
+
+def load_ticks(base: Path) -> np.ndarray | None:
+    npy = base.with_suffix(".npy")
+    if npy.exists():
+        return np.load(npy)
+    source = base.with_suffix(".csv")
+    if not source.exists():
+        return None
+    milliseconds, columns = read_export(source)
+    ticks = np.zeros(len(milliseconds), dtype=TICKS_DTYPE)
+    ticks["time_msc"] = milliseconds
+    ticks["time"] = milliseconds // 1000
+    ticks["bid"] = _column(columns["bid"])
+    ticks["ask"] = _column(columns["ask"])
+    np.save(npy, ticks)
+    return ticks
+
+
+def infer_digits(prices: np.ndarray) -> int:
+    sample = prices[:1000]
+    for digits in range(7):
+        if np.allclose(np.round(sample, digits), sample, rtol=0, atol=10 ** -(digits + 3)):
+            return digits
+    return 5
+
+
+class SymbolSpec(BaseModel):
+    digits: int | None = None
+    trade_tick_value: float = 1
+    trade_tick_size: float | None = None
+    volume_min: float = 0.01
+    volume_step: float = 0.01
+    volume_max: float = 100
+    # Spread in points for bars without their own spread
+    spread: int = 10
+
+
+class SymbolData:
+    """
+    Price history of one symbol with vectorized lookups
+    """
+
+    def __init__(self, symbol: str, d1: np.ndarray, m1: np.ndarray | None, ticks: np.ndarray | None,
+                 spec: SymbolSpec):
+        self.symbol = symbol
+        self.d1 = d1
+        self.intraday = m1 if m1 is not None else d1
+        self.ticks = ticks
+        if spec.digits is None:
+            spec.digits = infer_digits(self.intraday["open"])
+        self.point = 10 ** -spec.digits
+        if spec.trade_tick_size is None:
+            spec.trade_tick_size = self.point
+        self.spec = spec
+
+    @classmethod
+    def load(cls, directory: Path, symbol: str, spec: SymbolSpec) -> "SymbolData | None":
+        d1 = load_bars(directory / f"{symbol}_D1")
+        if d1 is None:
+            return None
+        return cls(symbol, d1, load_bars(directory / f"{symbol}_M1"), load_ticks(directory / f"{symbol}_ticks"), spec)
+
+    def _spread(self, bars: np.ndarray) -> np.ndarray:
+        return np.where(bars["spread"] > 0, bars["spread"], self.spec.spread) * self.point
+
+    def quote(self, timestamp: float) -> tuple[float, float, float]:
+        """
+        Time, bid and ask of the first price observable at or after the moment (no look-ahead)
+        """
+        if self.ticks is not None and len(self.ticks):
+            index = min(np.searchsorted(self.ticks["time_msc"], int(timestamp * 1000)), len(self.ticks) - 1)
+            tick = self.ticks[index]
+            return max(timestamp, tick["time_msc"] / 1000), float(tick["bid"]), float(tick["ask"])
+        bars = self.intraday
+        index = np.searchsorted(bars["time"], int(timestamp))
+        if index >= len(bars):
+            bar = bars[-1:]
+            bid = bar["close"][0]
+        else:
+            bar = bars[index:index + 1]
+            bid = bar["open"][0]
+            timestamp = max(timestamp, float(bar["time"][0]))
+        ask = round(float(bid + self._spread(bar)[0]), self.spec.digits)
+        return timestamp, float(bid), ask
+
+    def stop_hit(self, long: bool, sl: float, start: float, end: float) -> tuple[float, float] | None:
+        """
+        First moment in [start, end) when the stoploss is touched and the fill price
+        """
+        if self.ticks is not None and len(self.ticks):
+            ticks = self.ticks
+            first, last = np.searchsorted(ticks["time_msc"], [int(start * 1000), int(end * 1000)])
+            prices = ticks["bid"][first:last] if long else ticks["ask"][first:last]
+            hit = prices <= sl if long else prices >= sl
+            if not hit.any():
+                return None
+            index = int(np.argmax(hit))
+            return ticks["time_msc"][first + index] / 1000, float(prices[index])
+
+        bars = self.intraday
+        first, last = np.searchsorted(bars["time"], [int(start), int(end)])
+        window = bars[first:last]
+        if long:
+            hit = window["low"] <= sl
+        else:
+            hit = window["high"] + self._spread(window) >= sl
+        if not hit.any():
+            return None
+        index = int(np.argmax(hit))
+        bar = window[index]
+        if long:
+            price = min(float(bar["open"]), sl)
+        else:
+            price = max(round(float(bar["open"] + self._spread(window[index:index + 1])[0]), self.spec.digits), sl)
+        return float(bar["time"]), price
+
+    def daily_bars(self, start: float, end: float) -> np.ndarray:
+        first = np.searchsorted(self.d1["time"], int(start), side="left")
+        last = np.searchsorted(self.d1["time"], int(end), side="right")
+        return self.d1[first:last]
+
+    def month_bar(self, year: int, month: int) -> np.ndarray:
+        """
+        MN1 bar aggregated from D1 bars
+        """
+        start = datetime(year, month, 1)
+        end = (start + timedelta(days=32)).replace(day=1)
+        days = self.daily_bars(start.timestamp(), end.timestamp() - 1)
+        bar = np.zeros(1, dtype=RATES_DTYPE)
+        bar["time"] = int(start.timestamp())
+        if len(days):
+            bar["open"] = days["open"][0]
+            bar["high"] = days["high"].max()
+            bar["low"] = days["low"].min()
+            bar["close"] = days["close"][-1]
+        return bar
+
+
+class Trade(BaseModel):
+    ticket: int
+    magic: int
+    signal: str
+    symbol: str
+    direction: str
+    volume: float
+    open_time: datetime
+    open_price: float
+    sl: float
+    close_time: datetime | None = None
+    close_price: float | None = None
+    reason: str = ""
+    profit: float = 0
+
+
+class BacktestTerminal:
+    """
+    The part of the MetaTrader5 API used by the signals, answered from historical
+    arrays at the virtual time ``now``. Orders are filled at the current quote
+    """
+    TIMEFRAME_D1 = fake_mt5.TIMEFRAME_D1
+    TIMEFRAME_MN1 = fake_mt5.TIMEFRAME_MN1
+
+    def __init__(self, data: dict[str, SymbolData], balance: float):
+        self.data = data
+        self.balance = balance
+        self.now = datetime.now()
+        self.positions: dict[int, Trade] = {}
+        self.trades: list[Trade] = []
+        self._tickets = itertools.count(1)
+
+    def profit(self, trade: Trade, price: float) -> float:
+        spec = self.data[trade.symbol].spec
+        sign = 1 if trade.direction == "Long" else -1
+        return sign * (price - trade.open_price) / spec.trade_tick_size * spec.trade_tick_value * trade.volume
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        return symbol in self.data
+
+    def symbol_info(self, symbol: str):
+        data = self.data.get(symbol)
+        if data is None:
+            return None
+        _, bid, ask = data.quote(self.now.timestamp())
+        spec = data.spec
+        return fake_mt5.SymbolInfo(
+            symbol, True, True, spec.digits, data.point, bid, ask, round((ask - bid) / data.point),
+            spec.volume_min, spec.volume_max, spec.volume_step,
+            spec.trade_tick_value, spec.trade_tick_size, 1
+        )
+
+    def symbol_info_tick(self, symbol: str):
+        timestamp, bid, ask = self.data[symbol].quote(self.now.timestamp())
+        return fake_mt5.Tick(int(timestamp), bid, ask, 0.0, 0, int(timestamp * 1000), 6, 0.0)
+
+    def account_info(self):
+        floating = sum(
+            self.profit(trade, self.data[trade.symbol].quote(self.now.timestamp())[1 if trade.direction == "Long" else 2])
+            for trade in self.positions.values()
+        )
+        equity = self.balance + floating
+        return fake_mt5.AccountInfo(0, self.balance, equity, equity, "USD", "Backtest", "Backtest")
+
+    def copy_rates_range(self, symbol: str, timeframe: int, date_from: datetime, date_to: datetime):
+        return self.data[symbol].daily_bars(date_from.timestamp(), min(date_to, self.now).timestamp())
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        month = self.now.replace(day=1)
+        for _ in range(start_pos):
+            month = (month - timedelta(days=1)).replace(day=1)
+        return self.data[symbol].month_bar(month.year, month.month)
+
+    def positions_get(self, symbol: str | None = None, ticket: int | None = None):
+        return tuple(
+            fake_mt5.TradePosition(
+                trade.ticket, int(trade.open_time.timestamp()), int(trade.direction != "Long"), trade.magic,
+                trade.ticket, trade.volume, trade.open_price, trade.sl, 0, trade.open_price, trade.symbol, ""
+            )
+            for trade in self.positions.values()
+            if (symbol is None or trade.symbol == symbol) and (ticket is None or trade.ticket == ticket)
+        )
+
+    def open(self, request: ResponseOpen, signal: BaseSignal) -> Trade:
+        """
+        Fill at the requested price. On a closed market the request price is the first
+        price after the weekend, so the trade is stamped with the time of that price
+        """
+        timestamp, _, _ = self.data[request.symbol].quote(self.now.timestamp())
+        trade = Trade(
+            ticket=next(self._tickets),
+            magic=request.magic,
+            signal=signal.__class__.__name__,
+            symbol=request.symbol,
+            direction=request.type,
+            volume=request.volume,
+            open_time=datetime.fromtimestamp(timestamp),
+            open_price=request.price,
+            sl=request.sl,
+        )
+        self.positions[trade.ticket] = trade
+        return trade
+
+    def close(self, ticket: int, when: datetime, price: float | None = None, reason: str = "signal") -> Trade:
+        trade = self.positions.pop(ticket)
+        if price is None:
+            timestamp, bid, ask = self.data[trade.symbol].quote(when.timestamp())
+            when = datetime.fromtimestamp(timestamp)
+            price = bid if trade.direction == "Long" else ask
+        trade.close_time = when
+        trade.close_price = price
+        trade.reason = reason
+        trade.profit = round(self.profit(trade, price), 2)
+        self.balance += trade.profit
+        self.trades.append(trade)
+        return trade
+
+
+class Backtest:
+    """
+    Event driven replay: every signal is checked only at its next_check_time(),
+    signals that want to be checked on every cycle are polled each ``poll`` seconds
+    """
+
+    def __init__(
+            self,
+            rows: list[dict],
+            terminal: BacktestTerminal,
+            start: datetime,
+            end: datetime,
+            poll: float = 3600,
+            rearm: bool = True
+    ):
+        """
+        :param rows: rows of the signal csv file
+        :param poll: check interval of signals without a known due time, seconds
+        :param rearm: trade every signal again in the next year after its trade is closed
+        """
+        self.rows = rows
+        self.terminal = terminal
+        self.start = start
+        self.end = end
+        self.poll = poll
+        self.rearm = rearm
+        self.signals: dict[int, BaseSignal] = {}
+        self.checks = 0
+        self._queue: list[tuple[float, int, int]] = []
+        self._deadlines: dict[int, float] = {}
+        self._counter = itertools.count()
+        self._checked: dict[int, float] = {}
+
+    def schedule(self, magic: int, when: datetime):
+        deadline = when.timestamp()
+        self._deadlines[magic] = deadline
+        heapq.heappush(self._queue, (deadline, next(self._counter), magic))
+
+    def schedule_next(self, signal: BaseSignal):
+        now = self.terminal.now
+        if signal.status is Status.close and self.rearm:
+            self.schedule(signal.magic, month_start(signal.month, now))
+            return
+        due = None if signal.status is Status.close else signal.next_check_time(now)
+        if due is None:
+            self._deadlines.pop(signal.magic, None)
+            return
+        # Signals compare the time strictly, check them a second after their due time
+        due = now + timedelta(seconds=self.poll) if due <= now else due + timedelta(seconds=1)
+        self.schedule(signal.magic, due)
+
+    @staticmethod
+    def rearm_signal(signal: BaseSignal):
+        signal.status = Status.init
+        signal.ticket = None
+        signal.counter = 0
+        if isinstance(signal, SeasonalSignal):
+            signal.open_time_d = None
+            signal.close_time_d = None
+        if isinstance(signal, BreakoutSignal):
+            signal.signal_time = None
+        signal.update()
+
+    def advance(self, until: datetime):
+        """
+        Close positions whose stoploss was touched before ``until``
+        """
+        end = until.timestamp()
+        for ticket, trade in list(self.terminal.positions.items()):
+            data = self.terminal.data[trade.symbol]
+            start = self._checked.get(ticket, trade.open_time.timestamp())
+            hit = data.stop_hit(trade.direction == "Long", trade.sl, start, end)
+            self._checked[ticket] = end
+            if hit is None:
+                continue
+            when, price = hit
+            self.terminal.close(ticket, datetime.fromtimestamp(when), price, reason="stoploss")
+            signal = self.signals.get(trade.magic)
+            if signal is not None and signal.ticket == ticket:
+                signal.status = Status.close
+                self.schedule_next(signal)
+
+    def run(self) -> list[Trade]:
+        self.terminal.now = self.start
+        clock.set_source(lambda: self.terminal.now)
+        try:
+            for row in self.rows:
+                if row["Symbol"] not in self.terminal.data:
+                    logger.warning(f"No history for {row['Symbol']}, signal {row['Magic Number']} is skipped")
+                    continue
+                signal = create_signal(row)
+                self.signals[signal.magic] = signal
+                self.schedule_next(signal)
+
+            market = MarketSnapshot(self.terminal, ttl=float("inf"), calendar_refresh=3600)
+            # Размер позиции как у эксперта, без совокупных лимитов счёта
+            risk = RiskEngine()
+            end = self.end.timestamp()
+            while self._queue and self._queue[0][0] <= end:
+                deadline, _, magic = heapq.heappop(self._queue)
+                if self._deadlines.get(magic) != deadline:
+                    continue
+                when = datetime.fromtimestamp(deadline)
+                self.advance(when)
+                if self._deadlines.get(magic) != deadline:
+                    # The stoploss of this signal was hit, it is rescheduled already
+                    continue
+                self.terminal.now = when
+                signal = self.signals[magic]
+                if signal.status is Status.close:
+                    self.rearm_signal(signal)
+
+                market.next_cycle()
+                self.checks += 1
+                try:
+                    request = signal.check(terminal=market)
+                except exceptions.SignalNotReadyError as e:
+                    self.schedule(magic, when + timedelta(seconds=e.delay))
+                    continue
+                if isinstance(request, ResponseOpen):
+                    _, rejected = risk.size([(signal, request)], market)
+                    if rejected:
+                        self.schedule(magic, when + timedelta(seconds=60))
+                        continue
+                    signal.ticket = self.terminal.open(request, signal).ticket
+                    signal.status = Status.open
+                elif isinstance(request, ResponseClose):
+                    self.terminal.close(request.ticket, when)
+                    signal.status = Status.close
+                self.schedule_next(signal)
+
+            self.advance(self.end)
+            self.terminal.now = self.end
+            for ticket in list(self.terminal.positions):
+                self.terminal.close(ticket, self.end, reason="end")
+        finally:
+            clock.reset()
+        return self.terminal.trades
+
+
+def summary(trades: list[Trade], balance: float) -> dict:
+    """
+    Totals per magic number and for the whole book
+    """
+    by_magic: dict[int, dict] = {}
+    for trade in trades:
+        stats = by_magic.setdefault(
+            trade.magic, {"signal": trade.signal, "symbol": trade.symbol, "trades": 0, "wins": 0, "profit": 0.0})
+        stats["trades"] += 1
+        stats["wins"] += trade.profit > 0
+        stats["profit"] += trade.profit
+
+    equity = balance + np.cumsum([trade.profit for trade in sorted(trades, key=lambda trade: trade.close_time)])
+    peaks = np.maximum.accumulate(np.concatenate(([balance], equity)))
+    drawdown = float(np.max(peaks - np.concatenate(([balance], equity)))) if len(trades) else 0.0
+    total = sum(trade.profit for trade in trades)
+    return {
+        "by_magic": by_magic,
+        "trades": len(trades),
+        "win_rate": sum(trade.profit > 0 for trade in trades) / len(trades) if trades else 0.0,
+        "profit": total,
+        "final_balance": balance + total,
+        "max_drawdown": drawdown,
+    }
+
+
+def load_data(directory: Path, symbols: set[str]) -> dict[str, SymbolData]:
+    specs_file = directory / "symbols.json"
+    specs = json.loads(specs_file.read_text()) if specs_file.exists() else {}
+    data = {}
+    for symbol in sorted(symbols):
+        symbol_data = SymbolData.load(directory, symbol, SymbolSpec(**specs.get(symbol, {})))
+        if symbol_data is not None:
+            data[symbol] = symbol_data
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("signals", type=Path, help="signal csv file")
+    parser.add_argument("--data", type=Path, required=True, help="directory with bar files")
+    parser.add_argument("--start", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--end", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--balance", type=float, default=100_000)
+    parser.add_argument("--poll", type=float, default=3600, help="poll interval for breakout signals, seconds")
+    parser.add_argument("--once", action="store_true", help="trade every signal only once")
+    parser.add_argument("--out", type=Path, help="write the trade list to this csv file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with args.signals.open(newline="") as file:
+        rows = list(csv.DictReader(file, delimiter=";"))
+    terminal = BacktestTerminal(load_data(args.data, {row["Symbol"] for row in rows}), args.balance)
+    backtest = Backtest(rows, terminal, args.start, args.end, poll=args.poll, rearm=not args.once)
+
+    started = datetime.now()
+    trades = backtest.run()
+    elapsed = (datetime.now() - started).total_seconds()
+
+    if args.out:
+        with args.out.open("w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(Trade.model_fields), delimiter=";")
+            writer.writeheader()
+            for trade in trades:
+                writer.writerow(trade.model_dump())
+
+    result = summary(trades, args.balance)
+    print(f"{'magic':>8} {'signal':>16} {'symbol':>10} {'trades':>7} {'wins':>5} {'profit':>12}")
+    for magic, stats in sorted(result["by_magic"].items()):
+        print(f"{magic:>8} {stats['signal']:>16} {stats['symbol']:>10} {stats['trades']:>7} "
+              f"{stats['wins']:>5} {stats['profit']:>12.2f}")
+    print(
+        f"\nTrades: {result['trades']}, win rate: {result['win_rate']:.1%}, profit: {result['profit']:.2f}, "
+        f"final balance: {result['final_balance']:.2f}, max drawdown: {result['max_drawdown']:.2f}"
+    )
+    print(f"{backtest.checks} signal checks in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
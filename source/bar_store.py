@@ -0,0 +1,154 @@
+"""
+On-disk bar cache shared by the expert processes of one host.
+
+Closed bars can't change, so every (server, symbol, timeframe) keeps them in
+an append-only file of raw rate records:
+
+    cache/bars/<server>/<symbol>_<timeframe>.bars
+
+Readers map the file with numpy.memmap, several processes share the same
+pages of the OS cache without copies. A sync asks the terminal only for bars
+newer than the last stored one and appends them, the newest bar returned by
+the terminal is still forming and is never stored.
+"""
+import os
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from utils.file_lock import file_lock
+from utils.logger_config import logger
+
+BARS_DIR = Path(__file__).parent.parent / "cache" / "bars"
+# Формат copy_rates_*() терминала
+BAR_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+# История короче запрошенной больше, чем на эту величину и один бар, загружается заново (выходные, праздники)
+HISTORY_GAP = timedelta(days=7)
+
+
+def as_bars(rates: np.ndarray) -> np.ndarray:
+    """
+    Copy of the rates in BAR_DTYPE, the layout of the stored records
+    """
+    bars = np.empty(len(rates), dtype=BAR_DTYPE)
+    for name in BAR_DTYPE.names:
+        bars[name] = rates[name]
+    return bars
+
+
+class BarStore:
+    """
+    Memory-mapped closed bars per symbol and timeframe
+    """
+
+    def __init__(self, root: Path = BARS_DIR):
+        self.root = root
+        self._directory: Path | None = None
+        # (symbol, timeframe) -> (размер файла, отображение)
+        self._maps: dict[tuple[str, int], tuple[int, np.ndarray]] = {}
+        self.hits = 0
+        self.fetched = 0
+
+    def directory(self, terminal) -> Path:
+        """
+        Bars of different brokers differ, every server has its own directory
+        """
+        if self._directory is None:
+            account_info = terminal.account_info()
+            server = account_info.server if account_info is not None else ""
+            self._directory = self.root / (re.sub(r"[^\w.-]", "_", server) or "default")
+            self._directory.mkdir(parents=True, exist_ok=True)
+        return self._directory
+
+    def path(self, terminal, symbol: str, timeframe: int) -> Path:
+        return self.directory(terminal) / f"{symbol}_{timeframe}.bars"
+
+    def bars(self, terminal, symbol: str, timeframe: int) -> np.ndarray:
+        """
+        Stored bars as a read-only memory map, remapped when the file grew
+        """
+        path = self.path(terminal, symbol, timeframe)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return np.empty(0, dtype=BAR_DTYPE)
+        count = size // BAR_DTYPE.itemsize
+        cached = self._maps.get((symbol, timeframe))
+        if cached is not None and cached[0] == count:
+            return cached[1]
+        if not count:
+            return np.empty(0, dtype=BAR_DTYPE)
+        bars = np.memmap(path, dtype=BAR_DTYPE, mode="r", shape=(count,))
+        self._maps[(symbol, timeframe)] = (count, bars)
+        return bars
+
+    def append(self, terminal, symbol: str, timeframe: int, bars: np.ndarray):
+        """
+        Append closed bars newer than the last stored one
+        """
+        path = self.path(terminal, symbol, timeframe)
+        with file_lock(path.with_suffix(".lock")):
+            # Другой процесс мог дописать те же бары
+            stored = self.bars(terminal, symbol, timeframe)
+            if len(stored):
+                bars = bars[bars["time"] > stored["time"][-1]]
+            if not len(bars):
+                return
+            with open(path, "ab") as file:
+                if file.tell() != len(stored) * BAR_DTYPE.itemsize:
+                    # Неполная запись после сбоя отбрасывается
+                    file.truncate(len(stored) * BAR_DTYPE.itemsize)
+                file.write(as_bars(bars).tobytes())
+
+    def replace(self, terminal, symbol: str, timeframe: int, bars: np.ndarray):
+        """
+        Rewrite the file, used when a longer history than stored is requested
+        """
+        path = self.path(terminal, symbol, timeframe)
+        with file_lock(path.with_suffix(".lock")):
+            self._maps.pop((symbol, timeframe), None)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(as_bars(bars).tobytes())
+            try:
+                os.replace(tmp, path)
+            except OSError as e:
+                # Windows не даёт заменить файл, отображённый другим процессом
+                logger.debug(f"Bar store {path.name} is in use, history is not replaced: {e}")
+                tmp.unlink(missing_ok=True)
+
+    def rates_range(self, terminal, symbol: str, timeframe: int, date_from: datetime, date_to: datetime):
+        """
+        The same bars as terminal.copy_rates_range(), closed ones are read from the store
+        and only bars after the last stored one are requested from the terminal
+        :return: structured array or None when the terminal didn't answer
+        """
+        stored = self.bars(terminal, symbol, timeframe)
+        period = int(stored["time"][1] - stored["time"][0]) if len(stored) > 1 else 0
+        if not len(stored) or stored["time"][0] > (date_from + HISTORY_GAP).timestamp() + period:
+            rates = terminal.copy_rates_range(symbol, timeframe, date_from, date_to)
+            if rates is None:
+                return None
+            self.fetched += len(rates)
+            if len(rates) > 1:
+                self.replace(terminal, symbol, timeframe, rates[:-1])
+            return rates
+
+        last = int(stored["time"][-1])
+        rates = terminal.copy_rates_range(symbol, timeframe, datetime.fromtimestamp(last), date_to)
+        if rates is None:
+            return None
+        new = as_bars(rates[rates["time"] > last])
+        self.fetched += len(new)
+        if len(new) > 1:
+            self.append(terminal, symbol, timeframe, new[:-1])
+        first = np.searchsorted(stored["time"], int(date_from.timestamp()), side="left")
+        self.hits += int(len(stored) - first)
+        return np.concatenate((stored[first:], new))
+
+    def stats(self) -> dict:
+        return {"files": len(self._maps), "bars_from_disk": self.hits, "bars_from_terminal": self.fetched}
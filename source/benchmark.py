@@ -0,0 +1,245 @@
+"""
+Cycle benchmark of the expert on the fake terminal.
+
+Generates signal files of different sizes, drives Expert through full cycles
+(csv reload + check of every signal + waiting for sent orders) and reports
+cycle latency percentiles, terminal calls per cycle and CPU time.
+seasonal_ms is the cost of one event loop wakeup that evaluates the seasonal book.
+
+    python benchmark.py --signals 10 100 1000 10000 --cycles 20 --latency 0.0002
+
+--load compares the bulk loader with the per-row csv.DictReader path:
+
+    python benchmark.py --load 50000
+
+--logging measures the time log calls take in the trading thread with the old
+synchronous handlers and with the queue and de-duplication of utils.logger_config:
+
+    python benchmark.py --logging 100000
+"""
+import argparse
+import csv
+import io
+import logging
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import fake_mt5
+
+HEADER = "Magic Number;Month;Symbol;Entry;TP;SL;SL Type;Risk;Direction;Type;Open Time;Close Time"
+SYMBOLS = ("EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "XAUUSD", "US500", "GER40", "USOIL")
+
+
+def generate_signals(path: Path, count: int, seed: int = 0):
+    """
+    Write a csv with ``count`` signals: mostly seasonal, some short-term and breakout ones.
+    A few seasonal signals open in the current minute so the order path is exercised too
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    rows = [HEADER]
+    for magic in range(1, count + 1):
+        symbol = rng.choice(SYMBOLS)
+        direction = rng.choice(("Long", "Short"))
+        kind = rng.random()
+        if kind < 0.8:
+            start = now if magic % 100 == 1 else now + timedelta(days=rng.randint(1, 360))
+            end = start + timedelta(days=rng.randint(1, 30))
+            rows.append(
+                f"{magic};{start.month};{symbol};{start:%d.%m};{end:%d.%m};2,5;Percentage;0.5;"
+                f"{direction};Seasonal;{start:%H:%M};{end:%H:%M}")
+        elif kind < 0.9:
+            month = rng.randint(1, 12)
+            rows.append(
+                f"{magic};{month};{symbol};{rng.randint(1, 5)} TDOM;{rng.randint(6, 15)} TDOM;5;Percentage;0.5;"
+                f"{direction};Short-term;08:30;20:45")
+        else:
+            month = rng.randint(1, 12)
+            rows.append(
+                f"{magic};{month};{symbol};{rng.choice(('PMH', 'PML'))};{rng.randint(1, 20)} TD;150;Points;0.25;"
+                f"{direction};Breakout;;")
+    path.write_text("\n".join(rows) + "\n")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def run(count: int, cycles: int, terminal: fake_mt5.FakeTerminal, workdir: Path) -> dict:
+    from expert import Expert, SEASONAL
+
+    csv_file = workdir / f"signals_{count}.csv"
+    generate_signals(csv_file, count)
+    terminal.positions.clear()
+    terminal.deals.clear()
+    terminal.calls.clear()
+
+    start = time.perf_counter()
+    expert = Expert(
+        csv_file=csv_file, path="fake", journal_file=workdir / f"journal_{count}.sqlite", cache_dir=workdir / "cache")
+    startup = time.perf_counter() - start
+    startup_calls = sum(terminal.calls.values())
+    terminal.calls.clear()
+
+    latencies = []
+    cpu_start = time.process_time()
+    for _ in range(cycles):
+        start = time.perf_counter()
+        expert.refresh_signals()
+        expert.check_signals()
+        expert.dispatcher.wait()
+        latencies.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+
+    # Event loop wakeup for the seasonal book: one vectorized pass over all seasonal signals
+    seasonal = []
+    for _ in range(cycles):
+        expert.scheduler.schedule(SEASONAL, 0)
+        start = time.perf_counter()
+        expert.on_timer()
+        seasonal.append(time.perf_counter() - start)
+    expert.dispatcher.shutdown()
+
+    return {
+        "signals": len(expert.signals),
+        "startup_ms": startup * 1000,
+        "startup_calls": startup_calls,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "calls_per_cycle": sum(terminal.calls.values()) / cycles,
+        "cpu_ms_per_cycle": cpu / cycles * 1000,
+        "seasonal_ms": percentile(seasonal, 0.5) * 1000,
+        "calls": dict(terminal.calls.most_common(5)),
+    }
+
+
+def load(count: int, workdir: Path) -> dict:
+    """
+    Parse a file of ``count`` rows and build the signals, per row and in bulk
+    """
+    from loader import SignalBatch
+    from signals import signal_fields, signal_type
+
+    csv_file = workdir / f"signals_{count}.csv"
+    generate_signals(csv_file, count)
+    content = csv_file.read_bytes()
+
+    start = time.perf_counter()
+    rows = list(csv.DictReader(io.StringIO(content.decode()), delimiter=";"))
+    fields = [(signal_type(row["Type"]), signal_fields(row)) for row in rows]
+    row_parse = time.perf_counter() - start
+    signals = [kind(**item) for kind, item in fields]
+    row_total = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = SignalBatch.parse(content)
+    fields = [(batch.kinds[i], batch.fields(i)) for i in batch.indices()]
+    bulk_parse = time.perf_counter() - start
+    signals = [kind(**item) for kind, item in fields]
+    bulk_total = time.perf_counter() - start
+
+    return {
+        "rows": len(signals),
+        "row_parse_ms": row_parse * 1000,
+        "bulk_parse_ms": bulk_parse * 1000,
+        "row_total_ms": row_total * 1000,
+        "bulk_total_ms": bulk_total * 1000,
+    }
+
+
+def log_cost(count: int, workdir: Path) -> dict:
+    """
+    Write ``count`` messages, mostly repeated like the per-tick lines of the signals,
+    through synchronous file and console handlers and through the logging queue
+    """
+    from utils.logger_config import build_handlers, start_queue_logging
+
+    messages = [f"Working day in month: {i % 5}" if i % 10 else f"Order {i} was sent" for i in range(count)]
+    result = {"messages": count}
+    for mode in ("sync", "queue"):
+        log = logging.getLogger(f"benchmark.{mode}")
+        log.propagate = False
+        log.setLevel(logging.DEBUG)
+        path = workdir / f"{mode}_{count}.log"
+        handlers = build_handlers(str(path), "text")
+        # Консоль заменена буфером, чтобы не засорять вывод
+        handlers[1].setStream(io.StringIO())
+        listener = None
+        if mode == "sync":
+            for handler in handlers:
+                log.addHandler(handler)
+        else:
+            listener = start_queue_logging(log, handlers)
+
+        start = time.perf_counter()
+        for message in messages:
+            log.info(message)
+        elapsed = time.perf_counter() - start
+        if listener is not None:
+            listener.stop()
+        for handler in handlers:
+            handler.close()
+        result[f"{mode}_us_per_call"] = elapsed / count * 1e6
+        result[f"{mode}_ms"] = elapsed * 1000
+        result[f"{mode}_lines"] = len(path.read_text(encoding="utf-8").splitlines())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signals", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0002, help="seconds added to every terminal call")
+    parser.add_argument("--load", type=int, nargs="*", help="benchmark file loading with this many rows")
+    parser.add_argument("--logging", type=int, nargs="*", help="benchmark logging with this many messages")
+    args = parser.parse_args()
+
+    terminal = fake_mt5.install(latency=args.latency)
+    import utils.logger_config  # noqa: F401, configures logging first
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.load:
+        columns = ("rows", "row_parse_ms", "bulk_parse_ms", "row_total_ms", "bulk_total_ms")
+        print(" ".join(f"{column:>16}" for column in columns))
+        with tempfile.TemporaryDirectory() as workdir:
+            for count in args.load:
+                result = load(count, Path(workdir))
+                print(" ".join(
+                    f"{result[column]:>16.2f}" if isinstance(result[column], float) else f"{result[column]:>16}"
+                    for column in columns))
+        return
+
+    if args.logging:
+        columns = ("messages", "sync_ms", "queue_ms", "sync_us_per_call", "queue_us_per_call",
+                   "sync_lines", "queue_lines")
+        print(" ".join(f"{column:>18}" for column in columns))
+        with tempfile.TemporaryDirectory() as workdir:
+            for count in args.logging:
+                result = log_cost(count, Path(workdir))
+                print(" ".join(
+                    f"{result[column]:>18.2f}" if isinstance(result[column], float) else f"{result[column]:>18}"
+                    for column in columns))
+        return
+
+    columns = ("signals", "startup_ms", "startup_calls", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+               "calls_per_cycle", "cpu_ms_per_cycle", "seasonal_ms")
+    print(" ".join(f"{column:>16}" for column in columns))
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in args.signals:
+            result = run(count, args.cycles, terminal, Path(workdir))
+            print(" ".join(
+                f"{result[column]:>16.2f}" if isinstance(result[column], float) else f"{result[column]:>16}"
+                for column in columns))
+            print(f"{'':>16} top calls per run: {result['calls']}")
+
+
+if __name__ == "__main__":
+    main()
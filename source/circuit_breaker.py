@@ -0,0 +1,271 @@
+"""
+Protection of the broker from repeated rejected orders.
+
+Every trade server rejection is mapped to a class (market closed, trading
+disabled, no money, too many requests ...). A circuit per symbol and class,
+or per account for classes that don't depend on the symbol, opens after
+``threshold`` rejections in a row and blocks the orders of the symbol for the
+cooldown of the class. After the cooldown the circuit is half-open: one trial
+order goes through, a success closes the circuit and another rejection opens
+it again with twice the cooldown.
+
+Most classes (no money, close only, volume limit ...) only reject new
+positions, so closes are checked against the account-wide classes that stop
+every order (connection, too many requests, autotrading) and nothing else.
+
+Opens also pass a token bucket, ORDER_RATE orders per second with bursts of
+ORDER_BURST (0 disables the limit). Closes don't take its tokens.
+
+State changes are logged and exported with the metrics (expert_circuit_state).
+"""
+import os
+import threading
+import time
+from enum import Enum
+
+from pydantic import BaseModel
+
+from utils.logger_config import logger
+from utils.server_status_code import SERVER_STATUS_NAME
+
+# TRADE_RETCODE_PLACED, TRADE_RETCODE_DONE, TRADE_RETCODE_DONE_PARTIAL
+SUCCESS_RETCODES = frozenset((10008, 10009, 10010))
+# Область цепи, общей для всех символов счёта
+ACCOUNT = "*"
+# Пробный ордер полуоткрытой цепи, результат которого не пришёл, выдаётся заново
+TRIAL_TIMEOUT = 30
+
+
+class CircuitState(Enum):
+    closed = 0
+    open = 1
+    half_open = 2
+
+
+class RetcodeClass(BaseModel):
+    name: str
+    retcodes: tuple[int, ...]
+    # Цепь на символ или одна на весь счёт
+    account: bool = False
+    # Класс отклоняет и закрытия позиций, иначе только открытия
+    closes: bool = False
+    threshold: int = 1
+    cooldown: float
+    max_cooldown: float
+
+
+RETCODE_CLASSES = (
+    RetcodeClass(name="market_closed", retcodes=(10018,), cooldown=300, max_cooldown=3600),
+    RetcodeClass(name="trade_disabled", retcodes=(10017, 10042, 10043, 10044), cooldown=600, max_cooldown=3600),
+    RetcodeClass(name="no_money", retcodes=(10019,), cooldown=300, max_cooldown=1800),
+    RetcodeClass(name="symbol_limit", retcodes=(10034,), cooldown=300, max_cooldown=1800),
+    RetcodeClass(name="invalid_request", retcodes=(10013, 10014, 10015, 10016, 10022, 10035, 10038),
+                 threshold=3, cooldown=60, max_cooldown=900),
+    RetcodeClass(name="too_many_requests", retcodes=(10024,), account=True, closes=True,
+                 cooldown=10, max_cooldown=300),
+    RetcodeClass(name="autotrading_disabled", retcodes=(10026, 10027), account=True, closes=True,
+                 cooldown=60, max_cooldown=900),
+    RetcodeClass(name="account_limit", retcodes=(10033, 10040), account=True, cooldown=300, max_cooldown=1800),
+    RetcodeClass(name="connection", retcodes=(10012, 10031), account=True, closes=True,
+                 threshold=2, cooldown=5, max_cooldown=120),
+)
+
+
+class Circuit:
+    __slots__ = ("scope", "kind", "state", "failures", "cooldown", "opened_at", "until", "trial_at", "trips")
+
+    def __init__(self, scope: str, kind: RetcodeClass):
+        self.scope = scope
+        self.kind = kind
+        self.state = CircuitState.closed
+        self.failures = 0
+        self.cooldown = kind.cooldown
+        self.opened_at = 0.0
+        self.until = 0.0
+        # Время выдачи пробного ордера в полуоткрытом состоянии
+        self.trial_at: float | None = None
+        self.trips = 0
+
+
+class TokenBucket:
+    """
+    ``rate`` tokens per second, at most ``burst`` saved
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        :return: 0 when a token was taken, otherwise seconds until the next one
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class CircuitBreaker:
+    """
+    Circuits by symbol and retcode class and the global order rate limit.
+    The trading thread asks blocked()/acquire(), dispatcher threads record() the results
+    """
+
+    def __init__(self, rate: float = 0, burst: float = 10, classes: tuple[RetcodeClass, ...] = RETCODE_CLASSES):
+        self.classes = {retcode: kind for kind in classes for retcode in kind.retcodes}
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.lock = threading.Lock()
+        self.circuits: dict[tuple[str, str], Circuit] = {}
+        self.blocked_orders = 0
+        self.limited_orders = 0
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(rate=float(os.getenv("ORDER_RATE", 5)), burst=float(os.getenv("ORDER_BURST", 10)))
+
+    def blocked(self, symbol: str, close: bool = False) -> tuple[str, float] | None:
+        """
+        Check the circuits of the symbol and of the account before an order is sent.
+        An expired cooldown turns the circuit half-open and lets this order through as the trial
+        :param close: the order closes a position, only the classes of closes are checked
+        :return: None when the order can be sent, otherwise (reason, seconds to wait)
+        """
+        now = time.time()
+        with self.lock:
+            for scope in (symbol, ACCOUNT):
+                for circuit in self.circuits.values():
+                    if circuit.scope != scope or circuit.state is CircuitState.closed:
+                        continue
+                    if close and not circuit.kind.closes:
+                        continue
+                    if circuit.state is CircuitState.open:
+                        if now < circuit.until:
+                            self.blocked_orders += 1
+                            return f"circuit {scope}/{circuit.kind.name} is open", circuit.until - now
+                        circuit.state = CircuitState.half_open
+                        circuit.trial_at = None
+                        logger.warning(f"Circuit {scope}/{circuit.kind.name} is half-open, sending a trial order")
+                    if circuit.trial_at is not None and now - circuit.trial_at < TRIAL_TIMEOUT:
+                        self.blocked_orders += 1
+                        return f"circuit {scope}/{circuit.kind.name} waits for the trial order", 5.0
+                    circuit.trial_at = now
+        return None
+
+    def is_open(self, symbol: str, close: bool = False) -> bool:
+        """
+        An open circuit of the symbol or the account, checked again right before an order
+        already in the dispatcher queue is sent
+        """
+        now = time.time()
+        with self.lock:
+            return any(
+                circuit.state is CircuitState.open and now < circuit.until and circuit.scope in (symbol, ACCOUNT)
+                and (circuit.kind.closes or not close)
+                for circuit in self.circuits.values())
+
+    def acquire(self) -> float:
+        """
+        Take a token of the order rate limit, opens only
+        :return: 0 when the order can be sent, otherwise seconds to wait
+        """
+        if self.bucket is None:
+            return 0.0
+        with self.lock:
+            wait = self.bucket.take()
+            if wait:
+                self.limited_orders += 1
+            return wait
+
+    def record(self, symbol: str, retcode: int | None, close: bool = False):
+        """
+        Result of an order sent to the server
+        :param close: result of a close, it changes only the circuits of the classes of closes
+        """
+        if retcode is None:
+            return
+        now = time.time()
+        with self.lock:
+            if retcode in SUCCESS_RETCODES:
+                self._success(symbol, close)
+                return
+            kind = self.classes.get(retcode)
+            if kind is None or close and not kind.closes:
+                # Реквоты и прочие коды, не зависящие от состояния рынка или счёта
+                return
+            scope = ACCOUNT if kind.account else symbol
+            circuit = self.circuits.get((scope, kind.name))
+            if circuit is None:
+                circuit = self.circuits[(scope, kind.name)] = Circuit(scope, kind)
+            circuit.failures += 1
+            if circuit.state is CircuitState.half_open:
+                circuit.cooldown = min(circuit.cooldown * 2, kind.max_cooldown)
+            elif circuit.state is CircuitState.open or circuit.failures < kind.threshold:
+                return
+            circuit.state = CircuitState.open
+            circuit.opened_at = now
+            circuit.until = now + circuit.cooldown
+            circuit.trial_at = None
+            circuit.trips += 1
+            logger.error(
+                f"Circuit {scope}/{kind.name} opened for {circuit.cooldown:.0f} s after "
+                f"{retcode} {SERVER_STATUS_NAME.get(retcode, 'UNKNOWN')}")
+
+    def _success(self, symbol: str, close: bool):
+        for circuit in self.circuits.values():
+            # Успешное закрытие не говорит о деньгах или лимитах на открытие
+            if circuit.scope not in (symbol, ACCOUNT) or close and not circuit.kind.closes:
+                continue
+            circuit.failures = 0
+            if circuit.state is not CircuitState.closed:
+                circuit.state = CircuitState.closed
+                circuit.cooldown = circuit.kind.cooldown
+                circuit.trial_at = None
+                logger.warning(f"Circuit {circuit.scope}/{circuit.kind.name} closed")
+
+    def snapshot(self) -> list[dict]:
+        """
+        State of every circuit for operators
+        """
+        now = time.time()
+        with self.lock:
+            return [{
+                "scope": circuit.scope,
+                "class": circuit.kind.name,
+                "state": circuit.state.name,
+                "failures": circuit.failures,
+                "trips": circuit.trips,
+                "retry_in": max(circuit.until - now, 0.0) if circuit.state is CircuitState.open else 0.0,
+            } for circuit in self.circuits.values()]
+
+    def render(self) -> list[str]:
+        """
+        Metrics in the Prometheus text format, added to the telemetry output
+        """
+        lines = [
+            "# HELP expert_circuit_state Circuit breaker state: 0 closed, 1 open, 2 half-open",
+            "# TYPE expert_circuit_state gauge",
+        ]
+        circuits = self.snapshot()
+        lines += [f'expert_circuit_state{{scope="{c["scope"]}",class="{c["class"]}"}} '
+                  f'{CircuitState[c["state"]].value}' for c in circuits]
+        lines += [
+            "# HELP expert_circuit_trips_total Times a circuit opened",
+            "# TYPE expert_circuit_trips_total counter",
+        ]
+        lines += [f'expert_circuit_trips_total{{scope="{c["scope"]}",class="{c["class"]}"}} {c["trips"]}'
+                  for c in circuits]
+        lines += [
+            "# HELP expert_orders_blocked_total Orders held back by an open circuit",
+            "# TYPE expert_orders_blocked_total counter",
+            f"expert_orders_blocked_total {self.blocked_orders}",
+            "# HELP expert_orders_rate_limited_total Orders held back by the order rate limit",
+            "# TYPE expert_orders_rate_limited_total counter",
+            f"expert_orders_rate_limited_total {self.limited_orders}",
+        ]
+        return lines
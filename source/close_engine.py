@@ -0,0 +1,220 @@
+"""
+Close stage of the expert.
+
+The closes that fall due in one cycle are gathered and sent per symbol in one
+batch: one positions_get() for the symbol, the price from the tick cached by
+MarketSnapshot and order_send() for every position back to back. Batches of
+different symbols run in parallel in the dispatcher lanes.
+
+Every result is classified by its retcode (utils.server_status_code): a
+requote, changed price or missing quotes is retried at once with a fresh
+tick, a rejected filling mode is probed again, a partial fill is retried for
+the rest of the volume. Other retcodes fail the close, the signal stays open
+and is checked again on the next timer.
+"""
+import threading
+import time
+from collections import Counter, deque
+
+from utils.logger_config import logger
+from utils.server_status_code import SERVER_STATUS_CODE, SERVER_STATUS_NAME
+
+# TRADE_RETCODE_PLACED, TRADE_RETCODE_DONE
+DONE_RETCODES = frozenset((10008, 10009))
+DONE_PARTIAL = 10010
+# TRADE_RETCODE_REQUOTE, TRADE_RETCODE_PRICE_CHANGED, TRADE_RETCODE_PRICE_OFF: повтор с новой ценой
+TRANSIENT_RETCODES = frozenset((10004, 10020, 10021))
+INVALID_FILL = 10030
+POSITION_CLOSED = 10036
+
+
+def classify(retcode: int | None) -> str:
+    """
+    :return: "done", "partial", "transient", "fill", "gone", "failed" or "unknown" (not in SERVER_STATUS_CODE)
+    """
+    if retcode in DONE_RETCODES:
+        return "done"
+    if retcode == DONE_PARTIAL:
+        return "partial"
+    if retcode in TRANSIENT_RETCODES:
+        return "transient"
+    if retcode == INVALID_FILL:
+        return "fill"
+    if retcode == POSITION_CLOSED:
+        return "gone"
+    return "failed" if retcode in SERVER_STATUS_CODE else "unknown"
+
+
+def describe(retcode: int | None) -> str:
+    if retcode is None:
+        return "no result"
+    return f"{retcode} {SERVER_STATUS_NAME.get(retcode, 'UNKNOWN')}: {SERVER_STATUS_CODE.get(retcode, '')}"
+
+
+class CloseResult:
+    """
+    Outcome of closing one position
+    """
+    __slots__ = ("magic", "ticket", "symbol", "kind", "retcode", "attempts", "latency", "requested", "price")
+
+    def __init__(self, magic: int, ticket: int, symbol: str):
+        self.magic = magic
+        self.ticket = ticket
+        self.symbol = symbol
+        self.kind = "failed"
+        self.retcode: int | None = None
+        self.attempts = 0
+        self.latency = 0.0
+        # Цена последнего запроса и цена исполнения
+        self.requested: float | None = None
+        self.price: float | None = None
+
+    @property
+    def closed(self) -> bool:
+        """
+        The position doesn't exist anymore, closed by this request or before it
+        """
+        return self.kind in ("done", "gone")
+
+    @property
+    def retries(self) -> int:
+        return max(self.attempts - 1, 0)
+
+
+class CloseEngine:
+    """
+    Sends the closes of one symbol in a batch and retries transient failures
+    """
+
+    def __init__(self, terminal, market, filling, breaker=None, max_retries: int = 3, deviation: int = 50,
+                 history: int = 1000):
+        """
+        :param terminal: MetaTrader5 module (or a proxy of it), fresh prices and order_send()
+        :param market: MarketSnapshot, the tick of the cycle for the first attempt
+        :param filling: FillingModeCache
+        :param breaker: circuit_breaker.CircuitBreaker, gets the result of every close
+        :param max_retries: immediate retries of a transient failure
+        """
+        self.terminal = terminal
+        self.market = market
+        self.filling = filling
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.deviation = deviation
+        self.lock = threading.Lock()
+        self.results: deque[CloseResult] = deque(maxlen=history)
+        self.retcodes: Counter = Counter()
+
+    def close_batch(self, symbol: str, closes: list[tuple]) -> list[CloseResult]:
+        """
+        Close the positions of the signals on one symbol
+        :param closes: (signal, ResponseClose) pairs
+        :return: results in the order of ``closes``
+        """
+        results = [CloseResult(signal.magic, request.ticket, symbol) for signal, request in closes]
+        positions = self.terminal.positions_get(symbol=symbol)
+        if positions is None:
+            logger.error(f"Closes on {symbol} were not sent, positions_get failed: {self.terminal.last_error()}")
+            return results
+        positions = {position.ticket: position for position in positions}
+        tick = self.market.symbol_info_tick(symbol)
+        for result in results:
+            position = positions.get(result.ticket)
+            if position is None:
+                # Закрыта стоп-лоссом или вручную
+                result.kind = "gone"
+                logger.info(f"Position {result.ticket} of signal [{result.magic}] is already closed")
+                continue
+            if self.breaker is not None and self.breaker.is_open(symbol, close=True):
+                # Цепь открылась по результату предыдущего закрытия пакета
+                logger.warning(f"Position {result.ticket} of signal [{result.magic}] was not closed, circuit is open")
+                continue
+            tick = self.close(position, tick, result)
+            if self.breaker is not None:
+                self.breaker.record(symbol, result.retcode, close=True)
+        with self.lock:
+            self.results.extend(results)
+        return results
+
+    def close(self, position, tick, result: CloseResult):
+        """
+        Send the close of one position, retry transient failures at once
+        :return: the last tick used, the next close of the batch starts from it
+        """
+        terminal = self.terminal
+        volume = position.volume
+        start = time.perf_counter()
+        while True:
+            if tick is None:
+                tick = terminal.symbol_info_tick(position.symbol)
+            if tick is None:
+                result.kind = "failed"
+                logger.error(f"Position {position.ticket} was not closed, no tick for {position.symbol}")
+                break
+            buy = position.type == terminal.POSITION_TYPE_BUY
+            request = {
+                "action": terminal.TRADE_ACTION_DEAL,
+                "symbol": position.symbol,
+                "volume": volume,
+                "type": terminal.ORDER_TYPE_SELL if buy else terminal.ORDER_TYPE_BUY,
+                "position": position.ticket,
+                "price": tick.bid if buy else tick.ask,
+                "deviation": self.deviation,
+                "magic": position.magic,
+                "comment": "python script close",
+                "type_time": terminal.ORDER_TIME_GTC,
+                "type_filling": self.filling.get(position.symbol),
+            }
+            reply = terminal.order_send(request)
+            result.attempts += 1
+            result.requested = request["price"]
+            result.retcode = reply.retcode if reply is not None else None
+            if reply is not None and reply.price:
+                result.price = reply.price
+            result.kind = classify(result.retcode)
+            with self.lock:
+                self.retcodes[result.retcode] += 1
+            if result.kind in ("done", "gone") or result.attempts > self.max_retries:
+                break
+            if result.kind == "transient":
+                tick = None
+            elif result.kind == "fill":
+                self.filling.invalidate(position.symbol)
+                self.filling.probe(position.symbol)
+            elif result.kind == "partial":
+                # Закрывается оставшийся объём позиции
+                rest = terminal.positions_get(ticket=position.ticket)
+                if not rest:
+                    result.kind = "done"
+                    break
+                volume = rest[0].volume
+            else:
+                break
+        result.latency = time.perf_counter() - start
+        if result.closed:
+            logger.info(
+                f"Position {position.ticket} of signal [{result.magic}] was closed at "
+                f"{result.price or result.requested} in {result.latency * 1000:.1f} ms, retries: {result.retries}")
+        elif result.retcode is not None:
+            logger.error(
+                f"Position {position.ticket} of signal [{result.magic}] was not closed after "
+                f"{result.attempts} attempts: {describe(result.retcode)}")
+        elif result.attempts:
+            logger.error(f"Position {position.ticket} was not closed, order_send failed: {terminal.last_error()}")
+        return tick
+
+    def stats(self) -> dict:
+        with self.lock:
+            results = list(self.results)
+            retcodes = dict(self.retcodes)
+        if not results:
+            return {"closes": 0}
+        latencies = sorted(result.latency for result in results)
+        return {
+            "closes": len(results),
+            "closed": sum(result.closed for result in results),
+            "retries": sum(result.retries for result in results),
+            "median_latency": latencies[len(latencies) // 2],
+            "max_latency": latencies[-1],
+            "retcodes": retcodes,
+        }
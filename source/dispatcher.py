@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from utils.logger_config import logger
+
+
+class LockedTerminal:
+    """
+    Proxy that serialises every call into the MetaTrader5 module with one lock.
+
+    The MetaTrader5 package doesn't document thread safety, so when orders are
+    sent from worker threads each terminal call (initialize, symbol_info,
+    order_send ...) is done under the lock. Work between the calls (sizing,
+    logging, waiting) still runs in parallel.
+    """
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.lock = threading.RLock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.terminal, name)
+        if not callable(attr) or isinstance(attr, type):
+            return attr
+        lock = self.lock
+
+        def call(*args, **kwargs):
+            with lock:
+                return attr(*args, **kwargs)
+
+        # Next lookups find the wrapper without __getattr__
+        setattr(self, name, call)
+        return call
+
+
+class Job:
+    def __init__(self, key: str, magics: tuple[int, ...], func: Callable, args: tuple):
+        self.key = key
+        # Сигналы задания, у пакета закрытий их несколько
+        self.magics = magics
+        self.func = func
+        self.args = args
+        self.submitted = time.perf_counter()
+        self.queue_wait: float | None = None
+        self.latency: float | None = None
+
+    @property
+    def label(self) -> str:
+        return ", ".join(map(str, self.magics))
+
+
+class OrderDispatcher:
+    """
+    Bounded pool of worker threads that sends requests of signals.
+
+    Jobs with the same key (symbol) form a lane and run one after another in
+    submit order, jobs of different symbols run in parallel. Every job records
+    how long it waited in the queue and how long it took to execute.
+    """
+
+    def __init__(self, max_workers: int = 4, history: int = 1000, slow: float = 0.5):
+        """
+        :param slow: seconds of queue wait plus execution above which a job is logged at INFO, otherwise DEBUG
+        """
+        self.slow = slow
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dispatch")
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.lanes: dict[str, deque[Job]] = {}
+        self.in_flight: dict[int, int] = {}
+        self.jobs: deque[Job] = deque(maxlen=history)
+
+    def submit(self, key: str, magic: int, func: Callable, *args):
+        self.submit_many(key, (magic,), func, *args)
+
+    def submit_many(self, key: str, magics: tuple[int, ...], func: Callable, *args):
+        """
+        One job for several signals, every one of them is pending until it is done
+        """
+        job = Job(key, magics, func, args)
+        with self.lock:
+            for magic in magics:
+                self.in_flight[magic] = self.in_flight.get(magic, 0) + 1
+            lane = self.lanes.get(key)
+            if lane is not None:
+                lane.append(job)
+                return
+            self.lanes[key] = deque()
+        self.pool.submit(self._run_lane, key, job)
+
+    def pending(self, magic: int) -> bool:
+        """
+        True while a job of the signal is queued or running
+        """
+        return magic in self.in_flight
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Block until every submitted job is done
+        """
+        with self.idle:
+            return self.idle.wait_for(lambda: not self.in_flight, timeout)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+    def _run_lane(self, key: str, job: Job | None):
+        while job is not None:
+            self._run(job)
+            with self.lock:
+                lane = self.lanes[key]
+                if lane:
+                    job = lane.popleft()
+                else:
+                    del self.lanes[key]
+                    job = None
+
+    def _run(self, job: Job):
+        start = time.perf_counter()
+        job.queue_wait = start - job.submitted
+        try:
+            job.func(*job.args)
+        except Exception as e:
+            logger.exception(f"Job of signal [{job.label}] on {job.key} failed: {e}")
+        finally:
+            job.latency = time.perf_counter() - start
+            # Медленные задания видны и без DEBUG, log_index разбирает запись на любом уровне
+            logger.log(
+                logging.INFO if job.queue_wait + job.latency > self.slow else logging.DEBUG,
+                "Request of signal [%s] on %s: queue wait %.1f ms, sent in %.1f ms",
+                job.label, job.key, job.queue_wait * 1000, job.latency * 1000)
+            with self.lock:
+                self.jobs.append(job)
+                for magic in job.magics:
+                    if self.in_flight[magic] == 1:
+                        del self.in_flight[magic]
+                    else:
+                        self.in_flight[magic] -= 1
+                if not self.in_flight:
+                    self.idle.notify_all()
+
+    def stats(self) -> dict:
+        with self.lock:
+            jobs = list(self.jobs)
+        if not jobs:
+            return {"jobs": 0}
+        waits = sorted(job.queue_wait for job in jobs)
+        latencies = sorted(job.latency for job in jobs)
+        return {
+            "jobs": len(jobs),
+            "max_queue_wait": waits[-1],
+            "median_queue_wait": waits[len(waits) // 2],
+            "max_latency": latencies[-1],
+            "median_latency": latencies[len(latencies) // 2],
+        }
@@ -0,0 +1,324 @@
+"""
+Execution quality of the orders sent by the expert.
+
+Every open and close is traced from the decision (the moment check() of the
+signal returned the request) to the answer of the trade server. The trace
+keeps the time of every stage:
+
+    evaluate  check() of the signal
+    sizing    risk stage of the cycle batch (opens)
+    queue     wait in the dispatcher lane
+    filling   filling mode lookup or probe (opens)
+    send      order_send(), with the immediate retries of a close
+
+and the requested and executed price. Slippage is in points of the symbol,
+positive when the fill is worse than the requested price.
+
+Rows are appended to a columnar store, one file per column:
+
+    cache/execution/<csv file name>/<column>.col
+
+The store is summarized by symbol, signal type, hour or kind:
+
+    python execution_quality.py summary --by symbol hour --since 2024-06-01
+"""
+import argparse
+import atexit
+import math
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from utils.file_lock import file_lock
+from utils.logger_config import logger
+
+EXECUTION_DIR = Path(__file__).parent.parent / "cache" / "execution"
+STAGES = ("evaluate", "sizing", "queue", "filling", "send")
+COLUMNS = np.dtype([
+    ("decision", "<f8"),
+    ("magic", "<i8"),
+    ("ticket", "<i8"),
+    # 0 - открытие, 1 - закрытие
+    ("kind", "u1"),
+    ("symbol", "S16"),
+    ("signal", "S16"),
+    ("retcode", "<i4"),
+    ("requested", "<f8"),
+    ("executed", "<f8"),
+    ("slippage", "<f4"),
+    *((f"{stage}_ms", "<f4") for stage in STAGES),
+    ("total_ms", "<f4"),
+    ("retries", "<i2"),
+])
+KINDS = ("open", "close")
+# TRADE_RETCODE_PLACED, TRADE_RETCODE_DONE, TRADE_RETCODE_DONE_PARTIAL
+FILLED_RETCODES = (10008, 10009, 10010)
+
+
+class ExecutionStore:
+    """
+    Append-only columns of execution records
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def path(self, column: str) -> Path:
+        return self.directory / f"{column}.col"
+
+    def __len__(self):
+        sizes = []
+        for name in COLUMNS.names:
+            try:
+                sizes.append(self.path(name).stat().st_size // COLUMNS[name].itemsize)
+            except FileNotFoundError:
+                return 0
+        return min(sizes)
+
+    def append(self, rows: np.ndarray):
+        """
+        :param rows: structured array of COLUMNS
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.directory / "store.lock"):
+            count = len(self)
+            for name in COLUMNS.names:
+                with open(self.path(name), "ab") as file:
+                    # Столбцы, дописанные не полностью при сбое, обрезаются до общего числа строк
+                    if file.tell() != count * COLUMNS[name].itemsize:
+                        file.truncate(count * COLUMNS[name].itemsize)
+                    file.write(np.ascontiguousarray(rows[name]).tobytes())
+
+    def read(self, columns: tuple[str, ...] = COLUMNS.names) -> dict[str, np.ndarray]:
+        """
+        Memory-mapped columns, only the requested ones are opened
+        """
+        count = len(self)
+        if not count:
+            return {name: np.empty(0, dtype=COLUMNS[name]) for name in columns}
+        return {name: np.memmap(self.path(name), dtype=COLUMNS[name], mode="r", shape=(count,)) for name in columns}
+
+
+class Stage:
+    """
+    Timer of one stage of an order trace
+    """
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: "OrderTrace", name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.start)
+
+
+class OrderTrace:
+    __slots__ = ("magic", "kind", "symbol", "signal", "buy", "decision", "stages", "submitted")
+
+    def __init__(self, magic: int, kind: int, symbol: str, signal: str, buy: bool, evaluate: float):
+        self.magic = magic
+        self.kind = kind
+        self.symbol = symbol
+        self.signal = signal
+        self.buy = buy
+        self.decision = time.time()
+        self.stages = {"evaluate": evaluate}
+        self.submitted: float | None = None
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+class ExecutionLog:
+    """
+    Traces of the orders in flight, finished ones are buffered and appended to the store
+    """
+    _idle = nullcontext()
+
+    def __init__(self, store: ExecutionStore, flush_interval: float = 5, flush_size: int = 256):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.lock = threading.Lock()
+        self.traces: dict[int, OrderTrace] = {}
+        self.rows: list[tuple] = []
+        self.flushed = time.monotonic()
+        # Ордера, исполненные после последнего цикла, дописываются при выходе
+        atexit.register(self.flush, True)
+
+    def decide(self, magic: int, symbol: str, signal: str, close: bool, buy: bool, evaluate: float):
+        """
+        Start the trace of a request returned by check() of the signal
+        :param signal: type of the signal
+        :param buy: the order buys (an open of a long signal or a close of a short one)
+        :param evaluate: duration of check(), seconds
+        """
+        self.traces[magic] = OrderTrace(magic, int(close), symbol, signal, buy, evaluate)
+
+    def discard(self, magic: int):
+        self.traces.pop(magic, None)
+
+    def add(self, magics, stage: str, seconds: float):
+        for magic in magics:
+            trace = self.traces.get(magic)
+            if trace is not None:
+                trace.add(stage, seconds)
+
+    def stage(self, magic: int, name: str):
+        """
+        Context manager timing a stage of the order of the signal
+        """
+        trace = self.traces.get(magic)
+        return Stage(trace, name) if trace is not None else self._idle
+
+    def submitted(self, magics):
+        now = time.perf_counter()
+        for magic in magics:
+            trace = self.traces.get(magic)
+            if trace is not None:
+                trace.submitted = now
+
+    def dequeued(self, magics):
+        """
+        A dispatcher thread took the orders, the queue stage ends
+        """
+        now = time.perf_counter()
+        for magic in magics:
+            trace = self.traces.get(magic)
+            if trace is not None and trace.submitted is not None:
+                trace.add("queue", now - trace.submitted)
+
+    def complete(self, magic: int, retcode: int, ticket: int | None, requested: float | None,
+                 executed: float | None, point: float | None, retries: int = 0):
+        """
+        Close the trace with the answer of the server
+        """
+        trace = self.traces.pop(magic, None)
+        if trace is None:
+            return
+        slippage = math.nan
+        if requested and executed and point:
+            slippage = (executed - requested) / point if trace.buy else (requested - executed) / point
+        row = (
+            trace.decision, magic, ticket or 0, trace.kind, trace.symbol.encode()[:16], trace.signal.encode()[:16],
+            retcode, requested or math.nan, executed or math.nan, slippage,
+            *(trace.stages[stage] * 1000 if stage in trace.stages else math.nan for stage in STAGES),
+            (time.time() - trace.decision) * 1000, retries,
+        )
+        with self.lock:
+            self.rows.append(row)
+
+    def flush(self, force: bool = False):
+        """
+        Append the buffered rows, called by the trading thread at the end of a cycle
+        """
+        if not self.rows:
+            return
+        if not force and len(self.rows) < self.flush_size and time.monotonic() - self.flushed < self.flush_interval:
+            return
+        with self.lock:
+            rows, self.rows = self.rows, []
+        self.flushed = time.monotonic()
+        try:
+            self.store.append(np.array(rows, dtype=COLUMNS))
+        except OSError as e:
+            logger.error(f"Execution records were not written to {self.store.directory}: {e}")
+
+
+def summarize(columns: dict[str, np.ndarray], by: tuple[str, ...]) -> list[dict]:
+    """
+    Orders, fill rate, latency and slippage percentiles per group
+    :param by: columns from "symbol", "signal", "kind", "hour"
+    """
+    if not len(columns["decision"]):
+        return []
+    keys = []
+    for name in by:
+        if name == "hour":
+            # Час по местному времени машины, как в логах
+            keys.append(((columns["decision"] + time.localtime().tm_gmtoff) // 3600 % 24).astype(np.int64))
+        elif name == "kind":
+            keys.append(np.asarray(columns["kind"]).astype(np.int64))
+        else:
+            keys.append(np.asarray(columns[name]))
+    order = np.lexsort(keys[::-1]) if keys else np.arange(len(columns["decision"]))
+    groups: dict[tuple, list[int]] = {}
+    for i in order:
+        groups.setdefault(tuple(key[i] for key in keys), []).append(i)
+
+    def percentile(values: np.ndarray, q: float) -> float:
+        values = values[~np.isnan(values)]
+        return float(np.percentile(values, q)) if len(values) else math.nan
+
+    summary = []
+    for group, rows in groups.items():
+        rows = np.array(rows)
+        filled = np.isin(columns["retcode"][rows], FILLED_RETCODES)
+        entry = {}
+        for name, value in zip(by, group):
+            entry[name] = KINDS[value] if name == "kind" else value.decode() if isinstance(value, bytes) else int(value)
+        slippage = columns["slippage"][rows][filled].astype(float)
+        entry.update(
+            orders=len(rows),
+            fill_rate=float(filled.mean()),
+            total_p50_ms=percentile(columns["total_ms"][rows].astype(float), 50),
+            total_p95_ms=percentile(columns["total_ms"][rows].astype(float), 95),
+            send_p50_ms=percentile(columns["send_ms"][rows].astype(float), 50),
+            queue_p50_ms=percentile(columns["queue_ms"][rows].astype(float), 50),
+            slippage_mean=float(np.nanmean(slippage)) if (~np.isnan(slippage)).any() else math.nan,
+            slippage_p95=percentile(slippage, 95),
+        )
+        summary.append(entry)
+    return summary
+
+
+def load(stores: list[Path], since: str | None = None, until: str | None = None) -> dict[str, np.ndarray]:
+    """
+    Columns of several stores joined, filtered by the decision date
+    """
+    parts = [ExecutionStore(directory).read() for directory in stores]
+    columns = {name: np.concatenate([part[name] for part in parts]) if parts else np.empty(0, dtype=COLUMNS[name])
+               for name in COLUMNS.names}
+    mask = np.ones(len(columns["decision"]), dtype=bool)
+    if since:
+        mask &= columns["decision"] >= datetime.fromisoformat(since).timestamp()
+    if until:
+        end = datetime.fromisoformat(until if len(until) > 10 else f"{until} 23:59:59")
+        mask &= columns["decision"] <= end.timestamp()
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("summary",))
+    parser.add_argument("--store", type=Path, nargs="*",
+                        help="store directories, every store in cache/execution by default")
+    parser.add_argument("--by", nargs="*", default=["symbol"], choices=("symbol", "signal", "kind", "hour"))
+    parser.add_argument("--since")
+    parser.add_argument("--until")
+    args = parser.parse_args()
+
+    stores = args.store or sorted(path for path in EXECUTION_DIR.glob("*") if path.is_dir())
+    summary = summarize(load(stores, args.since, args.until), tuple(args.by))
+    if not summary:
+        print("no execution records")
+        return
+    columns = tuple(summary[0])
+    print(" ".join(f"{column:>14}" for column in columns))
+    for entry in summary:
+        print(" ".join(
+            f"{entry[column]:>14.2f}" if isinstance(entry[column], float) else f"{entry[column]:>14}"
+            for column in columns))
+
+
+if __name__ == "__main__":
+    main()
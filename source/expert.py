@@ -2,15 +2,31 @@ from typing import Callable,Optional
 from functools import wraps
 import MetaTrader5 as mt5
 from MetaTrader5 import AccountInfo, SymbolInfo, OrderSendResult
-from pydantic import ValidationError
+from pydantic import BaseModel, ValidationError
 from datetime import datetime,timedelta
 from utils.logger_config import logger
 from pathlib import Path
-import csv
+import hashlib
 from signals import SeasonalSignal, ShortTermSignal, BreakoutSignal, ResponseOpen
 import time
 from signals import OrderDirection, StoplossType, ResponseClose, Status
+from signals import signal_type
 from utils import exceptions
+from session import TerminalSession
+from scheduler import Scheduler
+from reconcile import PositionIndex
+from market import MarketSnapshot
+from filling import FillingModeCache
+from dispatcher import OrderDispatcher, LockedTerminal
+from retry import RetryQueue
+from seasonal_book import SeasonalBook
+from loader import SignalBatch, RowError
+from journal import StateJournal, JOURNAL_DIR
+import telemetry
+from risk import RiskEngine, RiskLimits
+from close_engine import CloseEngine
+from circuit_breaker import CircuitBreaker
+from execution_quality import ExecutionLog, ExecutionStore, EXECUTION_DIR
 
 import os
 from dotenv import load_dotenv
@@ -23,35 +39,38 @@ load_dotenv(
 )
 
 
-def on_timer(timer_seconds: int):
-    def function(func: Callable) -> Callable:
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            last_check_time = time.time()
-            func(*args, **kwargs)
-            while True:
-                current_time = time.time()
-                if current_time - last_check_time > timer_seconds:
-                    # print("".join(["==_==" for _ in range(10)]))
-                    # logger.info("Вызов функции on_timer")
-                    func(*args, **kwargs)
-                    # print("".join(["==_==" for _ in range(10)]))
-                    last_check_time = time.time()
+# Ключ планировщика для проверки csv файла
+RELOAD = "reload"
+# Общий ключ планировщика для сезонных сигналов из SeasonalBook
+SEASONAL = "seasonal"
+# Ключ планировщика для опроса новых тиков TickFeed
+TICKS = "ticks"
 
-        return wrapper
 
-    return function
+class ReloadReport(BaseModel):
+    """
+    Result of one csv reload: magic numbers of added, changed, removed and unchanged rows
+    """
+    added: list[int] = []
+    changed: list[int] = []
+    removed: list[int] = []
+    unchanged: int = 0
+
+    def __str__(self):
+        return (f"added: {len(self.added)}, changed: {len(self.changed)}, "
+                f"removed: {len(self.removed)}, unchanged: {self.unchanged}")
 
-def f(dig:str):
-    return float(dig.replace(',', '.'))
 
 def connection(func):
+    """
+    Run the method only when the terminal session is alive.
+    The session stays attached between calls and reconnects itself when the link drops
+    """
+    @wraps(func)
     def wrapper(self, *args, **kwargs):
 
-        if self.terminal.initialize(path=self.path):
-            result = func(self,*args, **kwargs)
-            self.terminal.shutdown()
-            return result
+        if self.session.ensure():
+            return func(self, *args, **kwargs)
 
     return wrapper
 
@@ -65,186 +84,581 @@ class Expert:
     terminal = mt5
     path = os.getenv("TERMINAL_PATH")
     last_error = None
-
-    def __init__(self):
+    # Минимальный интервал между повторными проверками сигнала, сек
+    timer_seconds = 1
+    reload_interval = float(os.getenv("RELOAD_INTERVAL", 1))
+    max_idle = float(os.getenv("MAX_IDLE", 60))
+    snapshot_ttl = float(os.getenv("SNAPSHOT_TTL", 1))
+    dispatch_workers = int(os.getenv("DISPATCH_WORKERS", 4))
+    # Задания диспетчера дольше порога пишутся в лог на уровне INFO, остальные на DEBUG
+    dispatch_slow_ms = float(os.getenv("DISPATCH_SLOW_MS", 500))
+    # Пробойные сигналы ждут тиков за уровнем, а не опрашиваются каждую секунду
+    tick_feed_enabled = os.getenv("TICK_FEED", "1") == "1"
+    tick_interval = float(os.getenv("TICK_INTERVAL", 0.25))
+    # Проверка пробойного сигнала без тиков, обновляет уровни и месяц
+    breakout_recheck = 60
+    # Закрытые бары D1/MN1 хранятся в cache/bars и общие для всех процессов
+    bar_store_enabled = os.getenv("BAR_STORE", "1") == "1"
+    # Немедленные повторы закрытия при реквоте, изменении цены или отсутствии котировок
+    close_retries = int(os.getenv("CLOSE_RETRIES", 3))
+    # Без гарантий потокобезопасности MetaTrader5 все вызовы терминала идут под одной блокировкой
+    mt5_thread_safe = os.getenv("MT5_THREAD_SAFE", "0") == "1"
+
+    def __init__(self, csv_file: Path | None = None, path: str | None = None, journal_file: Path | None = None,
+                 cache_dir: Path | None = None):
         """
         Imitate OnInit function
 
         Function takes
-        :param con:
+        :param csv_file: signals file, by default files/<FILE_NAME>.csv
+        :param path: terminal path, by default TERMINAL_PATH
+        :param journal_file: state journal, by default cache/journal/<csv file name>.sqlite
+        :param cache_dir: directory for the bar store, filling modes, execution records and the journal
+                          instead of cache/ of the project, used by benchmarks
         """
-
-        self.signals: list[SeasonalSignal, ShortTermSignal, BreakoutSignal] = []
-
-        self.csv_file: Path = Path(__file__).parent.parent / "files" / f"{os.getenv("FILE_NAME")}.csv"
+        if path is not None:
+            self.path = path
+
+        self.signals: dict[int, SeasonalSignal | ShortTermSignal | BreakoutSignal] = {}
+        # Содержимое строк csv по magic number, чтобы обновлять только изменённые сигналы
+        self.rows: dict[int, list] = {}
+        # (mtime, size, hash) последней полностью обработанной версии файла
+        self.file_state: tuple | None = None
+        # Последний отчёт об ошибках файла, одинаковый отчёт не повторяется в логе при каждой проверке
+        self.error_report: str | None = None
+        # Позиции и история сделок, загружаются один раз за перезагрузку с новыми строками
+        self.position_index: PositionIndex | None = None
+        # Без METRICS_PORT / METRICS_FILE терминал не оборачивается
+        self.telemetry = telemetry.from_env()
+        self.terminal = self.telemetry.wrap(self.terminal)
+        if not self.mt5_thread_safe:
+            self.terminal = LockedTerminal(self.terminal)
+        self.session = TerminalSession(self.terminal, self.path)
+        self.scheduler = Scheduler(max_idle=self.max_idle)
+        # Общие для всех сигналов данные символов и счёта за один цикл
+        bar_store = None
+        if self.bar_store_enabled:
+            from bar_store import BarStore
+            bar_store = BarStore() if cache_dir is None else BarStore(cache_dir / "bars")
+        self.market = MarketSnapshot(self.terminal, ttl=self.snapshot_ttl, bar_store=bar_store)
+        self.filling = FillingModeCache(self.market) if cache_dir is None else \
+            FillingModeCache(self.market, cache_dir / "filling_modes.json")
+        self.dispatcher = OrderDispatcher(max_workers=self.dispatch_workers, slow=self.dispatch_slow_ms / 1000)
+        self.retries = RetryQueue()
+        self.seasonal = SeasonalBook()
+        self.risk = RiskEngine(RiskLimits.from_env())
+        self.tick_feed = None
+        if self.tick_feed_enabled:
+            from tick_feed import TickFeed
+            self.tick_feed = TickFeed(self.market)
+        # Запросы на открытие за текущий цикл, размер считается для всех сразу в flush_opens()
+        self.opens: list[tuple] = []
+        # Запросы на закрытие за текущий цикл, отправляются пакетами по символам в flush_closes()
+        self.closes: list[tuple] = []
+        # Ордера символа с повторяющимися отказами сервера и сверх ORDER_RATE не отправляются
+        self.breaker = CircuitBreaker.from_env()
+        self.telemetry.add_collector(self.breaker.render)
+        self.closer = CloseEngine(
+            self.terminal, self.market, self.filling, breaker=self.breaker, max_retries=self.close_retries)
+
+        self.csv_file: Path = csv_file or Path(__file__).parent.parent / "files" / f"{os.getenv('FILE_NAME')}.csv"
+        journal_dir = JOURNAL_DIR if cache_dir is None else cache_dir / "journal"
+        self.journal = StateJournal(journal_file or journal_dir / f"{self.csv_file.stem}.sqlite")
+        # Состояния из журнала, которые ещё не восстановлены в сигналы
+        self.journaled = self.journal.load()
+        # Задержки этапов и проскальзывание каждого ордера, cache/execution/<csv file name>/
+        execution_dir = EXECUTION_DIR if cache_dir is None else cache_dir / "execution"
+        self.executions = ExecutionLog(ExecutionStore(execution_dir / self.csv_file.stem))
         self.refresh_signals()
 
 
 
     @connection
-    def refresh_signals(self):
+    def refresh_signals(self) -> ReloadReport | None:
+        """
+        Create, update and remove signals according to the csv file.
+        The file is skipped when its mtime, size or content hash didn't change,
+        and only rows whose content changed are validated again.
+        :return: report of the reload or None when the file wasn't parsed
+        """
         try:
-            with self.csv_file.open("r", newline="") as file:
-                reader = csv.DictReader(file, delimiter=";")
-                for data in reader:
-                    try:
-                        magic = int(data["Magic Number"])
-                        for signal in self.signals:
-                            if signal.magic == magic:
-                                self.update(signal, data)
-                                break
-                        else:
-                            signal = self.create(data)
-                            signal_status = self.order_exists(data)
-                            signal.status,signal.ticket = signal_status
-                            self.signals.append(signal)
-
-                    except ValidationError as e:
-                        logger.critical(f"Validation error for row {data}: {e}")
+            stat = self.csv_file.stat()
+            state = (stat.st_mtime_ns, stat.st_size)
+            if self.file_state is not None and self.file_state[:2] == state:
+                return None
+            content = self.csv_file.read_bytes()
+            digest = hashlib.blake2b(content, digest_size=16).digest()
+            if self.file_state is not None and self.file_state[2] == digest:
+                self.file_state = (*state, digest)
+                return None
+
+            report = ReloadReport()
+            self.position_index = None
+            batch = SignalBatch.parse(content)
+            seen = batch.seen()
+            # Новые и изменённые строки записываются в журнал одной транзакцией
+            journal = []
+            terminal_error = None
+            for i in batch.indices():
+                magic = batch.magic[i]
+                row = batch.rows[i]
+                signal = self.signals.get(magic)
+                try:
+                    if signal is None:
+                        signal = self.create(batch.kinds[i], batch.fields(i))
+                        self.restore_state(signal, ";".join(row))
+                        self.signals[magic] = signal
+                        report.added.append(magic)
+                        journal.append((signal, ";".join(row)))
+                    elif self.rows.get(magic) != row:
+                        self.update(signal, batch.fields(i))
+                        report.changed.append(magic)
+                        journal.append((signal, ";".join(row)))
+                    else:
+                        report.unchanged += 1
+                    self.rows[magic] = row
+                except (ValidationError, ValueError, exceptions.SignalSymbolNotFoundError) as e:
+                    batch.errors.append(RowError(line=batch.lines[i], magic=str(magic), column="row", message=str(e)))
+                    self.rows.pop(magic, None)
+                except exceptions.TerminalDataError as e:
+                    # Без позиций и истории состояние новых сигналов неизвестно, остальные строки ждут следующей перезагрузки
+                    terminal_error = e
+                    break
+
+            if batch.errors:
+                # Bad rows are reported together and parsed again on the next reload
+                error_report = batch.report()
+                if error_report != self.error_report:
+                    logger.critical(f"{len(batch.errors)} invalid rows in {self.csv_file.name}:\n{error_report}")
+                self.error_report = error_report
+                for magic in batch.invalid():
+                    self.rows.pop(magic, None)
+
+            if terminal_error is None:
+                for magic in self.signals.keys() - seen:
+                    self.remove_signal(magic)
+                    report.removed.append(magic)
+            else:
+                logger.error(f"Reload of {self.csv_file.name} stopped at signal [{magic}]: terminal function "
+                             f"{terminal_error.function} returned no data ({terminal_error.error}). "
+                             f"Current signals are kept, the file is read again at the next reload")
+            if journal:
+                self.journal.record_many(journal)
+
+            self.filling.warm({self.signals[magic].symbol for magic in report.added})
+
+            if not batch.errors:
+                self.error_report = None
+            self.file_state = None if batch.errors or terminal_error else (*state, digest)
+            if report.added or report.changed or report.removed:
+                logger.info(f"Signals reloaded from {self.csv_file.name}: {report}")
+            return report
         except FileNotFoundError:
             logger.critical(f"File {self.csv_file} not found.")
         except Exception as e:
             logger.critical(f"An error occurred: {e}")
 
-    def create(self, data: dict):
+    def remove_signal(self, magic: int):
+        """
+        Forget the signal whose row was deleted from the csv file.
+        An open position of the signal is left as is and only reported
+        """
+        signal = self.signals.pop(magic)
+        self.rows.pop(magic, None)
+        self.scheduler.cancel(magic)
+        self.seasonal.remove(magic)
+        self.retries.release(magic)
+        self.journal.forget(magic)
+        if self.tick_feed is not None:
+            self.tick_feed.unwatch(magic)
+        if signal.status is Status.open:
+            logger.warning(
+                f"Signal with magic [{magic}] was removed from {self.csv_file.name}, "
+                f"position with ticket {signal.ticket} is not managed anymore")
+        else:
+            logger.info(f"Signal with magic [{magic}] was removed from {self.csv_file.name}")
 
-        signal = self.parse_signal_type(
-            data.get("Type")
-        )
-        symbol = data.get("Symbol")
-        if self.terminal.symbol_info(symbol) is None:
+    def create(self, signal: type, fields: dict):
+        """
+        :param signal: signal class
+        :param fields: signal fields from SignalBatch.fields() or signal_fields()
+        """
+        symbol = fields["symbol"]
+        symbol_info = self.market.symbol_info(symbol)
+        if symbol_info is None:
             logger.critical(f"Signal {signal.__name__} was not created.")
             raise exceptions.SignalSymbolNotFoundError(symbol)
+        # Символ должен получать котировки до того, как сигнал сработает
+        if not symbol_info.select:
+            self.terminal.symbol_select(symbol, True)
+            self.market.invalidate(symbol)
 
-        logger.info(f"Start create new signal {signal.__name__}")
-        return signal(
-            magic=int(data['Magic Number']),
-            month=int(data['Month']),
-            symbol=data['Symbol'],
-            entry=data['Entry'],
-            tp=data["TP"],
-            sl=f(data['SL']),
-            sl_type=StoplossType.percentage if data['SL Type'] == "Percentage" else StoplossType.points,
-            risk=f(data['Risk']),
-            direction= OrderDirection.long if data['Direction'] == "Long" else OrderDirection.short,
-            open_time=data['Open Time'] if data['Open Time'] else None,
-            close_time=data['Close Time'] if data['Close Time'] else None,
-        )
+        return signal(**fields)
 
-    def update(self,signal, data:dict):
-        signal.magic = int(data['Magic Number'])
-        signal.month = int(data['Month'])
-        signal.symbol = data['Symbol']
-        signal.entry = data['Entry']
-        signal.tp = data["TP"]
-        signal.sl = f(data['SL'])
-        signal.sl_type = StoplossType.percentage if data['SL Type'] == "Percentage" else  StoplossType.points
-        signal.risk = f(data['Risk'])
-        signal.direction = OrderDirection.long if data['Direction'] == "Long" else OrderDirection.short
-        signal.open_time = data['Open Time'] if data['Open Time'] else None
-        signal.close_time = data['Close Time'] if data['Close Time'] else None
+    def update(self,signal, fields:dict):
+        for name, value in fields.items():
+            setattr(signal, name, value)
         signal.update()
 
-    def order_exists(self,data:dict):
-        """ Function check signal by magic and symbol in open and history orders.
-        If signal wasn't founded, return True,else False"""
-        symbol = data.get("Symbol")
-        magic = int(data.get("Magic Number"))
-        orders = tuple(filter(lambda order: order.magic == int(magic), self.terminal.positions_get(symbol=symbol)))
-        if not orders:
-            from_date = datetime.now() - timedelta(days=365)
-            to_date = datetime.now() + timedelta(days=2)
-            #logger.info(f"Will check {magic} from {from_date} to {datetime.now()}")
-            orders = self.terminal.history_deals_get(from_date, to_date)
-            orders = tuple(filter(lambda order: order.magic == int(magic) and order.symbol == symbol,orders))
-            #print(f"List of open deals filter by magic={magic}:\n found {len(orders)} orders")
-            if not orders:
-                #logger.info(f"Not found order with this magic")
-                return Status.init, None
-        else:
-            return Status.open, orders[-1].ticket
-        return Status.close,None
+    def order_exists(self, magic: int, symbol: str):
+        """ Function check signal by magic and symbol in open positions and deal history.
+        Positions and history are loaded once per reload into PositionIndex.
+        Returns status of the signal and ticket of the open position"""
+        if self.position_index is None or not self.position_index.history:
+            self.position_index = PositionIndex.build(self.terminal)
+        return self.position_index.status(magic, symbol)
+
+    def restore_state(self, signal, row: str):
+        """
+        Set status and ticket of a new signal from the state journal and verify them
+        against open positions. Signals unknown to the journal are looked up
+        in positions and deal history with order_exists()
+        :param row: csv row of the signal
+        """
+        state = self.journaled.pop(signal.magic, None)
+        if state is None or state.symbol != signal.symbol:
+            signal.status, signal.ticket = self.order_exists(signal.magic, signal.symbol)
+            return
+        state.apply(signal, same_row=state.row == row)
+        if signal.status is Status.close:
+            return
+        if self.position_index is None:
+            self.position_index = PositionIndex.build(self.terminal, history=False)
+        ticket = self.position_index.positions.get((signal.magic, signal.symbol))
+        if ticket == signal.ticket:
+            return
+        if ticket is not None:
+            logger.warning(
+                f"Signal with magic [{signal.magic}] has an open position {ticket} "
+                f"while the journal has ticket {signal.ticket}, the position is managed")
+            signal.status, signal.ticket = Status.open, ticket
+            self.journal.record(signal, "verify open")
+        elif signal.status is Status.open:
+            # Позиция закрылась, пока эксперт не работал (stop loss или вручную)
+            logger.warning(
+                f"Position {signal.ticket} of signal with magic [{signal.magic}] "
+                f"was closed while the expert was stopped")
+            signal.status = Status.close
+            self.journal.record(signal, "verify close")
 
     @staticmethod
-    def parse_signal_type(signal_type: str):
-        if signal_type == "Seasonal":
-            return SeasonalSignal
-        elif signal_type == "Short-term":
-            return ShortTermSignal
-        else:
-            return BreakoutSignal
+    def parse_signal_type(name: str):
+        return signal_type(name)
 
     def get_filling_mode(self, symbol):
         """
-        The MetaTrader5 library doesn't find the filling mode correctly for a lot of brokers
+        The MetaTrader5 library doesn't find the filling mode correctly for a lot of brokers,
+        the mode is probed once and cached per broker and symbol
         """
-        for i in range(2):
-            request = {
-                "action": mt5.TRADE_ACTION_DEAL,
-                "symbol": symbol,
-                "volume": mt5.symbol_info(symbol).volume_min,
-                "type": mt5.ORDER_TYPE_BUY,
-                "price": mt5.symbol_info_tick(symbol).ask,
-                "type_filling": i,
-                "type_time": mt5.ORDER_TIME_GTC}
-
-            result = mt5.order_check(request)
-
-            if result.comment == "Done":
-                break
+        return self.filling.get(symbol)
 
-        return i
-
-    @on_timer(1)
-    def main(self):
+    def main(self, on_cycle: Callable[[float], None] | None = None):
         """
-        Calls two function
+        Event loop of the expert.
+        The first cycle checks every signal, after that the loop sleeps until
+        the nearest deadline in the scheduler and handles only due keys:
         1 - create or update information about signals
-        2 - manage signal behaviour
+        2 - manage behaviour of signals that are due
+        :param on_cycle: called with the duration of every cycle in seconds, used by the supervisor
         :return: None
         """
-        self.refresh_signals()
         self.check_signals()
+        self.scheduler.schedule(RELOAD, time.time() + self.reload_interval)
+        while True:
+            self.scheduler.sleep()
+            start = time.perf_counter()
+            self.on_timer()
+            duration = time.perf_counter() - start
+            self.telemetry.observe_cycle(duration)
+            if on_cycle is not None:
+                on_cycle(duration)
+
+    def on_timer(self):
+        self.market.next_cycle()
+        for key in self.scheduler.pop_due():
+            if key == RELOAD:
+                with self.telemetry.phase("reload"):
+                    report = self.refresh_signals()
+                self.scheduler.schedule(RELOAD, time.time() + self.reload_interval)
+                if report is None:
+                    continue
+                for magic in report.added:
+                    self.schedule_signal(self.signals[magic])
+                # Times in the file could change, an earlier deadline only causes an extra check
+                for magic in report.changed:
+                    self.schedule_signal(self.signals[magic], keep_earlier=True)
+            elif key == SEASONAL:
+                self.check_seasonal()
+            elif key == TICKS:
+                self.check_ticks()
+            elif (signal := self.signals.get(key)) is not None:
+                self.schedule_signal(signal, self.manage_signal(signal))
+        self.flush_closes()
+        self.flush_opens()
+        self.executions.flush()
+
+    def check_seasonal(self):
+        """
+        Manage only seasonal signals that are due to open or close right now
+        """
+        for magic in self.seasonal.due(time.time()):
+            signal = self.signals[int(magic)]
+            self.schedule_signal(signal, self.manage_signal(signal))
+        deadline = self.seasonal.next_deadline()
+        if deadline is not None:
+            self.scheduler.schedule(SEASONAL, deadline)
+
+    def check_ticks(self):
+        """
+        Manage only breakout signals whose level was crossed by the new ticks
+        """
+        for magic in self.tick_feed.poll():
+            signal = self.signals.get(magic)
+            if signal is not None:
+                self.schedule_signal(signal, self.manage_signal(signal))
+        if len(self.tick_feed):
+            self.scheduler.schedule(TICKS, time.time() + self.tick_interval)
+
+    def watch_breakout(self, signal: BreakoutSignal, now: datetime) -> bool:
+        """
+        Hand a waiting breakout signal of the current month over to the tick feed
+        :return: True when the signal is watched
+        """
+        if signal.status is not Status.init or signal.month != now.month or signal.prev_high is None:
+            self.tick_feed.unwatch(signal.magic)
+            return False
+        # Тик из снимка цикла - тот, с которым сигнал проверялся, более новые тики из буфера проверит опрос
+        tick = self.market.symbol_info_tick(signal.symbol)
+        if not self.tick_feed.watch(
+                signal.magic, signal.symbol, signal.prev_high, signal.prev_low, signal.entry == "PMH",
+                tick.time_msc if tick is not None else None):
+            return False
+        self.scheduler.schedule(TICKS, time.time() + self.tick_interval, keep_earlier=True)
+        return True
 
     def check_signals(self):
         """
         Check signals and calls manage function depends on class type
         :return: None
         """
-        for signal in self.signals:
-            self.manage_signal(signal)
+        self.market.next_cycle()
+        for signal in list(self.signals.values()):
+            self.schedule_signal(signal, self.manage_signal(signal))
+        self.flush_closes()
+        self.flush_opens()
+        self.executions.flush()
+
+    def schedule_signal(
+            self,
+            signal,
+            request: ResponseOpen | ResponseClose | None = None,
+            keep_earlier: bool = False,
+            not_before: float | None = None
+    ):
+        """
+        Put the next check of the signal into the scheduler.
+        A request that didn't change the signal status is retried after timer_seconds
+        :param not_before: unix time before which the signal is not checked again
+        """
+        now = datetime.now()
+        retry = now + timedelta(seconds=self.timer_seconds)
+        failed = (
+            isinstance(request, ResponseOpen) and signal.status is Status.init
+            or isinstance(request, ResponseClose) and signal.status is Status.open
+        )
+        due = retry if failed else signal.next_check_time(now)
+        if due is None:
+            self.scheduler.cancel(signal.magic)
+            if isinstance(signal, SeasonalSignal):
+                self.seasonal.sync(signal)
+            return
+        if due <= now:
+            due = retry
+        if isinstance(signal, BreakoutSignal) and self.tick_feed is not None and self.watch_breakout(signal, now):
+            due = max(due, now + timedelta(seconds=self.breakout_recheck))
+        parked = self.retries.deadline(signal.magic)
+        if parked is not None and parked > due.timestamp():
+            due = datetime.fromtimestamp(parked)
+        if not_before is not None and not_before > due.timestamp():
+            due = datetime.fromtimestamp(not_before)
+        if isinstance(signal, SeasonalSignal):
+            # Сезонные сигналы проверяет SeasonalBook, due удерживает повторы и отложенные сигналы
+            self.seasonal.sync(signal, hold=due.timestamp())
+            self.scheduler.schedule(SEASONAL, due.timestamp(), keep_earlier=True)
+            return
+        self.scheduler.schedule(signal.magic, due.timestamp(), keep_earlier=keep_earlier)
 
 
 
     @connection
     def manage_signal(self, signal):
         """
-        Handle signal data and send request depends on getted signal data
+        Handle signal data and send request depends on getted signal data.
+        The request is executed by the dispatcher in a worker thread,
+        while it is in flight the signal isn't checked again
         :param signal:
-        :return:
+        :return: request passed to the dispatcher
         """
+        if self.dispatcher.pending(signal.magic) or self.retries.is_parked(signal.magic):
+            return None
 
-        request: ResponseOpen | ResponseClose | None = signal.check(
-            terminal=self.terminal
-        )
+        start = time.perf_counter()
+        try:
+            with self.telemetry.phase("evaluate"):
+                request: ResponseOpen | ResponseClose | None = signal.check(
+                    terminal=self.market
+                )
+        except exceptions.SignalNotReadyError as e:
+            self.retries.park(signal.magic, e.delay, e.reason)
+            return None
+        self.retries.release(signal.magic)
         if request is None: return
+        opening = isinstance(request, ResponseOpen)
+        self.executions.decide(
+            signal.magic, request.symbol, type(signal).__name__, close=not opening,
+            buy=request.type == "Long" if opening else signal.direction is not OrderDirection.long,
+            evaluate=time.perf_counter() - start)
+        if opening:
+            self.opens.append((signal, request))
+        else:
+            self.closes.append((signal, request))
+        return request
+
+    def flush_closes(self):
+        """
+        Send the closes of the cycle, one batch per symbol in its dispatcher lane
+        """
+        if not self.closes:
+            return
+        closes, self.closes = self.closes, []
+        batches: dict[str, list[tuple]] = {}
+        for signal, request in self.admit(closes, close=True):
+            batches.setdefault(request.symbol, []).append((signal, request))
+        for symbol, batch in batches.items():
+            self.executions.submitted(signal.magic for signal, _ in batch)
+            self.dispatcher.submit_many(
+                symbol, tuple(signal.magic for signal, _ in batch), self.execute_closes, symbol, batch)
+
+    def execute_closes(self, symbol: str, closes: list[tuple]):
+        """
+        Close the positions of one symbol and update the signals, runs in a dispatcher thread
+        """
+        self.executions.dequeued(signal.magic for signal, _ in closes)
+        with self.telemetry.dispatch():
+            results = self.closer.close_batch(symbol, closes)
+            point = self.point(symbol)
+            for result in results:
+                if result.attempts:
+                    self.executions.add((result.magic,), "send", result.latency)
+                    self.executions.complete(
+                        result.magic, result.retcode or 0, result.ticket, result.requested, result.price, point,
+                        result.retries)
+                else:
+                    # Закрытие не отправлялось: позиции уже нет, цепь открыта или нет цены
+                    self.executions.discard(result.magic)
+            closed = [signal for (signal, _), result in zip(closes, results) if result.closed]
+            for signal in closed:
+                signal.status = Status.close
+            if closed:
+                self.journal.record_many([(signal, None) for signal in closed], "close")
+
+    def flush_opens(self):
+        """
+        Size the open requests of the cycle together against one account snapshot
+        and the caps of RiskEngine, then pass them to the dispatcher.
+        Rejected signals are parked and checked again later
+        """
+        if not self.opens:
+            return
+        opens, self.opens = self.opens, []
+        start = time.perf_counter()
+        with self.telemetry.phase("evaluate"):
+            accepted, rejected = self.risk.size(opens, self.market)
+        self.executions.add((signal.magic for signal, _ in accepted), "sizing", time.perf_counter() - start)
+        for signal, request in self.admit(accepted):
+            self.executions.submitted((signal.magic,))
+            self.dispatcher.submit(request.symbol, signal.magic, self.execute, signal, request)
+        for signal, reason in rejected:
+            self.executions.discard(signal.magic)
+            self.retries.park(signal.magic, 60, reason)
+            self.schedule_signal(signal)
+
+    def admit(self, orders: list[tuple], close: bool = False) -> list[tuple]:
+        """
+        Orders allowed by the circuit breaker and the order rate limit.
+        Signals held by a circuit are parked with backoff, signals over the rate limit
+        are checked again when their token is due, one every 1 / rate seconds
+        :param orders: (signal, request) pairs
+        :param close: the orders close positions, only account-wide circuits hold them and no rate limit
+        """
+        allowed = []
+        limited = 0
+        for signal, request in orders:
+            blocked = self.breaker.blocked(request.symbol, close)
+            if blocked is None and not close:
+                wait = self.breaker.acquire()
+                if wait:
+                    # Ограничение частоты не отказ сервера: без удвоения паузы, ордера пакета разносятся по токенам
+                    due = time.time() + wait + limited / self.breaker.bucket.rate
+                    limited += 1
+                    self.executions.discard(signal.magic)
+                    self.risk.release(signal.magic)
+                    logger.debug(f"Signal [{signal.magic}] over the order rate limit, next check in "
+                                 f"{due - time.time():.2f} s")
+                    self.schedule_signal(signal, not_before=due)
+                    continue
+            if blocked is None:
+                allowed.append((signal, request))
+                continue
+            reason, delay = blocked
+            self.executions.discard(signal.magic)
+            self.risk.release(signal.magic)
+            self.retries.park(signal.magic, delay, reason)
+            self.schedule_signal(signal)
+        return allowed
+
+    def execute(self, signal, request: ResponseOpen):
+        """
+        Send the open request to the server and update the signal, runs in a dispatcher thread
+        """
+        self.executions.dequeued((signal.magic,))
+        with self.telemetry.dispatch():
+            self._execute(signal, request)
+
+    def _execute(self, signal, request: ResponseOpen):
         try:
-            if isinstance(request, ResponseOpen):
-                signal.ticket = self.send_request(request)
-                if signal.ticket is not None:
-                    signal.status = Status.open
-            elif isinstance(request, ResponseClose):
-                if self.terminal.Close(symbol=request.symbol, ticket=request.ticket):
-                    logger.info(f"Order with ticket: {request.ticket} was successfully closed")
-                    signal.status = Status.close
+            self._send_open(signal, request)
+        finally:
+            # Отправленный ордер виден в positions_get, неотправленный больше не занимает лимиты
+            self.risk.release(signal.magic)
+
+    def _send_open(self, signal, request: ResponseOpen):
+        if self.breaker.is_open(request.symbol):
+            # Цепь открылась, пока запрос ждал в очереди, сигнал будет проверен снова
+            logger.debug(f"Request of signal [{signal.magic}] was not sent, circuit of {request.symbol} is open")
+            self.executions.discard(signal.magic)
+            return
+        try:
+            signal.ticket = self.send_request(request)
+            self.breaker.record(request.symbol, mt5.TRADE_RETCODE_DONE)
+            if signal.ticket is not None:
+                signal.status = Status.open
+                self.journal.record(signal, "open")
         except Exception as e:
-
-            if self.last_error != e.status_code:
+            status_code = getattr(e, "status_code", None)
+            self.breaker.record(request.symbol, status_code)
+            self.executions.discard(signal.magic)
+            if status_code is None or self.last_error != status_code:
                 logger.error(e)
-                self.last_error = e.status_code
+                self.last_error = status_code
+
+    def point(self, symbol: str) -> float | None:
+        info = self.market.symbol_info(symbol)
+        return info.point if info is not None else None
 
     def send_request(self, request: ResponseOpen) -> int | None:
-        filling_type = self.get_filling_mode(request.symbol)
+        with self.executions.stage(request.magic, "filling"):
+            filling_type = self.get_filling_mode(request.symbol)
         r = {
             "action": mt5.TRADE_ACTION_DEAL,
             "symbol": request.symbol,
@@ -258,9 +672,22 @@ class Expert:
             "type_time": mt5.ORDER_TIME_GTC,
             "type_filling": filling_type,
         }
-        result: OrderSendResult = self.terminal.order_send(r)
+        retries = 0
+        with self.executions.stage(request.magic, "send"):
+            result: OrderSendResult = self.terminal.order_send(r)
+        if result is not None and result.retcode == mt5.TRADE_RETCODE_INVALID_FILL:
+            with self.executions.stage(request.magic, "filling"):
+                self.filling.invalidate(request.symbol)
+                r["type_filling"] = self.filling.probe(request.symbol)
+            with self.executions.stage(request.magic, "send"):
+                result = self.terminal.order_send(r)
+            retries = 1
         if result is None:
-            logger.critical("Unidentified error, server result is None")
+            self.executions.discard(request.magic)
+            raise exceptions.TerminalDataError("order_send", self.terminal.last_error())
+        self.executions.complete(
+            request.magic, result.retcode, result.order, request.price, result.price,
+            self.point(request.symbol), retries)
         if result.retcode != mt5.TRADE_RETCODE_DONE:
             raise exceptions.ServerStatusError(result.retcode)
         ticket = result.order
@@ -0,0 +1,311 @@
+"""
+Stand-in for the Windows-only MetaTrader5 package.
+
+Implements the part of the API used by the expert with synthetic market data
+and a configurable latency for every call, so the expert can be benchmarked
+and replayed on Linux. Install it before importing the expert:
+
+    import fake_mt5
+    terminal = fake_mt5.install(latency=0.0002)
+    from expert import Expert
+"""
+import math
+import sys
+import time
+import types
+import zlib
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+TIMEFRAME_D1 = 16408
+TIMEFRAME_MN1 = 49153
+TIMEFRAME_M1 = 1
+TRADE_ACTION_DEAL = 1
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+ORDER_TIME_GTC = 0
+POSITION_TYPE_BUY = 0
+POSITION_TYPE_SELL = 1
+COPY_TICKS_ALL = -1
+COPY_TICKS_INFO = 1
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_PRICE_CHANGED = 10020
+TRADE_RETCODE_PRICE_OFF = 10021
+TRADE_RETCODE_INVALID_FILL = 10030
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+TICKS_DTYPE = np.dtype([
+    ("time", "<i8"), ("bid", "<f8"), ("ask", "<f8"), ("last", "<f8"), ("volume", "<u8"),
+    ("time_msc", "<i8"), ("flags", "<u4"), ("volume_real", "<f8"),
+])
+
+TerminalInfo = namedtuple("TerminalInfo", "connected trade_allowed name")
+AccountInfo = namedtuple("AccountInfo", "login balance equity margin_free currency server company")
+SymbolInfo = namedtuple(
+    "SymbolInfo",
+    "name select visible digits point bid ask spread volume_min volume_max volume_step "
+    "trade_tick_value trade_tick_size filling_mode"
+)
+Tick = namedtuple("Tick", "time bid ask last volume time_msc flags volume_real")
+OrderCheckResult = namedtuple("OrderCheckResult", "retcode balance equity margin comment request")
+OrderSendResult = namedtuple(
+    "OrderSendResult", "retcode deal order volume price bid ask comment request_id request")
+TradePosition = namedtuple(
+    "TradePosition", "ticket time type magic identifier volume price_open sl tp price_current symbol comment")
+TradeDeal = namedtuple("TradeDeal", "ticket order time type entry magic position_id volume price symbol comment")
+TYPES = (TerminalInfo, AccountInfo, SymbolInfo, Tick, OrderCheckResult, OrderSendResult, TradePosition, TradeDeal)
+
+
+class FakeTerminal:
+    """
+    Synthetic terminal. Prices of every symbol follow a deterministic wave
+    around a base price derived from the symbol name, D1 bars exist on weekdays.
+    """
+
+    def __init__(
+            self,
+            latency: float | dict = 0.0,
+            equity: float = 100_000,
+            server: str = "Fake-Server",
+            filling_mode: int = ORDER_FILLING_FOK
+    ):
+        """
+        :param latency: seconds added to every call, or a dict of seconds by function name
+        :param equity: account equity
+        :param server: broker server name reported in account_info()
+        :param filling_mode: the only filling mode accepted by order_check()/order_send()
+        """
+        self.latency = latency
+        self.equity = equity
+        self.server = server
+        self.filling_mode = filling_mode
+        self.calls: Counter = Counter()
+        self.connected = False
+        self.selected: set[str] = set()
+        self.positions: dict[int, TradePosition] = {}
+        self.deals: list[TradeDeal] = []
+        self.retcodes: list[int] = []
+        self._ticket = 1_000_000
+
+    def _call(self, name: str):
+        self.calls[name] += 1
+        latency = self.latency.get(name, 0) if isinstance(self.latency, dict) else self.latency
+        if latency:
+            time.sleep(latency)
+
+    # -- market data --
+
+    @staticmethod
+    def base_price(symbol: str) -> float:
+        return 1 + zlib.crc32(symbol.encode()) % 2000 / 100
+
+    @staticmethod
+    def digits(symbol: str) -> int:
+        return 5 if FakeTerminal.base_price(symbol) < 10 else 3
+
+    def prices(self, symbol: str, timestamps):
+        """
+        Bid prices at the given unix times, works with scalars and arrays
+        """
+        base = self.base_price(symbol)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        wave = 1 + 0.01 * np.sin(timestamps / 3600) + 0.002 * np.sin(timestamps / 60)
+        return np.round(base * wave, self.digits(symbol))
+
+    def price(self, symbol: str, timestamp: float) -> float:
+        return float(self.prices(symbol, timestamp))
+
+    def spread(self, symbol: str) -> float:
+        return 10 * 10 ** -self.digits(symbol)
+
+    def initialize(self, path: str | None = None, **kwargs) -> bool:
+        self._call("initialize")
+        self.connected = True
+        return True
+
+    def shutdown(self):
+        self._call("shutdown")
+        self.connected = False
+
+    def last_error(self):
+        self._call("last_error")
+        return (1, "Success")
+
+    def terminal_info(self):
+        self._call("terminal_info")
+        return TerminalInfo(True, True, "Fake terminal") if self.connected else None
+
+    def account_info(self):
+        self._call("account_info")
+        return AccountInfo(1, self.equity, self.equity, self.equity, "USD", self.server, "Fake broker")
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        self._call("symbol_select")
+        self.selected.add(symbol)
+        return True
+
+    def symbol_info(self, symbol: str):
+        self._call("symbol_info")
+        price = self.price(symbol, time.time())
+        digits = self.digits(symbol)
+        point = 10 ** -digits
+        return SymbolInfo(
+            symbol, symbol in self.selected, True, digits, point,
+            price, round(price + self.spread(symbol), digits), 10,
+            0.01, 100.0, 0.01, 1.0, point, self.filling_mode + 1
+        )
+
+    def symbol_info_tick(self, symbol: str):
+        self._call("symbol_info_tick")
+        now = time.time()
+        price = self.price(symbol, now)
+        return Tick(int(now), price, price + self.spread(symbol), 0.0, 0, int(now * 1000), 6, 0.0)
+
+    def copy_rates_range(self, symbol: str, timeframe: int, date_from: datetime, date_to: datetime):
+        self._call("copy_rates_range")
+        if timeframe == TIMEFRAME_MN1:
+            months = []
+            month = date_from.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            if month < date_from:
+                month = (month + timedelta(days=32)).replace(day=1)
+            while month <= date_to:
+                months.append(int(month.timestamp()))
+                month = (month + timedelta(days=32)).replace(day=1)
+            return self._bars(symbol, np.array(months, dtype=np.int64), 86400 * 30)
+        start = int(date_from.timestamp()) // 86400 * 86400
+        if start < date_from.timestamp():
+            start += 86400
+        days = np.arange(start, int(date_to.timestamp()) + 1, 86400, dtype=np.int64)
+        # 1970-01-01 was Thursday
+        days = days[(days // 86400 + 3) % 7 < 5]
+        return self._bars(symbol, days, 86400)
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        self._call("copy_rates_from_pos")
+        now = datetime.now()
+        months = []
+        month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        for _ in range(start_pos + count):
+            months.append(int(month.timestamp()))
+            month = (month - timedelta(days=1)).replace(day=1)
+        times = np.array(months[start_pos:start_pos + count][::-1], dtype=np.int64)
+        return self._bars(symbol, times, 86400 * 30)
+
+    def copy_ticks_from(self, symbol: str, date_from, count: int, flags: int):
+        self._call("copy_ticks_from")
+        start = date_from.timestamp() if isinstance(date_from, datetime) else float(date_from)
+        end = time.time()
+        times = np.arange(math.floor(start) + 1, end, 1.0)[:count]
+        ticks = np.zeros(len(times), dtype=TICKS_DTYPE)
+        ticks["time"] = times
+        ticks["time_msc"] = times * 1000
+        ticks["bid"] = self.prices(symbol, times)
+        ticks["ask"] = ticks["bid"] + self.spread(symbol)
+        return ticks
+
+    def _bars(self, symbol: str, times: np.ndarray, period: int):
+        rates = np.zeros(len(times), dtype=RATES_DTYPE)
+        rates["time"] = times
+        rates["open"] = self.prices(symbol, times)
+        rates["close"] = self.prices(symbol, times + period)
+        spread = self.base_price(symbol) * 0.005
+        rates["high"] = np.maximum(rates["open"], rates["close"]) + spread
+        rates["low"] = np.minimum(rates["open"], rates["close"]) - spread
+        rates["tick_volume"] = 1000
+        return rates
+
+    # -- trading --
+
+    def positions_get(self, symbol: str | None = None, ticket: int | None = None, **kwargs):
+        self._call("positions_get")
+        return tuple(
+            position for position in self.positions.values()
+            if (symbol is None or position.symbol == symbol) and (ticket is None or position.ticket == ticket)
+        )
+
+    def history_deals_get(self, date_from, date_to, **kwargs):
+        self._call("history_deals_get")
+        return tuple(self.deals)
+
+    def order_check(self, request: dict):
+        self._call("order_check")
+        if request.get("type_filling") != self.filling_mode:
+            return OrderCheckResult(TRADE_RETCODE_INVALID_FILL, 0, 0, 0, "Unsupported filling mode", request)
+        return OrderCheckResult(0, self.equity, self.equity, 0, "Done", request)
+
+    def order_send(self, request: dict):
+        self._call("order_send")
+        retcode = self.retcodes.pop(0) if self.retcodes else TRADE_RETCODE_DONE
+        if request.get("type_filling", self.filling_mode) != self.filling_mode:
+            retcode = TRADE_RETCODE_INVALID_FILL
+        symbol = request["symbol"]
+        price = request.get("price") or self.price(symbol, time.time())
+        if retcode != TRADE_RETCODE_DONE:
+            return OrderSendResult(retcode, 0, 0, 0, 0, 0, 0, "Rejected", 0, request)
+
+        self._ticket += 1
+        ticket = self._ticket
+        closing = self.positions.pop(request.get("position"), None)
+        if closing is None:
+            self.positions[ticket] = TradePosition(
+                ticket, int(time.time()), request["type"], request.get("magic", 0), ticket,
+                request["volume"], price, request.get("sl", 0), request.get("tp", 0), price,
+                symbol, request.get("comment", "")
+            )
+        self.deals.append(TradeDeal(
+            ticket, ticket, int(time.time()), request["type"], int(closing is not None),
+            request.get("magic", 0) if closing is None else closing.magic,
+            ticket if closing is None else closing.ticket, request["volume"], price, symbol, ""
+        ))
+        return OrderSendResult(retcode, ticket, ticket, request["volume"], price, price, price, "Request executed", 0, request)
+
+    def Close(self, symbol: str, *, ticket: int | None = None, **kwargs) -> bool:
+        self._call("Close")
+        position = self.positions.get(ticket)
+        if position is None:
+            return False
+        result = self.order_send({
+            "action": TRADE_ACTION_DEAL,
+            "symbol": symbol,
+            "volume": position.volume,
+            "type": ORDER_TYPE_SELL if position.type == ORDER_TYPE_BUY else ORDER_TYPE_BUY,
+            "position": ticket,
+            "type_filling": self.filling_mode,
+        })
+        return result.retcode == TRADE_RETCODE_DONE
+
+
+def module(terminal: FakeTerminal) -> types.ModuleType:
+    """
+    Build a module object with the MetaTrader5 API bound to the terminal
+    """
+    fake = types.ModuleType("MetaTrader5")
+    for name, value in globals().items():
+        if name.isupper() and isinstance(value, int):
+            setattr(fake, name, value)
+    for value in TYPES:
+        setattr(fake, value.__name__, value)
+    for name in dir(terminal):
+        if not name.startswith("_") and callable(getattr(terminal, name)):
+            setattr(fake, name, getattr(terminal, name))
+    fake.fake_terminal = terminal
+    return fake
+
+
+def install(**kwargs) -> FakeTerminal:
+    """
+    Create a FakeTerminal and register it as the MetaTrader5 module
+    """
+    terminal = FakeTerminal(**kwargs)
+    sys.modules["MetaTrader5"] = module(terminal)
+    return terminal
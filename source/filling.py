@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from utils.file_lock import file_lock
+from utils.logger_config import logger
+
+CACHE_FILE = Path(__file__).parent.parent / "cache" / "filling_modes.json"
+
+
+class FillingModeCache:
+    """
+    Filling mode of every symbol found with order_check(), stored per broker
+    server in a json file so it survives restarts.
+
+    The MetaTrader5 library doesn't find the filling mode correctly for a lot of
+    brokers, so the mode is probed once and reused until the server rejects an
+    order with TRADE_RETCODE_INVALID_FILL.
+
+    The file is shared by the expert processes of the supervisor: every change
+    is merged into the current content of the file under a file lock.
+    """
+    # ORDER_FILLING_FOK, ORDER_FILLING_IOC
+    candidates = (0, 1)
+
+    def __init__(self, terminal, path: Path = CACHE_FILE):
+        """
+        :param terminal: MetaTrader5 module or MarketSnapshot
+        :param path: json file with cached modes
+        """
+        self.terminal = terminal
+        self.path = path
+        self.modes: dict[str, dict[str, int]] = self.load()
+        # Orders of different symbols are sent from several threads
+        self.lock = threading.Lock()
+
+    def load(self) -> dict:
+        try:
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Filling mode cache {self.path} can't be read: {e}")
+            return {}
+
+    def store(self, symbol: str, mode: int | None) -> bool:
+        """
+        Set (or remove with None) the mode of the symbol for the current broker and
+        write it into the file together with the modes saved by other processes
+        :return: False when there was nothing to remove
+        """
+        broker = self.broker()
+        with self.lock:
+            if mode is None and symbol not in self.modes.get(broker, {}):
+                return False
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.path.with_suffix(".lock")):
+                modes = self.load()
+                if mode is None:
+                    modes.get(broker, {}).pop(symbol, None)
+                else:
+                    modes.setdefault(broker, {})[symbol] = mode
+                # Имя временного файла своё у каждого процесса и потока
+                tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps(modes, indent=2, sort_keys=True))
+                os.replace(tmp, self.path)
+            self.modes = modes
+        return True
+
+    def broker(self) -> str:
+        account_info = self.terminal.account_info()
+        return account_info.server if account_info is not None else ""
+
+    def get(self, symbol: str) -> int:
+        mode = self.modes.get(self.broker(), {}).get(symbol)
+        if mode is None:
+            mode = self.probe(symbol)
+        return mode
+
+    def probe(self, symbol: str) -> int:
+        """
+        Check candidate modes with order_check() and remember the first accepted one.
+        When no mode is accepted (market closed, no quotes) the last candidate is
+        returned without caching it
+        """
+        symbol_info = self.terminal.symbol_info(symbol)
+        tick = self.terminal.symbol_info_tick(symbol)
+        mode = self.candidates[-1]
+        if symbol_info is None or tick is None:
+            return mode
+
+        for mode in self.candidates:
+            request = {
+                "action": self.terminal.TRADE_ACTION_DEAL,
+                "symbol": symbol,
+                "volume": symbol_info.volume_min,
+                "type": self.terminal.ORDER_TYPE_BUY,
+                "price": tick.ask,
+                "type_filling": mode,
+                "type_time": self.terminal.ORDER_TIME_GTC}
+
+            result = self.terminal.order_check(request)
+
+            if result is not None and result.comment == "Done":
+                self.store(symbol, mode)
+                logger.info(f"Filling mode of {symbol} is {mode}")
+                return mode
+
+        return mode
+
+    def invalidate(self, symbol: str):
+        if self.store(symbol, None):
+            logger.warning(f"Filling mode of {symbol} was rejected by the server and will be probed again")
+
+    def warm(self, symbols):
+        """
+        Probe every symbol that isn't cached yet
+        """
+        cached = self.modes.get(self.broker(), {})
+        for symbol in symbols:
+            if symbol not in cached:
+                self.probe(symbol)
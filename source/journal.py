@@ -0,0 +1,212 @@
+"""
+Crash-safe journal of signal state.
+
+Status and ticket of the signals live only in memory, so after a restart the
+expert had to rediscover them from open positions and a year of deal history.
+The journal keeps the last state of every signal in a SQLite database in WAL
+mode and logs every status transition and ticket assignment. On startup the
+state is read with one query and only verified against open positions.
+"""
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from signals import BreakoutSignal, SeasonalSignal, Status
+from utils.logger_config import logger
+
+JOURNAL_DIR = Path(__file__).parent.parent / "cache" / "journal"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    magic INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    row TEXT NOT NULL DEFAULT '',
+    status INTEGER NOT NULL,
+    ticket INTEGER,
+    counter INTEGER NOT NULL DEFAULT 0,
+    signal_time REAL,
+    prev_high REAL,
+    prev_low REAL,
+    open_time REAL,
+    close_time REAL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transitions (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    magic INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    ticket INTEGER,
+    reason TEXT NOT NULL
+);
+"""
+
+UPSERT = """
+INSERT INTO state (magic, symbol, row, status, ticket, counter, signal_time, prev_high, prev_low,
+                   open_time, close_time, updated)
+VALUES (?, ?, COALESCE(?, ''), ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (magic) DO UPDATE SET
+    symbol = excluded.symbol,
+    row = COALESCE(?, state.row),
+    status = excluded.status,
+    ticket = excluded.ticket,
+    counter = excluded.counter,
+    signal_time = excluded.signal_time,
+    prev_high = excluded.prev_high,
+    prev_low = excluded.prev_low,
+    open_time = excluded.open_time,
+    close_time = excluded.close_time,
+    updated = excluded.updated
+"""
+
+
+def _timestamp(value: datetime | None) -> float | None:
+    return value.timestamp() if value is not None else None
+
+
+def _datetime(value: float | None) -> datetime | None:
+    return datetime.fromtimestamp(value) if value is not None else None
+
+
+class SignalState(BaseModel):
+    magic: int
+    symbol: str
+    # Строка csv, из которой сигнал был создан
+    row: str = ""
+    status: Status
+    ticket: int | None = None
+    counter: int = 0
+    signal_time: datetime | None = None
+    prev_high: float | None = None
+    prev_low: float | None = None
+    open_time: datetime | None = None
+    close_time: datetime | None = None
+
+    def apply(self, signal, same_row: bool):
+        """
+        Restore the state into a freshly created signal
+        :param same_row: the csv row didn't change since the state was written,
+                         only then the computed open and close times are restored
+        """
+        signal.status = self.status
+        signal.ticket = self.ticket
+        signal.counter = self.counter
+        if isinstance(signal, BreakoutSignal):
+            signal.signal_time = self.signal_time
+            signal.prev_high = self.prev_high
+            signal.prev_low = self.prev_low
+        # Закрытие открытого сезонного сигнала не переносится на следующий год после простоя
+        if isinstance(signal, SeasonalSignal) and same_row and self.status is Status.open:
+            signal.open_time_d = self.open_time or signal.open_time_d
+            signal.close_time_d = self.close_time or signal.close_time_d
+
+
+class StateJournal:
+    """
+    Last state of every signal and the log of its transitions in one SQLite file.
+
+    Requests are executed in dispatcher threads, so the connection is shared
+    under a lock. Transitions are rare and every write is one transaction
+    synchronised to disk, a crash loses nothing that was committed.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: database file, created with its directory when missing
+        """
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def load(self) -> dict[int, SignalState]:
+        start = time.perf_counter()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT magic, symbol, row, status, ticket, counter, signal_time, prev_high, prev_low, "
+                "open_time, close_time FROM state").fetchall()
+        states = {}
+        for (magic, symbol, row, status, ticket, counter, signal_time, prev_high, prev_low,
+             open_time, close_time) in rows:
+            # Значения из своей же базы не валидируются повторно
+            states[magic] = SignalState.model_construct(
+                magic=magic, symbol=symbol, row=row, status=Status(status), ticket=ticket, counter=counter,
+                signal_time=_datetime(signal_time), prev_high=prev_high, prev_low=prev_low,
+                open_time=_datetime(open_time), close_time=_datetime(close_time),
+            )
+        logger.info(
+            f"State journal {self.path.name}: {len(states)} signals restored "
+            f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return states
+
+    def record(self, signal, reason: str | None = None, row: str | None = None):
+        """
+        Write the state of one signal
+        :param reason: transition name (open, close ...), None writes the state without a log entry
+        :param row: csv row of the signal, None keeps the stored one
+        """
+        self.record_many([(signal, row)], reason)
+
+    def record_many(self, signals: list[tuple], reason: str | None = None):
+        """
+        Write the state of several signals in one transaction
+        :param signals: (signal, csv row or None) pairs
+        """
+        now = time.time()
+        values = []
+        transitions = []
+        for signal, row in signals:
+            breakout = isinstance(signal, BreakoutSignal)
+            seasonal = isinstance(signal, SeasonalSignal)
+            status = signal.status.value
+            values.append((
+                signal.magic, signal.symbol, row, status, signal.ticket, signal.counter,
+                _timestamp(signal.signal_time) if breakout else None,
+                signal.prev_high if breakout else None,
+                signal.prev_low if breakout else None,
+                _timestamp(signal.open_time_d) if seasonal else None,
+                _timestamp(signal.close_time_d) if seasonal else None,
+                now, row,
+            ))
+            if reason is not None:
+                transitions.append((now, signal.magic, status, signal.ticket, reason))
+        with self.lock:
+            try:
+                self.connection.execute("BEGIN")
+                self.connection.executemany(UPSERT, values)
+                if transitions:
+                    self.connection.executemany(
+                        "INSERT INTO transitions (time, magic, status, ticket, reason) VALUES (?, ?, ?, ?, ?)",
+                        transitions)
+                self.connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self.connection.in_transaction:
+                    self.connection.execute("ROLLBACK")
+                logger.error(f"State journal {self.path.name} write failed: {e}")
+
+    def forget(self, magic: int):
+        """
+        Drop the state of a signal removed from the csv file, its transitions are kept
+        """
+        with self.lock:
+            try:
+                self.connection.execute("DELETE FROM state WHERE magic = ?", (magic,))
+            except sqlite3.Error as e:
+                logger.error(f"State journal {self.path.name} write failed: {e}")
+
+    def transitions(self, magic: int) -> list[tuple]:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT time, status, ticket, reason FROM transitions WHERE magic = ? ORDER BY id",
+                (magic,)).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,269 @@
+"""
+Bulk loader of signal csv files.
+
+The whole file is split with csv.reader in one pass, then every column is
+converted and validated at once. All bad rows are collected into one report.
+Entry/exit dates and times are parsed here into (month, day), (hour, minute)
+and trading day counts, so the signals never touch the raw strings again.
+"""
+import csv
+import io
+from itertools import compress, repeat
+from typing import Callable
+
+from pydantic import BaseModel
+
+from signals import (
+    BaseSignal, BreakoutSignal, OrderDirection, SeasonalSignal, ShortTermSignal, StoplossType,
+    parse_days, parse_hour_min, parse_month_day, signal_type,
+)
+
+COLUMNS = (
+    "Magic Number", "Month", "Symbol", "Entry", "TP", "SL", "SL Type", "Risk",
+    "Direction", "Type", "Open Time", "Close Time",
+)
+# Максимальное число дней в месяце, 29 февраля допустимо
+MONTH_DAYS = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+# Значение ячейки, которую не удалось разобрать
+INVALID = object()
+
+
+class RowError(BaseModel):
+    line: int
+    magic: str = ""
+    column: str
+    value: str = ""
+    message: str
+
+    def __str__(self):
+        return f"line {self.line} [{self.magic}] {self.column}={self.value!r}: {self.message}"
+
+
+def _decimal(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def _month(value: str) -> int:
+    month = int(value)
+    if not 1 <= month <= 12:
+        raise ValueError(value)
+    return month
+
+
+def _month_day(value: str) -> tuple[int, int]:
+    month, day = parse_month_day(value)
+    if not 1 <= month <= 12 or not 1 <= day <= MONTH_DAYS[month]:
+        raise ValueError(value)
+    return month, day
+
+
+def _hour_min(value: str) -> tuple[int, int]:
+    hour, minute = parse_hour_min(value)
+    if not 0 <= hour < 24 or not 0 <= minute < 60:
+        raise ValueError(value)
+    return hour, minute
+
+
+class SignalBatch:
+    """
+    Parsed and validated rows of one signal file, stored as columns
+    """
+
+    def __init__(self, header: list[str], rows: list[list[str]], lines: list[int]):
+        self.header = header
+        self.lines = lines
+        self.rows = rows
+        self.errors: list[RowError] = []
+        self.valid = [True] * len(rows)
+        self.magic: list[int | None] = [None] * len(rows)
+        self.kinds: list[type[BaseSignal]] = []
+        # Magic numbers строк с неверным числом полей
+        self.partial: set[int] = set()
+
+        missing = [column for column in COLUMNS if column not in header]
+        if missing:
+            self.valid = [False] * len(rows)
+            self.errors.append(RowError(line=1, column=", ".join(missing), message="missing columns"))
+            return
+
+        table = list(zip(*rows)) if rows else [()] * len(header)
+        self.columns = {name: table[header.index(name)] for name in COLUMNS}
+
+        self.magic = self._parse("Magic Number", int, None, "not an integer")
+        if len(set(self.magic)) < len(self.magic):
+            seen = set()
+            duplicate = []
+            for magic in self.magic:
+                duplicate.append(magic is not None and magic in seen)
+                seen.add(magic)
+            self._reject(duplicate, "Magic Number", "duplicate magic number")
+        if "" in self.columns["Symbol"]:
+            self._reject([not symbol for symbol in self.columns["Symbol"]], "Symbol", "empty symbol")
+        self.month = self._parse("Month", _month, None, "not a month number")
+        self.sl = self._parse("SL", _decimal, None, "not a number")
+        self.risk = self._parse("Risk", _decimal, None, "not a number")
+
+        self.kinds = [signal_type(name) for name in self.columns["Type"]]
+        seasonal = [kind is SeasonalSignal for kind in self.kinds]
+        short_term = [kind is ShortTermSignal for kind in self.kinds]
+        by_days = [kind is not SeasonalSignal for kind in self.kinds]
+
+        # Сезонные сигналы: даты "dd.mm"
+        self.entry_md = self._parse("Entry", _month_day, seasonal, "expected a dd.mm date")
+        self.tp_md = self._parse("TP", _month_day, seasonal, "expected a dd.mm date")
+        # Краткосрочные и пробойные: число торговых дней "5 TDOM" / "5 TD"
+        self.start_day = self._parse("Entry", parse_days, short_term, "expected a trading day count")
+        self.end_day = self._parse("TP", parse_days, by_days, "expected a trading day count")
+        # Время "hh:mm" обязательно для сезонных и краткосрочных сигналов, у пробойных может быть пустым
+        timed = [a or b for a, b in zip(seasonal, short_term)]
+        self.open_hm = self._parse("Open Time", _hour_min, timed, "expected a hh:mm time", optional=True)
+        self.close_hm = self._parse("Close Time", _hour_min, timed, "expected a hh:mm time", optional=True)
+
+    @classmethod
+    def parse(cls, content: bytes | str) -> "SignalBatch":
+        """
+        Parse the whole file
+        """
+        if isinstance(content, bytes):
+            content = content.decode("utf-8-sig", errors="replace")
+        reader = csv.reader(io.StringIO(content, newline=""), delimiter=";")
+        header = next(reader, [])
+        if '"' not in content:
+            # Без кавычек каждая строка файла - одна запись
+            rows = list(reader)
+            lines = list(range(2, len(rows) + 2))
+        else:
+            rows, lines = [], []
+            for row in reader:
+                rows.append(row)
+                lines.append(reader.line_num)
+        bad = []
+        if any(len(row) != len(header) for row in rows):
+            good = [i for i, row in enumerate(rows) if len(row) == len(header)]
+            bad = [(lines[i], rows[i]) for i, row in enumerate(rows) if row and len(row) != len(header)]
+            rows = [rows[i] for i in good]
+            lines = [lines[i] for i in good]
+        batch = cls(header, rows, lines)
+        for line, row in bad:
+            if row[0].strip().isdigit():
+                batch.partial.add(int(row[0]))
+            batch.errors.append(RowError(
+                line=line, magic=row[0], column="row",
+                value=";".join(row), message=f"{len(row)} fields instead of {len(header)}"))
+        batch.errors.sort(key=lambda error: error.line)
+        return batch
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _reject(self, bad: list[bool], column: str, message: str):
+        """
+        Mark rows as invalid and remember the errors
+        """
+        if not any(bad):
+            return
+        magic = self.columns["Magic Number"]
+        values = self.columns[column]
+        for i, is_bad in enumerate(bad):
+            if is_bad:
+                self.valid[i] = False
+                self.errors.append(RowError(
+                    line=self.lines[i], magic=magic[i], column=column, value=values[i], message=message))
+
+    def _parse(
+            self,
+            column: str,
+            parse: Callable,
+            required: list[bool] | None,
+            message: str,
+            optional: bool = False
+    ) -> list:
+        """
+        Convert the cells of the column where ``required`` is set (everywhere when None),
+        bad cells become None. With ``optional`` empty cells are allowed and filled cells
+        of the other rows are checked too.
+        Every distinct value is parsed once: dates, times and months repeat a lot
+        """
+        values = self.columns[column]
+        checked = values if required is None or optional else compress(values, required)
+        known = {}
+        for value in set(checked):
+            if optional and not value:
+                known[value] = None
+                continue
+            try:
+                known[value] = parse(value)
+            except (ValueError, IndexError):
+                known[value] = INVALID
+        if required is None or optional:
+            parsed = [known[value] for value in values]
+        else:
+            parsed = [known[value] if need else None for need, value in zip(required, values)]
+
+        invalid = INVALID in known.values()
+        empty = optional and "" in set(compress(values, required))
+        if not invalid and not empty:
+            return parsed
+        # Обязательное время не может быть пустым
+        self._reject(
+            [result is INVALID or empty and need and not value
+             for result, need, value in zip(parsed, required or repeat(True), values)],
+            column, message)
+        return [None if result is INVALID else result for result in parsed]
+
+    def indices(self) -> list[int]:
+        """
+        Row numbers of valid rows
+        """
+        return [i for i, valid in enumerate(self.valid) if valid]
+
+    def seen(self) -> set[int]:
+        """
+        Magic numbers present in the file, including rows that failed validation
+        """
+        return {magic for magic in self.magic if magic is not None} | self.partial
+
+    def invalid(self) -> set[int]:
+        """
+        Magic numbers that have no valid row, a rejected duplicate of a valid row doesn't count
+        """
+        accepted = set(compress(self.magic, self.valid))
+        return {magic for magic, valid in zip(self.magic, self.valid)
+                if magic is not None and not valid and magic not in accepted}
+
+    def fields(self, i: int) -> dict:
+        """
+        Signal fields of the valid row ``i``, the same as signals.signal_fields() returns
+        """
+        column = self.columns
+        kind = self.kinds[i]
+        fields = dict(
+            magic=self.magic[i],
+            month=self.month[i],
+            symbol=column["Symbol"][i],
+            entry=column["Entry"][i],
+            tp=column["TP"][i],
+            sl=self.sl[i],
+            sl_type=StoplossType.percentage if column["SL Type"][i] == "Percentage" else StoplossType.points,
+            risk=self.risk[i],
+            direction=OrderDirection.long if column["Direction"][i] == "Long" else OrderDirection.short,
+            open_time=column["Open Time"][i] or None,
+            close_time=column["Close Time"][i] or None,
+            open_hm=self.open_hm[i],
+            close_hm=self.close_hm[i],
+        )
+        if kind is SeasonalSignal:
+            fields["entry_md"] = self.entry_md[i]
+            fields["tp_md"] = self.tp_md[i]
+        elif kind is ShortTermSignal:
+            fields["start_day"] = self.start_day[i]
+            fields["end_day"] = self.end_day[i]
+        else:
+            fields["end_day"] = self.end_day[i]
+        return fields
+
+    def report(self, limit: int = 50) -> str:
+        lines = [str(error) for error in self.errors[:limit]]
+        if len(self.errors) > limit:
+            lines.append(f"... and {len(self.errors) - limit} more")
+        return "\n".join(lines)
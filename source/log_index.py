@@ -0,0 +1,405 @@
+"""
+Index of the project logs by magic number, ticket and date.
+
+Reads every log file in the logs directory: the active project.log, files
+rotated by TimedRotatingFileHandler (project.log.2024-06-12) and gzipped ones,
+line by line in constant memory. Records of several lines (order params) are
+joined, text and JSON (LOG_FORMAT=json) records are both understood. Records
+that mention a magic number or a ticket go into a SQLite index with the parsed
+price, volume and send latency. Files are identified by their first line, so
+a rotated or compressed file isn't read again and the active file is read only
+from where the previous run stopped.
+
+    python log_index.py update
+    python log_index.py query --magic 149 --since 2024-06-01
+    python log_index.py query --ticket 1176257694
+    python log_index.py trades --magic 149
+"""
+import argparse
+import ast
+import gzip
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+INDEX_FILE = Path(__file__).parent.parent / "cache" / "log_index.sqlite"
+LOG_DIR = Path("logs")
+# Записи вставляются пачками, память не зависит от размера логов
+CHUNK = 5000
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Запись диспетчера о времени отправки ищется в этом интервале после открытия
+SEND_WINDOW = timedelta(seconds=60)
+
+RECORD = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\] [\w.]+: ?(.*)$", re.DOTALL)
+OPEN = re.compile(r"Order was successfully send with ticket (?P<ticket>\d+)\. Order params:\s*(?P<params>\{.*\})",
+                  re.DOTALL)
+# (вид события, шаблон), проверяются по порядку, первый совпавший определяет вид
+PATTERNS = [(kind, re.compile(pattern)) for kind, pattern in (
+    ("dispatch", r"Request of signal \[(?P<magics>[\d, ]+)\] on (?P<symbol>\S+): "
+                 r"queue wait [\d.]+ ms, sent in (?P<latency>[\d.]+) ms"),
+    ("close", r"Position (?P<ticket>\d+) of signal \[(?P<magic>\d+)\] was closed at (?P<price>[\d.e-]+|None) "
+              r"in (?P<latency>[\d.]+) ms, retries: (?P<retries>\d+)"),
+    ("close", r"Order with ticket: (?P<ticket>\d+) was successfully closed"),
+    ("gone", r"Position (?P<ticket>\d+) of signal (?:with magic )?\[(?P<magic>\d+)\] "
+             r"(?:is already closed|was closed while the expert was stopped)"),
+    ("close_failed", r"Position (?P<ticket>\d+) (?:of signal \[(?P<magic>\d+)\] )?was not closed"),
+    ("parked", r"Signal \[(?P<magic>\d+)\] parked for"),
+    ("reduced", r"Signal \[(?P<magic>\d+)\] volume reduced from [\d.]+ to (?P<volume>[\d.]+)"),
+    ("removed", r"Signal with magic \[(?P<magic>\d+)\] was removed"),
+)]
+MAGICS = re.compile(r"\[(\d+(?:, \d+)*)\]")
+TICKET = re.compile(r"ticket:? (\d+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    fingerprint TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL DEFAULT 0,
+    mtime_ns INTEGER NOT NULL DEFAULT 0,
+    -- начало последней прочитанной записи, с него продолжается чтение растущего файла
+    offset INTEGER NOT NULL DEFAULT 0,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS events (
+    file INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    time TEXT NOT NULL,
+    level TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    magic INTEGER,
+    ticket INTEGER,
+    symbol TEXT,
+    price REAL,
+    volume REAL,
+    latency_ms REAL,
+    retries INTEGER,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_magic ON events (magic, time);
+CREATE INDEX IF NOT EXISTS events_ticket ON events (ticket, time);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_file ON events (file, offset);
+"""
+COLUMNS = ("time", "level", "kind", "magic", "ticket", "symbol", "price", "volume", "latency_ms", "retries", "message")
+
+
+def open_log(path: Path):
+    return gzip.open(path, "rb") if path.suffix == ".gz" else open(path, "rb")
+
+
+def fingerprint(path: Path) -> str | None:
+    """
+    Hash of the first line, the same for a file after rotation and compression.
+    None while the file has no complete line
+    """
+    with open_log(path) as file:
+        line = file.readline()
+    if not line.endswith(b"\n"):
+        return None
+    return hashlib.blake2b(line, digest_size=12).hexdigest()
+
+
+def records(file, offset: int = 0):
+    """
+    Log records of a binary stream starting at ``offset``
+    :return: iterator of (offset of the record, time, level, message)
+    """
+    current = None
+    for line in file:
+        start = offset
+        offset += len(line)
+        text = line.decode("utf-8", errors="replace").rstrip("\r\n")
+        if text.startswith("{"):
+            try:
+                entry = json.loads(text)
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict) and "message" in entry:
+                if current is not None:
+                    yield current
+                    current = None
+                yield start, entry.get("time", ""), entry.get("level", ""), entry["message"]
+                continue
+        match = RECORD.match(text)
+        if match is not None:
+            if current is not None:
+                yield current
+            current = (start, match.group(1), match.group(2), match.group(3))
+        elif current is not None:
+            # Продолжение многострочной записи
+            current = (*current[:3], f"{current[3]}\n{text}")
+    if current is not None:
+        yield current
+
+
+def number(value: str | None) -> float | None:
+    try:
+        return float(value) if value not in (None, "None") else None
+    except ValueError:
+        return None
+
+
+def parse_events(message: str) -> list[dict]:
+    """
+    Events of one record, one per magic number it mentions; empty when it mentions neither magic nor ticket
+    """
+    match = OPEN.search(message)
+    if match is not None:
+        try:
+            params = ast.literal_eval(match.group("params"))
+        except (ValueError, SyntaxError):
+            params = {}
+        return [{
+            "kind": "open", "ticket": int(match.group("ticket")), "magic": params.get("magic"),
+            "symbol": params.get("symbol"), "price": params.get("price"), "volume": params.get("volume"),
+        }]
+    for kind, pattern in PATTERNS:
+        match = pattern.search(message)
+        if match is None:
+            continue
+        fields = match.groupdict()
+        event = {
+            "kind": kind,
+            "ticket": int(fields["ticket"]) if fields.get("ticket") else None,
+            "symbol": fields.get("symbol"),
+            "price": number(fields.get("price")),
+            "volume": number(fields.get("volume")),
+            "latency_ms": number(fields.get("latency")),
+            "retries": int(fields["retries"]) if fields.get("retries") else None,
+        }
+        if fields.get("magics"):
+            return [{**event, "magic": int(magic)} for magic in fields["magics"].split(", ")]
+        return [{**event, "magic": int(fields["magic"]) if fields.get("magic") else None}]
+    magics = MAGICS.search(message)
+    ticket = TICKET.search(message)
+    if magics is None and ticket is None:
+        return []
+    ticket = int(ticket.group(1)) if ticket is not None else None
+    if magics is None:
+        return [{"kind": "log", "ticket": ticket}]
+    return [{"kind": "log", "ticket": ticket, "magic": int(magic)} for magic in magics.group(1).split(", ")]
+
+
+class LogIndex:
+    """
+    SQLite index of log events, updated incrementally
+    """
+
+    def __init__(self, path: Path = INDEX_FILE):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, log_dir: Path = LOG_DIR) -> dict:
+        """
+        Read new records of every log file in ``log_dir``
+        :return: number of files read and events added
+        """
+        stats = {"files": 0, "skipped": 0, "events": 0}
+        for path in sorted(log_dir.glob("*.log*")):
+            if not path.is_file():
+                continue
+            added = self.update_file(path)
+            if added is None:
+                stats["skipped"] += 1
+            else:
+                stats["files"] += 1
+                stats["events"] += added
+        return stats
+
+    def update_file(self, path: Path) -> int | None:
+        """
+        :return: events added or None when the file didn't change
+        """
+        stat = path.stat()
+        key = fingerprint(path)
+        if key is None:
+            return None
+        compressed = path.suffix == ".gz"
+        # Активный файл ещё растёт, ротированные и сжатые больше не меняются
+        rotated = compressed or not path.name.endswith(".log")
+        row = self.connection.execute(
+            "SELECT id, path, size, mtime_ns, offset, complete FROM files WHERE fingerprint = ?", (key,)).fetchone()
+        if row is None:
+            file_id = self.connection.execute(
+                "INSERT INTO files (path, fingerprint) VALUES (?, ?)", (str(path), key)).lastrowid
+            offset = 0
+        else:
+            file_id, known_path, size, mtime_ns, offset, complete = row
+            if known_path != str(path):
+                if Path(known_path).exists() and Path(known_path) != path and fingerprint(Path(known_path)) == key:
+                    # Копия уже проиндексированного файла, например сжатая рядом с исходным
+                    return None
+                # Файл переименован ротацией, на прежнем пути уже новый лог; чтение продолжается с offset
+                self.connection.execute("UPDATE files SET path = ? WHERE id = ?", (str(path), file_id))
+            if complete or (not compressed and (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns)):
+                self.connection.commit()
+                return None
+            if not compressed and stat.st_size < offset:
+                # Файл перезаписан
+                offset = 0
+        self.connection.execute("DELETE FROM events WHERE file = ? AND offset >= ?", (file_id, offset))
+
+        added = 0
+        batch = []
+        last = offset
+        with open_log(path) as file:
+            if offset:
+                if compressed:
+                    # gzip не позволяет перейти к смещению, прочитанное пропускается
+                    skipped = 0
+                    while skipped < offset:
+                        chunk = file.read(min(1 << 20, offset - skipped))
+                        if not chunk:
+                            break
+                        skipped += len(chunk)
+                else:
+                    file.seek(offset)
+            for start, when, level, message in records(file, offset):
+                last = start
+                for event in parse_events(message):
+                    batch.append((
+                        file_id, start, when, level, event["kind"], event.get("magic"), event.get("ticket"),
+                        event.get("symbol"), event.get("price"), event.get("volume"), event.get("latency_ms"),
+                        event.get("retries"), message.split("\n", 1)[0][:200],
+                    ))
+                if len(batch) >= CHUNK:
+                    added += self.insert(batch)
+        added += self.insert(batch)
+        self.connection.execute(
+            "UPDATE files SET size = ?, mtime_ns = ?, offset = ?, complete = ? WHERE id = ?",
+            (stat.st_size, stat.st_mtime_ns, last, int(rotated), file_id))
+        self.connection.commit()
+        return added
+
+    def insert(self, batch: list[tuple]) -> int:
+        self.connection.executemany(f"INSERT INTO events VALUES ({', '.join('?' * 13)})", batch)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    def query(self, magic: int | None = None, ticket: int | None = None, since: str | None = None,
+              until: str | None = None, kind: str | None = None, limit: int = 1000) -> list[dict]:
+        """
+        Events of a magic number (with the events of its tickets) or of a ticket, oldest first
+        :param since: "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"
+        :param until: inclusive, a date means the end of that day
+        """
+        where, args = [], []
+        if magic is not None:
+            where.append("(magic = ? OR ticket IN (SELECT ticket FROM events WHERE magic = ? AND ticket IS NOT NULL))")
+            args += [magic, magic]
+        if ticket is not None:
+            where.append("ticket = ?")
+            args.append(ticket)
+        if since:
+            where.append("time >= ?")
+            args.append(since)
+        if until:
+            where.append("time <= ?")
+            args.append(until if len(until) > 10 else f"{until} 23:59:59")
+        if kind:
+            where.append("kind = ?")
+            args.append(kind)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY time, file, offset LIMIT ?"
+        return [dict(zip(COLUMNS, row)) for row in self.connection.execute(sql, (*args, limit))]
+
+    def trades(self, magic: int, since: str | None = None, until: str | None = None) -> list[dict]:
+        """
+        Every open of the magic number with its send latency and the close of its ticket
+        """
+        events = self.query(magic=magic, since=since, until=until, limit=1_000_000)
+        trades = []
+        for i, event in enumerate(events):
+            if event["kind"] != "open":
+                continue
+            trade = {
+                "ticket": event["ticket"], "symbol": event["symbol"], "open_time": event["time"],
+                "open_price": event["price"], "volume": event["volume"], "send_ms": None,
+                "close_time": None, "close_price": None, "close_ms": None, "retries": None,
+            }
+            # Задание диспетчера пишет время отправки сразу после записи об открытии
+            sent_by = (datetime.strptime(event["time"], TIME_FORMAT) + SEND_WINDOW).strftime(TIME_FORMAT)
+            for later in events[i + 1:]:
+                if later["time"] > sent_by or later["kind"] == "open":
+                    break
+                if later["kind"] == "dispatch" and later["magic"] == magic:
+                    trade["send_ms"] = later["latency_ms"]
+                    break
+            for later in events:
+                if later["ticket"] == event["ticket"] and later["kind"] in ("close", "gone"):
+                    trade.update(close_time=later["time"], close_price=later["price"],
+                                 close_ms=later["latency_ms"], retries=later["retries"])
+                    break
+            trades.append(trade)
+        return trades
+
+    def stats(self) -> dict:
+        files, events = self.connection.execute(
+            "SELECT (SELECT COUNT(*) FROM files), (SELECT COUNT(*) FROM events)").fetchone()
+        first, last = self.connection.execute("SELECT MIN(time), MAX(time) FROM events").fetchone()
+        return {"files": files, "events": events, "first": first, "last": last}
+
+
+def print_rows(rows: list[dict], columns: tuple[str, ...]):
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join("" if row[column] is None else str(row[column]) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", type=Path, default=LOG_DIR, help="directory with the log files")
+    parser.add_argument("--index", type=Path, default=INDEX_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("update", help="index new records")
+    commands.add_parser("stats", help="size of the index")
+    for name in ("query", "trades"):
+        command = commands.add_parser(name, help="events" if name == "query" else "opens and closes of a magic")
+        command.add_argument("--magic", type=int, required=name == "trades")
+        command.add_argument("--since")
+        command.add_argument("--until")
+        command.add_argument("--no-update", action="store_true", help="don't read new records first")
+        if name == "query":
+            command.add_argument("--ticket", type=int)
+            command.add_argument("--kind")
+            command.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    index = LogIndex(args.index)
+    try:
+        if args.command == "update" or args.command in ("query", "trades") and not args.no_update:
+            start = time.perf_counter()
+            stats = index.update(args.logs)
+            print(f"indexed {stats['events']} events from {stats['files']} files, "
+                  f"{stats['skipped']} unchanged, {(time.perf_counter() - start) * 1000:.0f} ms", file=sys.stderr)
+        start = time.perf_counter()
+        if args.command == "stats":
+            print(index.stats())
+        elif args.command == "query":
+            if args.magic is None and args.ticket is None and not args.since:
+                parser.error("query needs --magic, --ticket or --since")
+            print_rows(index.query(args.magic, args.ticket, args.since, args.until, args.kind, args.limit), COLUMNS)
+        elif args.command == "trades":
+            trades = index.trades(args.magic, args.since, args.until)
+            print_rows(trades, tuple(trades[0]) if trades else ("ticket",))
+        if args.command in ("query", "trades"):
+            print(f"query {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,4 @@
-import MetaTrader5 as mt5
-from MetaTrader5 import AccountInfo
-
 from expert import Expert
 if __name__ == "__main__":
     my_expert = Expert()
     my_expert.main()
-
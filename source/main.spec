@@ -10,9 +10,13 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Пакеты из requirements.txt, которые бот не импортирует, и отладочные модули
+    excludes=[
+        'pandas', 'matplotlib', 'PIL', 'tkinter', 'scipy', 'IPython', 'pytest',
+        'fake_mt5', 'benchmark', 'backtest', 'startup',
+    ],
     noarchive=False,
-    optimize=0,
+    optimize=1,
 )
 pyz = PYZ(a.pure)
 
@@ -0,0 +1,95 @@
+import threading
+import time
+from datetime import datetime
+
+from trading_calendar import TradingCalendars, TradingCalendar
+
+
+class MarketSnapshot:
+    """
+    Caching proxy over the terminal for market data.
+
+    symbol_info(), symbol_info_tick() and account_info() are requested from the
+    terminal at most once per symbol per cycle (and never kept longer than ``ttl``
+    seconds), so signals on the same symbol share one answer. Every other
+    attribute is taken from the wrapped terminal as is, therefore the snapshot
+    can be passed to the signals instead of the MetaTrader5 module.
+
+    The trading thread starts the cycles, dispatcher threads read and invalidate
+    the same cache, so every access to it goes under a lock. The terminal is
+    called outside of the lock.
+    """
+
+    def __init__(self, terminal, ttl: float = 1, calendar_refresh: float = 60, bar_store=None):
+        """
+        :param terminal: MetaTrader5 module (or an object with the same API)
+        :param ttl: maximum age of a cached answer in seconds
+        :param calendar_refresh: how often trading calendars look for new D1 bars, seconds
+        :param bar_store: bar_store.BarStore shared with other processes, None requests all bars from the terminal
+        """
+        self.terminal = terminal
+        self.ttl = ttl
+        self.calendars = TradingCalendars(calendar_refresh, bar_store)
+        self.hits = 0
+        self.misses = 0
+        self._cache: dict[tuple, tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.terminal, name)
+
+    def next_cycle(self):
+        """
+        Forget everything cached during the previous cycle
+        """
+        with self._lock:
+            self._cache.clear()
+
+    def invalidate(self, symbol: str | None = None):
+        """
+        Drop cached answers of one symbol (account info is kept) or the whole cache
+        """
+        with self._lock:
+            if symbol is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if symbol in key[1:]]:
+                del self._cache[key]
+
+    def _get(self, name: str, *args):
+        key = (name, *args)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = getattr(self.terminal, name)(*args)
+        if value is not None:
+            with self._lock:
+                self._cache[key] = (now, value)
+        return value
+
+    def symbol_info(self, symbol: str):
+        return self._get("symbol_info", symbol)
+
+    def symbol_info_tick(self, symbol: str):
+        return self._get("symbol_info_tick", symbol)
+
+    def account_info(self):
+        return self._get("account_info")
+
+    def calendar(self, symbol: str, since: datetime | None = None) -> TradingCalendar:
+        """
+        Trading calendar of the symbol, kept between cycles
+        """
+        return self.calendars.get(self.terminal, symbol, since)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+        }
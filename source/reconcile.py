@@ -0,0 +1,61 @@
+import time
+from datetime import datetime, timedelta
+
+from signals import Status
+from utils import exceptions
+from utils.logger_config import logger
+
+
+class PositionIndex:
+    """
+    Open positions and deal history of the account indexed by (magic, symbol).
+
+    Built with one positions_get() and one history_deals_get() call, so the
+    status of any number of signals is resolved without extra terminal requests.
+    Without ``history`` only open positions are loaded, enough to verify the state journal.
+    """
+    history_days = 365
+
+    def __init__(self, history: bool = True):
+        self.history = history
+        self.positions: dict[tuple[int, str], int] = {}
+        self.deals: set[tuple[int, str]] = set()
+
+    @classmethod
+    def build(cls, terminal, history: bool = True) -> "PositionIndex":
+        start = time.perf_counter()
+        index = cls(history)
+
+        positions = terminal.positions_get()
+        if positions is None:
+            raise exceptions.TerminalDataError("positions_get", terminal.last_error())
+        if not history:
+            for position in positions:
+                index.positions[(position.magic, position.symbol)] = position.ticket
+            logger.info(
+                f"Reconciliation: {len(positions)} positions loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return index
+        from_date = datetime.now() - timedelta(days=cls.history_days)
+        to_date = datetime.now() + timedelta(days=2)
+        deals = terminal.history_deals_get(from_date, to_date)
+        if deals is None:
+            raise exceptions.TerminalDataError("history_deals_get", terminal.last_error())
+
+        for deal in deals:
+            index.deals.add((deal.magic, deal.symbol))
+        for position in positions:
+            # The last position with the same magic wins, like in Expert.order_exists()
+            index.positions[(position.magic, position.symbol)] = position.ticket
+
+        logger.info(
+            f"Reconciliation: {len(positions)} positions and {len(deals)} deals "
+            f"loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return index
+
+    def status(self, magic: int, symbol: str) -> tuple[Status, int | None]:
+        ticket = self.positions.get((magic, symbol))
+        if ticket is not None:
+            return Status.open, ticket
+        if (magic, symbol) in self.deals:
+            return Status.close, None
+        return Status.init, None
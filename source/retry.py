@@ -0,0 +1,61 @@
+import time
+from collections import Counter
+
+from utils.logger_config import logger
+
+
+class RetryQueue:
+    """
+    Signals that can't be handled right now, parked until a backoff deadline.
+
+    Parking doesn't block the loop: the expert skips a parked signal and keeps
+    serving the others. Every new failure in a row doubles the delay up to
+    ``max_delay``; a successful check releases the signal.
+    """
+
+    def __init__(self, max_delay: float = 300):
+        self.max_delay = max_delay
+        self.deadlines: dict[int, float] = {}
+        self.attempts: Counter = Counter()
+        self.retries: Counter = Counter()
+        self.parked_time: Counter = Counter()
+        self._parked_at: dict[int, float] = {}
+
+    def park(self, magic: int, delay: float, reason: str = "") -> float:
+        """
+        Park the signal and return the deadline (unix time) of the next attempt
+        """
+        now = time.time()
+        delay = min(delay * 2 ** self.attempts[magic], self.max_delay)
+        self.attempts[magic] += 1
+        self.retries[magic] += 1
+        self._parked_at.setdefault(magic, now)
+        deadline = self.deadlines[magic] = now + delay
+        logger.warning(f"Signal [{magic}] parked for {delay:.1f} s: {reason}")
+        return deadline
+
+    def deadline(self, magic: int) -> float | None:
+        return self.deadlines.get(magic)
+
+    def is_parked(self, magic: int) -> bool:
+        deadline = self.deadlines.get(magic)
+        return deadline is not None and time.time() < deadline
+
+    def release(self, magic: int):
+        """
+        Forget the backoff of the signal after a check passed without an error
+        """
+        if self.deadlines.pop(magic, None) is None:
+            return
+        self.attempts.pop(magic, None)
+        self.parked_time[magic] += time.time() - self._parked_at.pop(magic)
+
+    def stats(self, magic: int) -> dict:
+        parked_time = self.parked_time[magic]
+        if magic in self._parked_at:
+            parked_time += time.time() - self._parked_at[magic]
+        return {
+            "retries": self.retries[magic],
+            "parked": self.is_parked(magic),
+            "parked_time": parked_time,
+        }
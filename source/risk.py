@@ -0,0 +1,216 @@
+"""
+Pre-trade risk stage.
+
+Open requests of the signals that fired in one cycle are sized together: one
+account snapshot, one positions_get() for the current exposure and one
+vectorized pass that turns the risk percent of every signal into a lot size
+rounded down to the volume step of the symbol. Aggregate caps per symbol and
+per account are applied in the order the requests were made, so every request
+sees the exposure the previous ones are about to add. The volume and risk of an
+accepted request stay reserved until its order_send() returns, so requests of
+the next cycles see the orders still waiting in the dispatcher too.
+
+Caps are read from the environment, 0 means no limit:
+    RISK_MAX_SYMBOL=2       % of equity at risk on one symbol
+    RISK_MAX_ACCOUNT=6      % of equity at risk on the whole account
+    RISK_MAX_SYMBOL_LOTS=5  lots on one symbol
+    RISK_MAX_POSITIONS=20   open positions on the account
+"""
+import math
+import os
+import threading
+
+import numpy as np
+from pydantic import BaseModel
+
+from utils.logger_config import logger
+
+# Погрешность деления объёма на шаг
+EPSILON = 1e-9
+
+
+def round_volume(volume: float, volume_min: float, volume_max: float, volume_step: float) -> float:
+    """
+    Round the lot size down to the volume step and clip it to the broker limits,
+    0 when it is below the minimum volume
+    """
+    volume = round(math.floor(volume / volume_step + EPSILON) * volume_step, 8)
+    if volume < volume_min - EPSILON:
+        return 0.0
+    return min(volume, volume_max)
+
+
+def round_volumes(volume: np.ndarray, volume_min: np.ndarray, volume_max: np.ndarray,
+                  volume_step: np.ndarray) -> np.ndarray:
+    """
+    round_volume() for arrays
+    """
+    volume = np.minimum(np.round(np.floor(volume / volume_step + EPSILON) * volume_step, 8), volume_max)
+    return np.where(volume >= volume_min - EPSILON, volume, 0.0)
+
+
+def point_value(symbol_info) -> float:
+    """
+    Account currency value of one point for one lot
+    """
+    return symbol_info.trade_tick_value / (symbol_info.trade_tick_size / symbol_info.point)
+
+
+class RiskLimits(BaseModel):
+    max_symbol_risk: float = 0
+    max_account_risk: float = 0
+    max_symbol_volume: float = 0
+    max_positions: int = 0
+
+    @classmethod
+    def from_env(cls) -> "RiskLimits":
+        return cls(
+            max_symbol_risk=float(os.getenv("RISK_MAX_SYMBOL", 0)),
+            max_account_risk=float(os.getenv("RISK_MAX_ACCOUNT", 0)),
+            max_symbol_volume=float(os.getenv("RISK_MAX_SYMBOL_LOTS", 0)),
+            max_positions=int(os.getenv("RISK_MAX_POSITIONS", 0)),
+        )
+
+    def enabled(self) -> bool:
+        return bool(self.max_symbol_risk or self.max_account_risk or self.max_symbol_volume or self.max_positions)
+
+
+class Exposure:
+    """
+    Money at risk and lots per symbol of the open positions and of the reserved orders
+    """
+
+    def __init__(self):
+        self.risk: dict[str, float] = {}
+        self.volume: dict[str, float] = {}
+        self.total_risk = 0.0
+        self.positions = 0
+
+    @classmethod
+    def of_positions(cls, terminal, reserved=()) -> "Exposure":
+        """
+        :param reserved: (symbol, volume, risk) of the orders accepted but not sent yet
+        """
+        exposure = cls()
+        for position in terminal.positions_get() or ():
+            risk = 0.0
+            symbol_info = terminal.symbol_info(position.symbol)
+            # Позиция без stop loss не ограничена по риску, учитывается только объём
+            if position.sl and symbol_info is not None:
+                risk = abs(position.price_open - position.sl) / symbol_info.point * point_value(symbol_info) * position.volume
+            exposure.add(position.symbol, position.volume, risk)
+        for symbol, volume, risk in reserved:
+            exposure.add(symbol, volume, risk)
+        return exposure
+
+    def add(self, symbol: str, volume: float, risk: float):
+        self.risk[symbol] = self.risk.get(symbol, 0.0) + risk
+        self.volume[symbol] = self.volume.get(symbol, 0.0) + volume
+        self.total_risk += risk
+        self.positions += 1
+
+
+class RiskEngine:
+    """
+    Sizes a batch of open requests and enforces the caps before they are sent
+    """
+
+    def __init__(self, limits: RiskLimits | None = None):
+        self.limits = limits or RiskLimits()
+        # Принятые, но ещё не отправленные ордера: magic -> (символ, объём, риск), снимаются потоками диспетчера
+        self.lock = threading.Lock()
+        self.reservations: dict[int, tuple[str, float, float]] = {}
+        self.accepted = 0
+        self.reduced = 0
+        self.rejected = 0
+
+    def size(self, orders: list[tuple], terminal) -> tuple[list[tuple], list[tuple]]:
+        """
+        Set the volume of every request
+        :param orders: (signal, ResponseOpen) pairs in the order they were made
+        :param terminal: MarketSnapshot, symbol and account info are taken once per cycle
+        :return: accepted (signal, request) pairs and rejected (signal, reason) pairs
+        """
+        account_info = terminal.account_info()
+        if account_info is None:
+            return [], [(signal, "no account info") for signal, _ in orders]
+        rejected = []
+        known, infos = [], []
+        for signal, request in orders:
+            info = terminal.symbol_info(request.symbol)
+            if info is None:
+                rejected.append((signal, "no symbol info"))
+            else:
+                known.append((signal, request))
+                infos.append(info)
+        orders = known
+        if not orders:
+            return [], rejected
+
+        def column(name: str) -> np.ndarray:
+            return np.array([getattr(info, name) for info in infos], dtype=float)
+
+        risk = np.array([signal.risk for signal, _ in orders], dtype=float)
+        price = np.array([request.price for _, request in orders], dtype=float)
+        sl = np.array([request.sl for _, request in orders], dtype=float)
+        point = column("point")
+        volume_min, volume_max, volume_step = column("volume_min"), column("volume_max"), column("volume_step")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Деньги под риском на один лот
+            lot_risk = np.abs(price - sl) / point * (column("trade_tick_value") / (column("trade_tick_size") / point))
+            raw = account_info.equity * risk / 100 / lot_risk
+        valid = np.isfinite(raw) & (raw > 0)
+        volume = round_volumes(np.where(valid, raw, 0.0), volume_min, volume_max, volume_step)
+
+        limits = self.limits
+        with self.lock:
+            reserved = list(self.reservations.values())
+        exposure = Exposure.of_positions(terminal, reserved) if limits.enabled() else Exposure()
+        equity = account_info.equity
+        accepted = []
+        for i, (signal, request) in enumerate(orders):
+            if not valid[i]:
+                rejected.append((signal, "stoploss distance or tick value is zero"))
+                continue
+            if volume[i] == 0:
+                rejected.append((signal, f"lot size {raw[i]:.4f} is below the minimum volume {volume_min[i]}"))
+                continue
+            if limits.max_positions and exposure.positions >= limits.max_positions:
+                rejected.append((signal, f"{exposure.positions} positions reach the account limit"))
+                continue
+            symbol = request.symbol
+            caps = {"size": float(volume[i])}
+            if limits.max_symbol_volume:
+                caps["symbol volume cap"] = limits.max_symbol_volume - exposure.volume.get(symbol, 0.0)
+            if limits.max_symbol_risk:
+                caps["symbol risk cap"] = (
+                    equity * limits.max_symbol_risk / 100 - exposure.risk.get(symbol, 0.0)) / lot_risk[i]
+            if limits.max_account_risk:
+                caps["account risk cap"] = (equity * limits.max_account_risk / 100 - exposure.total_risk) / lot_risk[i]
+            reason = min(caps, key=caps.get)
+            allowed = round_volume(max(caps[reason], 0.0), volume_min[i], volume_max[i], volume_step[i])
+            if allowed == 0:
+                rejected.append((signal, f"{reason} reached on {symbol}"))
+                continue
+            if allowed < volume[i]:
+                self.reduced += 1
+                logger.info(f"Signal [{signal.magic}] volume reduced from {volume[i]} to {allowed} by {reason}")
+            request.volume = float(allowed)
+            exposure.add(symbol, allowed, allowed * lot_risk[i])
+            with self.lock:
+                self.reservations[signal.magic] = (symbol, float(allowed), float(allowed * lot_risk[i]))
+            accepted.append((signal, request))
+        self.accepted += len(accepted)
+        self.rejected += len(rejected)
+        return accepted, rejected
+
+    def release(self, magic: int):
+        """
+        Drop the reservation of the order: it was sent (the position is counted from now on) or failed
+        """
+        with self.lock:
+            self.reservations.pop(magic, None)
+
+    def stats(self) -> dict:
+        return {"accepted": self.accepted, "reduced": self.reduced, "rejected": self.rejected,
+                "reserved": len(self.reservations)}
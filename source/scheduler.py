@@ -0,0 +1,114 @@
+import heapq
+import itertools
+import time
+from typing import Hashable
+
+from utils.logger_config import logger
+
+
+class Scheduler:
+    """
+    Priority queue of deadlines (unix timestamps) keyed by an arbitrary hashable key.
+
+    Instead of spinning, the trading loop sleeps until the earliest deadline
+    (but never longer than ``max_idle``) and then takes every due key.
+    Rescheduling a key replaces its previous deadline.
+    """
+
+    def __init__(self, max_idle: float = 60, late_warning: float = 1):
+        """
+        :param max_idle: maximum time in seconds the loop can sleep without waking up
+        :param late_warning: log a warning when a wakeup lands later than this many seconds
+        """
+        self.max_idle = max_idle
+        self.late_warning = late_warning
+        self._queue: list[tuple[float, int, Hashable]] = []
+        self._deadlines: dict[Hashable, float] = {}
+        self._counter = itertools.count()
+
+        self.wakeups = 0
+        self.last_lateness: float | None = None
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, key: Hashable, deadline: float, keep_earlier: bool = False):
+        """
+        :param keep_earlier: don't move an already scheduled key to a later deadline
+        """
+        current = self._deadlines.get(key)
+        if current == deadline or keep_earlier and current is not None and current < deadline:
+            return
+        self._deadlines[key] = deadline
+        heapq.heappush(self._queue, (deadline, next(self._counter), key))
+        if len(self._queue) > 2 * len(self._deadlines) + 64:
+            self._compact()
+
+    def _compact(self):
+        """
+        Drop entries of rescheduled and cancelled keys from the heap
+        """
+        self._queue = [
+            entry for entry in self._queue if self._deadlines.get(entry[2]) == entry[0]
+        ]
+        heapq.heapify(self._queue)
+
+    def cancel(self, key: Hashable):
+        self._deadlines.pop(key, None)
+
+    def deadline(self, key: Hashable) -> float | None:
+        return self._deadlines.get(key)
+
+    def next_deadline(self) -> float | None:
+        """
+        Return the earliest deadline, dropping stale heap entries on the way
+        """
+        while self._queue:
+            deadline, _, key = self._queue[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self._queue)
+        return None
+
+    def sleep(self):
+        """
+        Block until the earliest deadline or max_idle, whatever comes first
+        """
+        deadline = self.next_deadline()
+        now = time.time()
+        timeout = self.max_idle if deadline is None else min(max(deadline - now, 0), self.max_idle)
+        if timeout > 0:
+            time.sleep(timeout)
+        if deadline is not None and deadline <= now + timeout:
+            self._record_lateness(time.time() - deadline)
+
+    def pop_due(self, now: float | None = None) -> list[Hashable]:
+        """
+        Remove and return every key whose deadline is reached
+        """
+        now = time.time() if now is None else now
+        due = []
+        while (deadline := self.next_deadline()) is not None and deadline <= now:
+            _, _, key = heapq.heappop(self._queue)
+            del self._deadlines[key]
+            due.append(key)
+        return due
+
+    def _record_lateness(self, lateness: float):
+        self.wakeups += 1
+        self.last_lateness = lateness
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        if lateness > self.late_warning:
+            logger.warning(f"Scheduler woke up {lateness:.3f} s after the deadline")
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._deadlines),
+            "wakeups": self.wakeups,
+            "last_lateness": self.last_lateness,
+            "avg_lateness": self.total_lateness / self.wakeups if self.wakeups else None,
+            "max_lateness": self.max_lateness,
+        }
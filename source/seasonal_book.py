@@ -0,0 +1,111 @@
+import numpy as np
+
+from signals import SeasonalSignal, Status
+
+# Код статуса строки, свободные строки помечаются FREE
+FREE = 0
+STATUS_CODES = {status: status.value for status in Status}
+
+
+class SeasonalBook:
+    """
+    Time-triggered seasonal signals kept as columns (struct of arrays).
+
+    SeasonalSignal.check() only compares the current time with open_time_d or
+    close_time_d, so instead of calling it for every signal the book finds all
+    signals due to open or close with one vectorized comparison, and only the
+    matches go through the regular per-object path.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.index: dict[int, int] = {}
+        self._free: list[int] = []
+        self._size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        old = self._size
+        magic = np.zeros(capacity, dtype=np.int64)
+        status = np.full(capacity, FREE, dtype=np.int8)
+        open_at = np.full(capacity, np.inf)
+        close_at = np.full(capacity, np.inf)
+        hold = np.zeros(capacity)
+        if old:
+            magic[:old] = self.magic[:old]
+            status[:old] = self.status[:old]
+            open_at[:old] = self.open_at[:old]
+            close_at[:old] = self.close_at[:old]
+            hold[:old] = self.hold[:old]
+        self.magic, self.status, self.open_at, self.close_at, self.hold = magic, status, open_at, close_at, hold
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, magic: int):
+        return magic in self.index
+
+    def sync(self, signal: SeasonalSignal, hold: float = 0):
+        """
+        Copy status and times of the signal into its row, adding the row if needed
+        :param hold: the signal isn't due before this unix time (in-flight or parked request)
+        """
+        row = self.index.get(signal.magic)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == len(self.magic):
+                    self._allocate(2 * len(self.magic))
+                row = self._size
+                self._size += 1
+            self.index[signal.magic] = row
+            self.magic[row] = signal.magic
+        self.status[row] = STATUS_CODES[signal.status]
+        self.open_at[row] = signal.open_time_d.timestamp() if signal.open_time_d else np.inf
+        self.close_at[row] = signal.close_time_d.timestamp() if signal.close_time_d else np.inf
+        self.hold[row] = hold
+
+    def remove(self, magic: int):
+        row = self.index.pop(magic, None)
+        if row is None:
+            return
+        self.status[row] = FREE
+        self.open_at[row] = self.close_at[row] = np.inf
+        self._free.append(row)
+
+    def _event_times(self) -> np.ndarray:
+        """
+        Time of the next event of every row: open for new signals, close for open ones
+        """
+        size = self._size
+        status = self.status[:size]
+        return np.where(
+            status == STATUS_CODES[Status.init], self.open_at[:size],
+            np.where(status == STATUS_CODES[Status.open], self.close_at[:size], np.inf)
+        )
+
+    def due(self, now: float) -> np.ndarray:
+        """
+        Magic numbers of signals whose check() would return a request at ``now``
+        """
+        mask = (self._event_times() < now) & (self.hold[:self._size] <= now)
+        return self.magic[:self._size][mask]
+
+    def next_deadline(self) -> float | None:
+        """
+        Earliest moment when some signal becomes due, None when nothing is pending
+        """
+        if not self._size:
+            return None
+        deadline = float(np.maximum(self._event_times(), self.hold[:self._size]).min())
+        return None if deadline == np.inf else deadline
+
+    def stats(self) -> dict:
+        status = self.status[:self._size]
+        return {
+            "signals": len(self.index),
+            "init": int(np.count_nonzero(status == STATUS_CODES[Status.init])),
+            "open": int(np.count_nonzero(status == STATUS_CODES[Status.open])),
+            "close": int(np.count_nonzero(status == STATUS_CODES[Status.close])),
+            "capacity": len(self.magic),
+        }
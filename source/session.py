@@ -0,0 +1,128 @@
+import time
+
+from utils.logger_config import logger
+
+
+class TerminalSession:
+    """
+    Long-lived connection to the MetaTrader5 terminal.
+
+    The terminal is attached once and then only probed with a cheap
+    ``terminal_info()`` call. A full ``initialize()`` happens again only when the
+    probe fails, with an exponential backoff between attempts so a dead terminal
+    is not hammered every cycle.
+    """
+
+    def __init__(
+            self,
+            terminal,
+            path: str | None = None,
+            backoff: float = 1,
+            max_backoff: float = 60,
+            check_interval: float = 0.5
+    ):
+        """
+        :param terminal: MetaTrader5 module (or an object with the same API)
+        :param path: path to terminal64.exe, passed to initialize()
+        :param backoff: first delay in seconds before a reconnect attempt
+        :param max_backoff: upper limit for the reconnect delay
+        :param check_interval: the link is probed at most once per this many seconds
+        """
+        self.terminal = terminal
+        self.path = path
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.check_interval = check_interval
+
+        self.connected = False
+        self.connects = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.last_attach_latency: float | None = None
+        self.total_attach_latency = 0.0
+
+        self._delay = backoff
+        self._next_attempt = 0.0
+        self._next_check = 0.0
+
+    def connect(self) -> bool:
+        """
+        Attach to the terminal. Returns True when initialize() succeeded
+        """
+        if self.connected:
+            return True
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+
+        start = time.perf_counter()
+        kwargs = {"path": self.path} if self.path else {}
+        ok = self.terminal.initialize(**kwargs)
+        latency = time.perf_counter() - start
+
+        if not ok:
+            self.failures += 1
+            self._next_attempt = now + self._delay
+            logger.error(
+                f"Terminal initialize failed, error: {self.terminal.last_error()}. "
+                f"Next attempt in {self._delay:.0f} s"
+            )
+            self._delay = min(self._delay * 2, self.max_backoff)
+            return False
+
+        if self.connects:
+            self.reconnects += 1
+            logger.warning(f"Terminal reconnected in {latency * 1000:.1f} ms")
+        self.connects += 1
+        self.connected = True
+        self.last_attach_latency = latency
+        self.total_attach_latency += latency
+        self._delay = self.backoff
+        return True
+
+    def alive(self) -> bool:
+        """
+        Cheap liveness check: terminal_info() returns None when the link is broken
+        """
+        if not self.connected:
+            return False
+        now = time.monotonic()
+        if now < self._next_check:
+            return True
+        if self.terminal.terminal_info() is not None:
+            self._next_check = now + self.check_interval
+            return True
+        logger.warning(f"Terminal link lost, error: {self.terminal.last_error()}")
+        self.connected = False
+        self.terminal.shutdown()
+        return False
+
+    def ensure(self) -> bool:
+        """
+        Return True when the terminal is attached, reconnecting if needed
+        """
+        return self.alive() or self.connect()
+
+    def shutdown(self):
+        if self.connected:
+            self.terminal.shutdown()
+            self.connected = False
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+            "last_attach_latency": self.last_attach_latency,
+            "avg_attach_latency": (
+                self.total_attach_latency / self.connects if self.connects else None
+            ),
+        }
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
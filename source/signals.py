@@ -1,4 +1,3 @@
-import time
 from typing import Any
 
 import MetaTrader5 as mt5
@@ -7,7 +6,7 @@ from datetime import datetime, timedelta
 from MetaTrader5 import Tick
 from pydantic import BaseModel, field_validator, validator
 from enum import Enum
-from utils import exceptions
+from utils import exceptions, clock
 from utils.logger_config import logger
 
 
@@ -30,7 +29,8 @@ class Status(Enum):
 class ResponseOpen(BaseModel):
     type: str
     symbol: str
-    volume: float
+    # Объём задаёт RiskEngine.size() для всех запросов цикла вместе
+    volume: float = 0
     price: float
     sl: float
     tp: float = 0
@@ -44,14 +44,33 @@ class ResponseClose(BaseModel):
     ticket: int
 
 
-def parse_datetime(month_day: str | tuple, hour_min) -> datetime:
-    return datetime(
-        year=datetime.now().year,
-        month=int(month_day.split(".")[1]) if isinstance(month_day, str) else month_day[0],
-        day=int(month_day.split(".")[0]) if isinstance(month_day, str) else month_day[1],
-        hour=int(hour_min.split(":")[0]),
-        minute=int(hour_min.split(":")[1])
-    )
+def parse_month_day(month_day: str) -> tuple[int, int]:
+    """
+    "dd.mm" -> (month, day)
+    """
+    day, month = month_day.split(".")
+    return int(month), int(day)
+
+
+def parse_hour_min(hour_min: str) -> tuple[int, int]:
+    """
+    "hh:mm" -> (hour, minute)
+    """
+    hour, minute = hour_min.split(":")
+    return int(hour), int(minute)
+
+
+def parse_days(value: str) -> int:
+    """
+    "5 TDOM" or "5 TD" -> 5
+    """
+    return int(value.split(" ")[0])
+
+
+def parse_datetime(month_day: str | tuple, hour_min: str | tuple) -> datetime:
+    month, day = parse_month_day(month_day) if isinstance(month_day, str) else month_day
+    hour, minute = parse_hour_min(hour_min) if isinstance(hour_min, str) else hour_min
+    return datetime(year=clock.now().year, month=month, day=day, hour=hour, minute=minute)
 
 
 class BaseSignal(BaseModel):
@@ -69,6 +88,9 @@ class BaseSignal(BaseModel):
     status: Status = Status.init
     ticket: int = None
     counter:int = 0
+    # (hour, minute) из open_time/close_time, разбираются один раз при загрузке
+    open_hm: tuple[int, int] | None = None
+    close_hm: tuple[int, int] | None = None
 
 
     def __init__(self, **data):
@@ -76,12 +98,21 @@ class BaseSignal(BaseModel):
         self.info()
 
 
+    @classmethod
+    def compile(cls, fields: dict) -> dict:
+        """
+        Parsed parts of the raw csv strings, the signal doesn't parse them again
+        """
+        return dict(
+            open_hm=parse_hour_min(fields["open_time"]) if fields.get("open_time") else None,
+            close_hm=parse_hour_min(fields["close_time"]) if fields.get("close_time") else None,
+        )
+
     def info(self):
         self.update()
-        logger.info(
-            f"Signal {self.__class__.__name__} was succsessfuly created")
-        logger.info(f"{self.__class__.__name__} time: {self.open_time_d}")
-        logger.info(f"{self.__class__.__name__} end time: {self.close_time_d}")
+        # Одна запись уровня DEBUG на сигнал: при загрузке тысяч строк логирование не задерживает запуск
+        logger.debug("Signal %s [%s] was created, time: %s, end time: %s",
+                     self.__class__.__name__, self.magic, self.open_time_d, self.close_time_d)
 
     def update(self):
         ...
@@ -90,6 +121,13 @@ class BaseSignal(BaseModel):
     def check(self, terminal) -> ResponseOpen | ResponseClose | None:
         ...
 
+    def next_check_time(self, now: datetime) -> datetime | None:
+        """
+        Return the next moment when check() can return a request.
+        None means the signal has nothing left to do, now means check on every cycle
+        """
+        return now
+
     def get_stoploss(self, price, points):
         if self.direction == OrderDirection.long:
             if self.sl_type == StoplossType.percentage:
@@ -102,42 +140,26 @@ class BaseSignal(BaseModel):
             else:
                 return price + self.sl * points
 
-    def get_lot_size(self, account_info, symbol_info, distance):
-
-        account_equity = account_info.equity
-        risk_amount = account_equity * self.risk / 100
-        tick_value = symbol_info.trade_tick_value
-        tick_size = symbol_info.trade_tick_size
-        point_value = tick_value / (tick_size / symbol_info.point)
-        try:
-            lot_size = risk_amount / distance / point_value
-        except ZeroDivisionError:
-            time.sleep(30)
-            return -1
-        lot_size_round = count_decimal_places(lot_size, symbol_info.volume_min)
-        return lot_size_round
-
     def response_open(self, terminal):
-        point: mt5.SymbolInfo = terminal.symbol_info(self.symbol).point
-        digits: mt5.SymbolInfo = terminal.symbol_info(self.symbol).digits
+        symbol_info: mt5.SymbolInfo = terminal.symbol_info(self.symbol)
+        point = symbol_info.point
+        digits = symbol_info.digits
 
         price = (
-            terminal.symbol_info(self.symbol).ask
+            symbol_info.ask
             if self.direction == OrderDirection.long
-            else terminal.symbol_info(self.symbol).bid
+            else symbol_info.bid
         )
         sl = self.get_stoploss(
             price, point,
 
         )
         sl = round(sl, digits)
-        distance = abs(price - sl) / point
-        account_info: mt5.AccountInfo = terminal.account_info()
-        if terminal.symbol_select(self.symbol, True):
-            time.sleep(2)
-        volume = self.get_lot_size(account_info,
-                                   terminal.symbol_info(self.symbol),
-                                   distance=distance)
+        if not symbol_info.select:
+            # Symbol needs time to get quotes after it is added to Market Watch
+            terminal.symbol_select(self.symbol, True)
+            raise exceptions.SignalNotReadyError(
+                self.symbol, "symbol was not selected in Market Watch", delay=2)
 
         order_type = "Long" if self.direction == OrderDirection.long else "Short"
         return ResponseOpen(
@@ -145,7 +167,6 @@ class BaseSignal(BaseModel):
             symbol=self.symbol,
             price=price,
             sl=sl,
-            volume=volume,
             magic=self.magic,
             comment=self.__class__.__name__
         )
@@ -160,6 +181,16 @@ class BaseSignal(BaseModel):
 class SeasonalSignal(BaseSignal):
     open_time_d: datetime | None = None
     close_time_d: datetime | None = None
+    # (month, day) из entry/tp
+    entry_md: tuple[int, int] | None = None
+    tp_md: tuple[int, int] | None = None
+
+    @classmethod
+    def compile(cls, fields: dict) -> dict:
+        return super().compile(fields) | dict(
+            entry_md=parse_month_day(fields["entry"]),
+            tp_md=parse_month_day(fields["tp"]),
+        )
 
     def update(self):
         if self.open_time_d is None:
@@ -181,10 +212,10 @@ class SeasonalSignal(BaseSignal):
         :return: datetime:
 
         """
-        current_time = datetime.now()
+        current_time = clock.now()
         start_time = parse_datetime(
-            self.entry,
-            self.open_time
+            self.entry_md,
+            self.open_hm
         )
         start_time_with_delta = start_time + timedelta(minutes=1)
 
@@ -195,17 +226,17 @@ class SeasonalSignal(BaseSignal):
     def get_close_time(self) -> datetime:
         start_data: datetime = self.get_start_time()
         end_time: datetime = parse_datetime(
-            self.tp,
-            self.close_time
+            self.tp_md,
+            self.close_hm
         )
 
-        if datetime.now() > end_time and self.close_time_d is None:
+        if clock.now() > end_time and self.close_time_d is None:
             end_time = end_time.replace(year=end_time.year + 1)
 
         return end_time
 
     def check(self, terminal) -> ResponseOpen | ResponseClose | None:
-        current_time = datetime.now()
+        current_time = clock.now()
         if self.status is Status.init:
 
             if current_time > self.open_time_d:
@@ -216,98 +247,111 @@ class SeasonalSignal(BaseSignal):
             if current_time > self.close_time_d:
                 return self.response_close()
 
+    def next_check_time(self, now: datetime) -> datetime | None:
+        if self.status is Status.init:
+            return self.open_time_d
+        if self.status is Status.open:
+            return self.close_time_d
 
-def count_decimal_places(number, min_lot):
-    precision = len(str(int(min_lot * 100)))
-    if precision == 1:
-        return float(f"{number:.2f}")
-    elif precision == 2:
-        return float(f"{number:.1f}")
-    elif precision == 3:
-        return float(int(number))
-    else:
-        raise ValueError("Precision must be 1, 2, or 3")
+
+def month_start(month: int, now: datetime) -> datetime:
+    """
+    Return the first day of the nearest month with the given number
+    """
+    year = now.year if month > now.month else now.year + 1
+    return datetime(year=year, month=month, day=1)
 
 
 class ShortTermSignal(BaseSignal):
     start_day: int = None
     end_day: int = None
+    # Самая ранняя дата, когда может наступить торговый день входа или выхода, по календарю символа
+    due: datetime | None = None
 
     def __init__(self, **data):
         super().__init__(**data)
         self.update()
 
-    def update(self):
-        self.start_day = int(self.entry.split(" ")[0])
-        self.end_day = int(self.tp.split(" ")[0])
-
-    def get_signal_trading_days(
-            self,
-            terminal: mt5,
-            _time: datetime
-    ):
-        """
-        Return trading days from selected date
-
-        :param terminal: Terminal for interaction with MT5 API and getting rates
-        :param _time: datetime variable from what date start gathering
-        :return: Count of working days (bars that have minimum 1 tick volume)
-        """
-
-        rates = terminal.copy_rates_range(
-            self.symbol,
-            terminal.TIMEFRAME_D1,
-            _time,
-            datetime.now()
-
+    @classmethod
+    def compile(cls, fields: dict) -> dict:
+        return super().compile(fields) | dict(
+            start_day=parse_days(fields["entry"]),
+            end_day=parse_days(fields["tp"]),
         )
-        return len(rates)
 
     def info(self):
         ...
 
     def check_signal_time(self, _time):
         signal_time = parse_datetime(
-            (datetime.now().month, datetime.now().day),
+            (clock.now().month, clock.now().day),
             _time
         )
-        if datetime.now() < signal_time:
+        if clock.now() < signal_time:
             return
         return signal_time
 
-    def get_parse_time(self, hour_min: str):
-        _time = datetime.now()
-        hour, minute = map(int, hour_min.split(":"))
+    def get_parse_time(self, hour_min: tuple[int, int]):
+        _time = clock.now()
+        hour, minute = hour_min
         _time = _time.replace(hour=hour, minute=minute, second=0)
         return _time
 
+    def earliest_day(self, calendar, year: int, n: int) -> datetime:
+        """
+        The n-th trading day of the month didn't happen yet: every remaining trading day
+        takes at least one calendar day after the last D1 bar
+        """
+        start = datetime(year=year, month=self.month, day=1)
+        last = calendar.last_trading_day()
+        if last is None or last < start:
+            last = start - timedelta(days=1)
+        day = last + timedelta(days=n - calendar.trading_days_since(start))
+        hour, minute = self.open_hm if self.status is Status.init else self.close_hm
+        return day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    def next_check_time(self, now: datetime) -> datetime | None:
+        """
+        The signal is due at the open/close time of the earliest day when its entry or exit
+        trading day can come (or at the start of its month), after that once a day
+        """
+        if self.status is Status.close:
+            return None
+        if self.status is Status.init and self.month != now.month:
+            return month_start(self.month, now)
+        if self.due is not None and self.due > now:
+            return self.due
+        signal_time = self.get_parse_time(
+            self.open_hm if self.status is Status.init else self.close_hm)
+        if signal_time <= now:
+            signal_time += timedelta(days=1)
+        return signal_time
+
     def check(self, terminal: mt5):
-        signal_date = datetime(
-            year=datetime.now().year,
-            month=self.month,
-            day=1
-        )
-        work_day_in_month = self.get_signal_trading_days(
-            terminal,
-            signal_date
-        )
-        print(f"Working day in month: {work_day_in_month}")
+        now = clock.now()
         match self.status:
             case Status.init:
-                condition = work_day_in_month >= self.start_day and self.month == datetime.now().month
+                if self.month != now.month:
+                    return None
+                n = self.start_day
             case Status.open:
-                condition = work_day_in_month >= self.end_day
-            case Status.close:
-                condition = False
-        # condition = (work_day_in_month >= self.start_day
-        #              if self.status == Status.init
-        #              else work_day_in_month >= self.end_day)
-        if not condition: return None
+                n = self.end_day
+            case _:
+                return None
+        calendar = terminal.calendar(self.symbol, datetime(year=now.year, month=self.month, day=1))
+        # День входа ищется в месяце сигнала, счёт дней выхода может перейти в следующий месяц
+        day = calendar.nth_trading_day(now.year, self.month, n, within_month=self.status is Status.init)
+        # Формируется только при включённом DEBUG
+        logger.debug("[%s] Trading day %s of the month: %s", self.magic, n, day)
+        if day is None:
+            self.due = self.earliest_day(calendar, now.year, n)
+            return None
+        self.due = None
 
         signal_time = self.get_parse_time(
-            self.open_time if self.status == Status.init else self.close_time)
+            self.open_hm if self.status == Status.init else self.close_hm)
 
-        if datetime.now() > signal_time:
+        if clock.now() > signal_time:
             if self.status == Status.init:
                 logger.info(f"Return responce open")
                 return self.response_open(terminal)
@@ -330,16 +374,27 @@ class BreakoutSignal(BaseSignal):
         super().__init__(**data)
         self.update()
 
+    @classmethod
+    def compile(cls, fields: dict) -> dict:
+        return super().compile(fields) | dict(end_day=parse_days(fields["tp"]))
+
     def update(self):
-        self.end_day = int(self.tp.split(" ")[0])
         self.start_day = datetime(
-            year=datetime.now().year,
+            year=clock.now().year,
             month=self.month,
             day=1
         )
 
     def info(self):
         ...
+
+    def next_check_time(self, now: datetime) -> datetime | None:
+        if self.status is Status.init and self.month != now.month:
+            return month_start(self.month, now)
+        if self.status is Status.close:
+            return None
+        return now
+
     def check_counter(self,terminal):
         self.counter += 1
         if self.counter > 3600*24:
@@ -356,27 +411,24 @@ class BreakoutSignal(BaseSignal):
             )
 
     def check(self, terminal: mt5) -> ResponseOpen | ResponseClose | None:
-        if self.prev_high is None or self.prev_low is None:
-            prev_bar = terminal.copy_rates_from_pos(self.symbol,
-                                                    terminal.TIMEFRAME_MN1,
-                                                    1, 1)[0]
-            self.prev_high = prev_bar[2]
-            self.prev_low = prev_bar[3]
+        self.prev_high, self.prev_low = terminal.calendar(
+            self.symbol).previous_month_range(terminal)
         if self.status is Status.init:
-            if datetime.now() > self.start_day and self.month == datetime.now().month:
+            if clock.now() > self.start_day and self.month == clock.now().month:
                 tick: Tick = terminal.symbol_info_tick(self.symbol)
-                # condition = (tick.bid > self.prev_high
-                #              if self.entry == "PMH"
-                #              else tick.ask < self.prev_low)
-                condition = True
+                if tick is None:
+                    return None
+                condition = (tick.bid > self.prev_high
+                             if self.entry == "PMH"
+                             else tick.ask < self.prev_low)
                 if condition:
-                    message = (
-                        f"{self} send request bid price: {tick.bid} > {self.prev_high}"
-                        if self.entry == "PMH"
-                        else f"send request ask price{tick.ask} < {self.prev_low}"
-                    )
-                    logger.info(message)
-                    self.signal_time = datetime.now()
+                    if self.entry == "PMH":
+                        logger.info("%s [%s] send request bid price: %s > %s",
+                                    self.__class__.__name__, self.magic, tick.bid, self.prev_high)
+                    else:
+                        logger.info("%s [%s] send request ask price: %s < %s",
+                                    self.__class__.__name__, self.magic, tick.ask, self.prev_low)
+                    self.signal_time = clock.now()
                     return self.response_open(terminal)
 
         if self.status is Status.open:
@@ -391,7 +443,7 @@ class BreakoutSignal(BaseSignal):
             ) + 1
 
             if work_day_in_month > self.end_day:
-                if datetime.now() > self.signal_time:
+                if clock.now() > self.signal_time:
                     return self.response_close()
 
     def get_signal_trading_days(
@@ -402,24 +454,55 @@ class BreakoutSignal(BaseSignal):
         """
         Return trading days from selected date
 
-        :param terminal: Terminal for interaction with MT5 API and getting rates
+        :param terminal: MarketSnapshot that keeps trading calendars of symbols
         :param _time: datetime variable from what date start gathering
         :return: Count of working days (bars that have minimum 1 tick volume)
         """
-        rates = terminal.copy_rates_range(
-            self.symbol,
-            terminal.TIMEFRAME_D1,
-            _time,
-            datetime.now()
-
-        )
-        return len(rates)
+        return terminal.calendar(self.symbol, _time).trading_days_since(_time)
 
     def check_signal_time(self, _time):
         signal_time = parse_datetime(
-            (datetime.now().month, datetime.now().day),
+            (clock.now().month, clock.now().day),
             _time
         )
-        if datetime.now() < signal_time:
+        if clock.now() < signal_time:
             return
         return signal_time
+
+
+SIGNAL_TYPES = {
+    "Seasonal": SeasonalSignal,
+    "Short-term": ShortTermSignal,
+}
+
+
+def f(dig: str):
+    return float(dig.replace(',', '.'))
+
+
+def signal_type(name: str):
+    return SIGNAL_TYPES.get(name, BreakoutSignal)
+
+
+def signal_fields(data: dict) -> dict:
+    """
+    Convert a csv row to signal fields, including the precompiled parts of entry/tp and times
+    """
+    fields = dict(
+        magic=int(data['Magic Number']),
+        month=int(data['Month']),
+        symbol=data['Symbol'],
+        entry=data['Entry'],
+        tp=data["TP"],
+        sl=f(data['SL']),
+        sl_type=StoplossType.percentage if data['SL Type'] == "Percentage" else StoplossType.points,
+        risk=f(data['Risk']),
+        direction=OrderDirection.long if data['Direction'] == "Long" else OrderDirection.short,
+        open_time=data['Open Time'] if data['Open Time'] else None,
+        close_time=data['Close Time'] if data['Close Time'] else None,
+    )
+    return fields | signal_type(data.get("Type")).compile(fields)
+
+
+def create_signal(data: dict) -> BaseSignal:
+    return signal_type(data.get("Type"))(**signal_fields(data))
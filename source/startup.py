@@ -0,0 +1,146 @@
+"""
+Cold start of the expert: import-time profile and start-up budget.
+
+--imports imports the expert in a fresh interpreter with ``python -X importtime``
+and prints the modules with the largest import time:
+
+    python startup.py --imports --top 20
+
+--budget launches the expert on the fake terminal in new processes and measures
+the time from the process launch to the end of the first check_signals() cycle,
+split into interpreter and imports, Expert() and the first cycle. The exit code
+is 1 when the median of the runs is over the budget, so the check can run in CI:
+
+    python startup.py --budget 2.0 --signals 1000 --runs 5
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SOURCE_DIR = Path(__file__).parent
+# Без терминала MetaTrader5 (Linux, CI) импортируется fake_mt5, он тоже тянет numpy, как и MetaTrader5
+IMPORT_EXPERT = "import expert" if importlib.util.find_spec("MetaTrader5") else \
+    "import fake_mt5; fake_mt5.install(); import expert"
+
+
+def import_profile(workdir: Path) -> list[tuple[str, int, int, int]]:
+    """
+    :return: (module, depth, self us, cumulative us) in the order of python -X importtime
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_EXPERT],
+        cwd=workdir, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": str(SOURCE_DIR)})
+    if result.returncode:
+        raise RuntimeError(f"Import of the expert failed:\n{result.stderr}")
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), depth, int(own), int(cumulative)))
+    return modules
+
+
+def report_imports(top: int):
+    with tempfile.TemporaryDirectory() as workdir:
+        modules = import_profile(Path(workdir))
+    total = sum(cumulative for _, depth, _, cumulative in modules if depth == 0)
+    print(f"total import time: {total / 1000:.1f} ms, {len(modules)} modules")
+    print(f"\n{'top-level imports':<40} {'cumulative_ms':>14}")
+    for name, _, _, cumulative in sorted((m for m in modules if m[1] == 0), key=lambda m: -m[3])[:top]:
+        print(f"{name:<40} {cumulative / 1000:>14.1f}")
+    print(f"\n{'own time of a module':<40} {'self_ms':>14} {'cumulative_ms':>14}")
+    for name, _, own, cumulative in sorted(modules, key=lambda m: -m[2])[:top]:
+        print(f"{name:<40} {own / 1000:>14.1f} {cumulative / 1000:>14.1f}")
+
+
+def child(csv_file: Path, journal_file: Path):
+    """
+    Body of a measured launch: the same steps as Expert().main() up to the first cycle
+    """
+    import fake_mt5
+    fake_mt5.install()
+    from expert import Expert
+
+    imported = time.time()
+    expert = Expert(csv_file=csv_file, path="fake", journal_file=journal_file, cache_dir=csv_file.parent / "cache")
+    created = time.time()
+    expert.check_signals()
+    done = time.time()
+    expert.dispatcher.shutdown()
+    print(json.dumps({"imported": imported, "created": created, "done": done, "signals": len(expert.signals)}))
+
+
+def launch(csv_file: Path, journal_file: Path, workdir: Path) -> dict:
+    start = time.time()
+    result = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--child", str(csv_file), str(journal_file)],
+        cwd=workdir, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"Launch of the expert failed:\n{result.stderr}")
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        "signals": marks["signals"],
+        "imports_ms": (marks["imported"] - start) * 1000,
+        "init_ms": (marks["created"] - marks["imported"]) * 1000,
+        "cycle_ms": (marks["done"] - marks["created"]) * 1000,
+        "total_ms": (marks["done"] - start) * 1000,
+    }
+
+
+def check_budget(budget: float, count: int, runs: int) -> bool:
+    """
+    :param budget: seconds from the process launch to the end of the first cycle
+    :return: True when the median launch fits the budget
+    """
+    from benchmark import generate_signals
+
+    columns = ("run", "signals", "imports_ms", "init_ms", "cycle_ms", "total_ms")
+    print(" ".join(f"{column:>12}" for column in columns))
+    totals = []
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        csv_file = workdir / "signals.csv"
+        generate_signals(csv_file, count)
+        for run in range(1, runs + 1):
+            # Первый запуск без журнала, следующие восстанавливают состояние из него, как после перезапуска
+            result = {"run": run, **launch(csv_file, workdir / "journal.sqlite", workdir)}
+            totals.append(result["total_ms"])
+            print(" ".join(
+                f"{result[column]:>12.1f}" if isinstance(result[column], float) else f"{result[column]:>12}"
+                for column in columns))
+    median = statistics.median(totals)
+    fits = median <= budget * 1000
+    print(f"median cold start {median:.0f} ms, budget {budget * 1000:.0f} ms: {'ok' if fits else 'OVER BUDGET'}")
+    return fits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imports", action="store_true", help="print the import-time profile")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget", type=float, help="seconds from launch to the end of the first cycle")
+    parser.add_argument("--signals", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", nargs=2, metavar=("CSV", "JOURNAL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(Path(args.child[0]), Path(args.child[1]))
+        return
+    if args.imports or args.budget is None:
+        report_imports(args.top)
+    if args.budget is not None and not check_budget(args.budget, args.signals, args.runs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Supervisor of several trading accounts on one host.
+
+The MetaTrader5 API binds one terminal per process, so every account runs its
+own Expert in a separate worker process pinned to a CPU core. The supervisor
+restarts workers that crashed or stopped sending heartbeats and collects their
+health and cycle latency into logs/supervisor_status.json.
+
+Accounts are read from config/accounts.csv:
+
+    Terminal Path;File Name
+    C:\\Program Files\\FTMO MT5\\terminal64.exe;FTMO Test-FTMO
+    C:\\Program Files\\Admiral Markets MT5\\terminal64.exe;1
+
+File Name is the signal file in files/ without .csv, an optional Name column
+sets the name of the worker and of its log file. Without accounts.csv the single
+account from config/.env (TERMINAL_PATH, FILE_NAME) is supervised.
+
+    python supervisor.py
+    python supervisor.py --accounts config/accounts.csv --no-pin
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import time
+from pathlib import Path
+
+from pydantic import BaseModel
+
+ROOT = Path(__file__).parent.parent
+ACCOUNTS_FILE = ROOT / "config" / "accounts.csv"
+# Рядом с логами (utils.logger_config.LOG_DIR)
+STATUS_FILE = Path("logs") / "supervisor_status.json"
+
+
+class Account(BaseModel):
+    name: str
+    terminal_path: str | None = None
+    csv_file: Path
+
+
+def read_accounts(path: Path = ACCOUNTS_FILE) -> list[Account]:
+    if not path.exists():
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path=ROOT / "config" / ".env")
+        name = os.getenv("FILE_NAME")
+        return [Account(name=name, terminal_path=os.getenv("TERMINAL_PATH"), csv_file=ROOT / "files" / f"{name}.csv")]
+    with path.open(newline="", encoding="utf-8-sig") as file:
+        return [
+            Account(
+                name=row.get("Name") or row["File Name"],
+                terminal_path=row["Terminal Path"] or None,
+                csv_file=ROOT / "files" / f"{row['File Name']}.csv",
+            )
+            for row in csv.DictReader(file, delimiter=";")
+        ]
+
+
+def pin_to_core(core: int) -> bool:
+    """
+    Bind the current process to one CPU core, returns False when the OS doesn't allow it
+    """
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, {core})
+            return True
+        if os.name == "nt":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetProcessAffinityMask(kernel32.GetCurrentProcess(), 1 << core))
+    except OSError:
+        pass
+    return False
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+class Reporter:
+    """
+    Collects cycle latencies of the expert in the worker and sends them to the
+    supervisor once per ``interval`` seconds. The report is also the heartbeat
+    """
+
+    def __init__(self, account: Account, expert, messages, interval: float = 5):
+        self.account = account
+        self.expert = expert
+        self.messages = messages
+        self.interval = interval
+        self.latencies: list[float] = []
+        self.cycles = 0
+        self._next_report = 0.0
+
+    def cycle(self, duration: float):
+        self.latencies.append(duration)
+        self.cycles += 1
+        if time.monotonic() >= self._next_report:
+            self.report()
+
+    def report(self):
+        expert = self.expert
+        latencies = self.latencies or [0.0]
+        self.messages.put({
+            "account": self.account.name,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "cycles": self.cycles,
+            "window_cycles": len(self.latencies),
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "max_ms": max(latencies) * 1000,
+            "signals": len(expert.signals),
+            "session": expert.session.stats(),
+            "dispatcher": expert.dispatcher.stats(),
+            "market": expert.market.stats(),
+            "tick_feed": expert.tick_feed.stats() if expert.tick_feed is not None else None,
+        })
+        self.latencies = []
+        self._next_report = time.monotonic() + self.interval
+
+
+def run_worker(account: Account, index: int, core: int | None, messages, report_interval: float, fake: bool):
+    """
+    Entry point of a worker process: one Expert for one terminal
+    :param index: position of the account in the accounts file, offsets METRICS_PORT
+    """
+    # Каждый счёт пишет в свой лог
+    os.environ["LOG_FILE"] = f"{account.name}.log"
+    if os.getenv("METRICS_FILE"):
+        metrics = Path(os.environ["METRICS_FILE"])
+        os.environ["METRICS_FILE"] = str(metrics.with_stem(f"{metrics.stem}_{account.name}"))
+    if int(os.getenv("METRICS_PORT", 0)):
+        # Каждый счёт слушает свой порт: METRICS_PORT + номер счёта
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + index)
+    if core is not None:
+        pin_to_core(core)
+    if fake:
+        import fake_mt5
+        fake_mt5.install()
+    from expert import Expert
+
+    expert = Expert(csv_file=account.csv_file, path=account.terminal_path)
+    reporter = Reporter(account, expert, messages, report_interval)
+    reporter.report()
+    expert.main(on_cycle=reporter.cycle)
+
+
+class Worker:
+    """
+    State of one account in the supervisor
+    """
+
+    def __init__(self, account: Account, index: int, core: int | None):
+        self.account = account
+        self.index = index
+        self.core = core
+        self.process: multiprocessing.Process | None = None
+        self.started = 0.0
+        self.last_heartbeat = 0.0
+        self.restarts = 0
+        self.next_start = 0.0
+        self.delay = 0.0
+        self.last_exit: int | None = None
+        self.report: dict = {}
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def status(self) -> dict:
+        return {
+            "account": self.account.name,
+            "pid": self.process.pid if self.process else None,
+            "alive": self.alive(),
+            "core": self.core,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "uptime": time.time() - self.started if self.alive() else 0,
+            "heartbeat_age": time.time() - self.last_heartbeat if self.last_heartbeat else None,
+            **{key: value for key, value in self.report.items() if key not in ("account", "pid")},
+        }
+
+
+class Supervisor:
+    """
+    Starts a worker process per account, restarts dead and hung workers
+    with an exponential backoff and aggregates their reports
+    """
+
+    def __init__(
+            self,
+            accounts: list[Account],
+            pin: bool = True,
+            heartbeat_timeout: float = 180,
+            backoff: float = 5,
+            max_backoff: float = 300,
+            stable_after: float = 600,
+            report_interval: float = 5,
+            status_interval: float = 30,
+            fake: bool = False
+    ):
+        """
+        :param pin: pin every worker to its own core (round robin when there are more accounts than cores)
+        :param heartbeat_timeout: a worker without reports for this many seconds is killed and restarted,
+                                  must be longer than MAX_IDLE of the expert
+        :param backoff: first restart delay, doubled for every crash in a row
+        :param stable_after: a worker that lived this long before a crash restarts without delay growth
+        :param report_interval: how often workers report their cycle stats
+        :param status_interval: how often the aggregated status is logged and written to STATUS_FILE
+        :param fake: run the experts against the fake terminal (dry run)
+        """
+        # Логирование настраивается при импорте, после выбора LOG_FILE
+        from utils.logger_config import logger
+
+        self.logger = logger
+        cores = os.cpu_count() or 1
+        self.workers = [Worker(account, i, i % cores if pin else None) for i, account in enumerate(accounts)]
+        self.heartbeat_timeout = heartbeat_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.report_interval = report_interval
+        self.status_interval = status_interval
+        self.fake = fake
+        # spawn как на Windows: MetaTrader5 и потоки эксперта не переживают fork
+        self.context = multiprocessing.get_context("spawn")
+        self.messages = self.context.Queue()
+        self._next_status = 0.0
+        self._by_name = {worker.account.name: worker for worker in self.workers}
+
+    def start(self, worker: Worker):
+        process = self.context.Process(
+            target=run_worker,
+            args=(worker.account, worker.index, worker.core, self.messages, self.report_interval, self.fake),
+            name=f"expert-{worker.account.name}",
+            daemon=True,
+        )
+        process.start()
+        worker.process = process
+        worker.started = worker.last_heartbeat = time.time()
+        self.logger.info(f"Worker {worker.account.name} started, pid {worker.process.pid}, core {worker.core}")
+
+    def check(self, worker: Worker):
+        now = time.time()
+        if worker.process is None:
+            if now >= worker.next_start:
+                self.start(worker)
+            return
+        if worker.alive() and now - worker.last_heartbeat > self.heartbeat_timeout:
+            self.logger.error(
+                f"Worker {worker.account.name} sent no heartbeat for {now - worker.last_heartbeat:.0f} s, killing it")
+            worker.process.kill()
+            worker.process.join(5)
+        if worker.alive():
+            return
+
+        worker.last_exit = worker.process.exitcode
+        worker.process = None
+        worker.restarts += 1
+        if now - worker.started > self.stable_after:
+            worker.delay = self.backoff
+        else:
+            worker.delay = min(max(worker.delay * 2, self.backoff), self.max_backoff)
+        worker.next_start = now + worker.delay
+        self.logger.error(
+            f"Worker {worker.account.name} exited with code {worker.last_exit}, restart in {worker.delay:.0f} s")
+
+    def drain(self, timeout: float):
+        """
+        Receive worker reports, waiting up to ``timeout`` for the first one
+        """
+        try:
+            message = self.messages.get(timeout=timeout)
+            while True:
+                worker = self._by_name.get(message["account"])
+                if worker is not None:
+                    worker.report = message
+                    worker.last_heartbeat = time.time()
+                message = self.messages.get_nowait()
+        except queue.Empty:
+            pass
+
+    def status(self) -> dict:
+        workers = [worker.status() for worker in self.workers]
+        latencies = [worker["p95_ms"] for worker in workers if worker.get("p95_ms") is not None]
+        return {
+            "time": time.time(),
+            "workers": len(workers),
+            "alive": sum(worker["alive"] for worker in workers),
+            "restarts": sum(worker["restarts"] for worker in workers),
+            "signals": sum(worker.get("signals", 0) for worker in workers),
+            "worst_p95_ms": max(latencies) if latencies else None,
+            "accounts": workers,
+        }
+
+    def write_status(self):
+        status = self.status()
+        self.logger.info(
+            f"Supervisor: {status['alive']}/{status['workers']} workers alive, {status['restarts']} restarts, "
+            f"{status['signals']} signals, worst p95 cycle {status['worst_p95_ms'] or 0:.1f} ms")
+        STATUS_FILE.parent.mkdir(exist_ok=True)
+        tmp = STATUS_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(status, indent=2, default=str))
+        os.replace(tmp, STATUS_FILE)
+
+    def run(self):
+        try:
+            while True:
+                for worker in self.workers:
+                    self.check(worker)
+                self.drain(timeout=1)
+                if time.monotonic() >= self._next_status:
+                    self.write_status()
+                    self._next_status = time.monotonic() + self.status_interval
+        finally:
+            self.stop()
+
+    def stop(self):
+        for worker in self.workers:
+            if worker.alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(10)
+        self.logger.info("Supervisor stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=Path, default=ACCOUNTS_FILE)
+    parser.add_argument("--no-pin", action="store_true", help="don't pin workers to cores")
+    parser.add_argument("--heartbeat-timeout", type=float, default=180)
+    parser.add_argument("--status-interval", type=float, default=30)
+    parser.add_argument("--fake", action="store_true", help="dry run on the fake terminal")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_FILE", "supervisor.log")
+    supervisor = Supervisor(
+        read_accounts(args.accounts),
+        pin=not args.no_pin,
+        heartbeat_timeout=args.heartbeat_timeout,
+        status_interval=args.status_interval,
+        fake=args.fake,
+    )
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Instrumentation of terminal calls and expert cycles.
+
+Every MetaTrader5 call made through the wrapped terminal is counted and timed,
+failed calls are counted by error code and order results by retcode. The
+expert splits the duration of every cycle into reload and evaluate. Orders
+are sent by dispatcher threads outside of the cycle, the duration of every
+dispatcher job has its own histogram.
+Metrics are exported in the Prometheus text format through a local HTTP
+endpoint and/or a file rewritten periodically.
+
+Enabled with environment variables:
+    METRICS_PORT=9100              serve http://127.0.0.1:9100/metrics
+    METRICS_FILE=logs/metrics.prom write the file every METRICS_INTERVAL seconds (15)
+
+Without them from_env() returns NullTelemetry, which leaves the terminal
+unwrapped and whose timers do nothing.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from pathlib import Path
+
+from utils.logger_config import logger
+
+# Границы корзин гистограмм, сек
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Успешные коды order_check / order_send: 0, TRADE_RETCODE_PLACED, DONE, DONE_PARTIAL
+SUCCESS_RETCODES = frozenset((0, 10008, 10009, 10010))
+PHASES = ("reload", "evaluate")
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str = "") -> list[str]:
+        lines = []
+        total = 0
+        separator = "," if labels else ""
+        for bound, count in zip((*BUCKETS, "+Inf"), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {total}')
+        labels = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {self.sum:.6f}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class Phase:
+    """
+    Timer of one phase of the cycle, the time is added to the current cycle
+    """
+    __slots__ = ("telemetry", "name", "start")
+
+    def __init__(self, telemetry: "Telemetry", name: str):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.telemetry.add_phase(self.name, time.perf_counter() - self.start)
+
+
+class Dispatch:
+    """
+    Timer of one dispatcher job, observed on its own and not added to any cycle
+    """
+    __slots__ = ("telemetry", "start")
+
+    def __init__(self, telemetry: "Telemetry"):
+        self.telemetry = telemetry
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.telemetry.observe_dispatch(time.perf_counter() - self.start)
+
+
+class InstrumentedTerminal:
+    """
+    Proxy that times every call into the MetaTrader5 module.
+
+    Like LockedTerminal the wrapper of a function is created once and stored
+    on the proxy, constants and types are passed through as is.
+    """
+
+    def __init__(self, terminal, telemetry: "Telemetry"):
+        self.terminal = terminal
+        self.telemetry = telemetry
+
+    def __getattr__(self, name):
+        attr = getattr(self.terminal, name)
+        if not callable(attr) or isinstance(attr, type):
+            return attr
+        telemetry = self.telemetry
+        terminal = self.terminal
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                telemetry.observe_call(name, time.perf_counter() - start, type(e).__name__)
+                raise
+            elapsed = time.perf_counter() - start
+            error = None
+            if result is None or result is False:
+                error = terminal.last_error()[0]
+            else:
+                retcode = getattr(result, "retcode", None)
+                if retcode is not None:
+                    telemetry.observe_retcode(name, retcode)
+                    if retcode not in SUCCESS_RETCODES:
+                        error = retcode
+            telemetry.observe_call(name, elapsed, error)
+            return result
+
+        setattr(self, name, call)
+        return call
+
+
+class Telemetry:
+    """
+    Metrics registry shared by the expert and its dispatcher threads
+    """
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: dict[str, Histogram] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self.retcodes: dict[tuple[str, int], int] = {}
+        self.cycles = Histogram()
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.phase_totals = dict.fromkeys(PHASES, 0.0)
+        # Задания потоков диспетчера идут параллельно циклам и в их разбивку не входят
+        self.dispatches = Histogram()
+        # Время фаз текущего цикла
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.started = time.time()
+        # Функции, добавляющие свои строки метрик (состояние circuit breaker)
+        self.collectors: list = []
+        # ThreadingHTTPServer после serve()
+        self.server = None
+
+    def wrap(self, terminal):
+        return InstrumentedTerminal(terminal, self)
+
+    def phase(self, name: str) -> Phase:
+        return Phase(self, name)
+
+    def dispatch(self) -> Dispatch:
+        return Dispatch(self)
+
+    def add_collector(self, collector):
+        """
+        :param collector: callable returning lines in the Prometheus text format
+        """
+        self.collectors.append(collector)
+
+    def add_phase(self, name: str, seconds: float):
+        with self.lock:
+            self.current[name] += seconds
+
+    def observe_dispatch(self, seconds: float):
+        with self.lock:
+            self.dispatches.observe(seconds)
+
+    def observe_call(self, name: str, seconds: float, error=None):
+        with self.lock:
+            histogram = self.calls.get(name)
+            if histogram is None:
+                histogram = self.calls[name] = Histogram()
+            histogram.observe(seconds)
+            if error is not None:
+                key = (name, str(error))
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def observe_retcode(self, name: str, retcode: int):
+        with self.lock:
+            key = (name, retcode)
+            self.retcodes[key] = self.retcodes.get(key, 0) + 1
+
+    def observe_cycle(self, seconds: float):
+        """
+        Close the cycle: its duration and the time of every phase go into the histograms
+        """
+        with self.lock:
+            self.cycles.observe(seconds)
+            for name, value in self.current.items():
+                self.phases[name].observe(value)
+                self.phase_totals[name] += value
+                self.current[name] = 0.0
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [
+                "# HELP mt5_calls_total Calls into the MetaTrader5 terminal",
+                "# TYPE mt5_calls_total counter",
+            ]
+            lines += [f'mt5_calls_total{{function="{name}"}} {h.count}' for name, h in sorted(self.calls.items())]
+            lines += [
+                "# HELP mt5_call_seconds Latency of terminal calls",
+                "# TYPE mt5_call_seconds histogram",
+            ]
+            for name, histogram in sorted(self.calls.items()):
+                lines += histogram.render("mt5_call_seconds", f'function="{name}"')
+            lines += [
+                "# HELP mt5_errors_total Failed terminal calls by last_error() code, retcode or exception",
+                "# TYPE mt5_errors_total counter",
+            ]
+            lines += [f'mt5_errors_total{{function="{name}",code="{code}"}} {count}'
+                      for (name, code), count in sorted(self.errors.items())]
+            lines += [
+                "# HELP mt5_retcodes_total Trade server return codes",
+                "# TYPE mt5_retcodes_total counter",
+            ]
+            lines += [f'mt5_retcodes_total{{function="{name}",retcode="{retcode}"}} {count}'
+                      for (name, retcode), count in sorted(self.retcodes.items())]
+            lines += [
+                "# HELP expert_cycle_seconds Duration of event loop cycles",
+                "# TYPE expert_cycle_seconds histogram",
+            ]
+            lines += self.cycles.render("expert_cycle_seconds")
+            lines += [
+                "# HELP expert_phase_seconds Time of a phase in one cycle",
+                "# TYPE expert_phase_seconds histogram",
+            ]
+            for name, histogram in self.phases.items():
+                lines += histogram.render("expert_phase_seconds", f'phase="{name}"')
+            lines += [
+                "# HELP expert_phase_seconds_total Time spent in a phase since start",
+                "# TYPE expert_phase_seconds_total counter",
+            ]
+            lines += [f'expert_phase_seconds_total{{phase="{name}"}} {value:.6f}'
+                      for name, value in self.phase_totals.items()]
+            lines += [
+                "# HELP expert_dispatch_seconds Duration of dispatcher jobs sending orders",
+                "# TYPE expert_dispatch_seconds histogram",
+            ]
+            lines += self.dispatches.render("expert_dispatch_seconds")
+            lines += [
+                "# TYPE expert_start_time_seconds gauge",
+                f"expert_start_time_seconds {self.started:.0f}",
+            ]
+        for collector in self.collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """
+        Serve the metrics on http://host:port/metrics in a background thread
+        """
+        # http.server тянет email и ssl, импортируется только когда endpoint включён
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logger.error(f"Metrics endpoint on port {port} was not started: {e}")
+            return
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Metrics are served on http://{host}:{port}/metrics")
+
+    def write(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
+
+    def export_file(self, path: Path, interval: float):
+        """
+        Rewrite the metrics file every ``interval`` seconds in a background thread
+        """
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write(path)
+                except OSError as e:
+                    logger.error(f"Metrics file {path} was not written: {e}")
+
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+        logger.info(f"Metrics are written to {path} every {interval:.0f} s")
+
+
+class NullTelemetry:
+    """
+    Disabled telemetry: the terminal isn't wrapped and timers are shared no-op contexts
+    """
+    enabled = False
+    _phase = nullcontext()
+
+    def wrap(self, terminal):
+        return terminal
+
+    def phase(self, name: str):
+        return self._phase
+
+    def dispatch(self):
+        return self._phase
+
+    def add_collector(self, collector):
+        pass
+
+    def add_phase(self, name: str, seconds: float):
+        pass
+
+    def observe_cycle(self, seconds: float):
+        pass
+
+
+def from_env() -> Telemetry | NullTelemetry:
+    port = int(os.getenv("METRICS_PORT", 0))
+    file = os.getenv("METRICS_FILE")
+    if not port and not file:
+        return NullTelemetry()
+    telemetry = Telemetry()
+    if port:
+        telemetry.serve(port)
+    if file:
+        telemetry.export_file(Path(file), float(os.getenv("METRICS_INTERVAL", 15)))
+    return telemetry
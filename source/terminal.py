@@ -1,16 +1,25 @@
 import MetaTrader5 as mt5
 from MetaTrader5 import SymbolInfo
 from signals import SeasonalSignal,ShortTermSignal,BreakoutSignal
+from session import TerminalSession
+from filling import FillingModeCache
 
 
 class Terminal:
     path = 'C:\\Program Files\\Admiral Markets MT5\\terminal64.exe'
-    def __init__(self):
-        self.terminal = mt5
+    def __init__(self, session: TerminalSession | None = None, telemetry=None):
+        """
+        :param telemetry: telemetry.Telemetry that times terminal calls, None leaves them as is
+        """
+        self.terminal = telemetry.wrap(mt5) if telemetry is not None else mt5
+        # A session passed from outside (for example Expert.session) stays attached on exit
+        self.own_session = session is None
+        self.session = session or TerminalSession(self.terminal, self.path)
+        self.filling = FillingModeCache(self.terminal)
 
 
     def __enter__(self):
-        if not self.terminal.initialize(path=self.path):
+        if not self.session.ensure():
             print("initialize() failed, error code =", mt5.last_error())
             quit()
         return self
@@ -25,22 +34,7 @@ class Terminal:
         """
         The MetaTrader5 library doesn't find the filling mode correctly for a lot of brokers
         """
-        for i in range(2):
-            request = {
-                "action": mt5.TRADE_ACTION_DEAL,
-                "symbol": symbol,
-                "volume": mt5.symbol_info(symbol).volume_min,
-                "type": mt5.ORDER_TYPE_BUY,
-                "price": mt5.symbol_info_tick(symbol).ask,
-                "type_filling": i,
-                "type_time": mt5.ORDER_TIME_GTC}
-
-            result = mt5.order_check(request)
-
-            if result.comment == "Done":
-                break
-
-        return i
+        return self.filling.get(symbol)
 
 
     def buy(self,signal:SeasonalSignal):
@@ -49,8 +43,8 @@ class Terminal:
         filling_type = self.find_filling_mode(symbol)
         symbol_info: SymbolInfo = self.terminal.symbol_info(symbol).ask
         lot = 0.1
-        point = mt5.symbol_info(symbol).point
-        price = mt5.symbol_info_tick(symbol).ask
+        point = self.terminal.symbol_info(symbol).point
+        price = self.terminal.symbol_info_tick(symbol).ask
         deviation = 20
         request = {
             "action": mt5.TRADE_ACTION_DEAL,
@@ -81,4 +75,5 @@ class Terminal:
                         print("       traderequest: {}={}".format(tradereq_filed, traderequest_dict[tradereq_filed]))
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.terminal.shutdown()
+        if self.own_session:
+            self.session.shutdown()
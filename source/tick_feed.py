@@ -0,0 +1,230 @@
+"""
+Streaming tick feed for breakout signals.
+
+Instead of asking symbol_info_tick() for every breakout signal every second,
+the feed pulls only the new ticks of every subscribed symbol with
+copy_ticks_from() from a last-seen time cursor, keeps them in a fixed-size
+ring buffer per symbol and reports the signals whose previous month high or
+low was crossed by one of the ticks the signal hasn't seen yet, including the
+ticks pulled before the signal was handed over to the feed.
+"""
+import numpy as np
+
+from utils.logger_config import logger
+
+TICK_DTYPE = np.dtype([("time_msc", "<i8"), ("bid", "<f8"), ("ask", "<f8")])
+# COPY_TICKS_INFO: только изменения bid/ask
+COPY_TICKS_INFO = 1
+
+
+class TickRing:
+    """
+    Last ``capacity`` ticks of one symbol
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.data = np.zeros(capacity, dtype=TICK_DTYPE)
+        self.capacity = capacity
+        # Позиция следующей записи и число записанных тиков
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, ticks: np.ndarray):
+        """
+        :param ticks: array with time_msc, bid and ask fields, oldest first
+        """
+        n = len(ticks)
+        if n >= self.capacity:
+            ticks = ticks[-self.capacity:]
+            n = self.capacity
+        end = self.head + n
+        first = min(end, self.capacity) - self.head
+        for name in TICK_DTYPE.names:
+            self.data[name][self.head:self.head + first] = ticks[name][:first]
+            self.data[name][:n - first] = ticks[name][first:]
+        self.head = end % self.capacity
+        self.count += n
+
+    def values(self) -> np.ndarray:
+        """
+        Stored ticks in time order (a copy)
+        """
+        if self.count < self.capacity:
+            return self.data[:self.head].copy()
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+    def last_time(self) -> int | None:
+        if not self.count:
+            return None
+        return int(self.data["time_msc"][self.head - 1])
+
+
+class Watchers:
+    """
+    Breakout levels of the signals on one symbol as arrays
+    """
+
+    def __init__(self):
+        self.levels: dict[int, tuple[float, bool]] = {}
+        # time_msc последнего тика, который видел сигнал: при проверке или при прошлом опросе
+        self.seen: dict[int, int] = {}
+        self._arrays: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+
+    def set(self, magic: int, level: float, above: bool, seen: int):
+        self.seen[magic] = seen
+        if self.levels.get(magic) != (level, above):
+            self.levels[magic] = (level, above)
+            self._arrays = None
+
+    def remove(self, magic: int):
+        self.seen.pop(magic, None)
+        if self.levels.pop(magic, None) is not None:
+            self._arrays = None
+
+    def oldest(self) -> int:
+        return min(self.seen.values())
+
+    def advance(self, time_msc: int):
+        for magic in self.seen:
+            self.seen[magic] = time_msc
+
+    def crossed(self, ticks: np.ndarray) -> np.ndarray:
+        """
+        Magic numbers of signals whose high is below the bid or whose low is above the ask
+        of a tick newer than the last one seen by the signal
+        :param ticks: ticks of the symbol in time order
+        """
+        if self._arrays is None:
+            self._arrays = (
+                np.fromiter(self.levels.keys(), dtype=np.int64, count=len(self.levels)),
+                np.fromiter((level for level, _ in self.levels.values()), dtype=float, count=len(self.levels)),
+                np.fromiter((above for _, above in self.levels.values()), dtype=bool, count=len(self.levels)),
+            )
+        magic, level, above = self._arrays
+        seen = np.fromiter((self.seen[m] for m in self.levels), dtype=np.int64, count=len(self.levels))
+        # Максимум bid и минимум ask от каждого тика до конца, за последним тиком пустой хвост
+        max_bid = np.append(np.maximum.accumulate(ticks["bid"][::-1])[::-1], -np.inf)
+        min_ask = np.append(np.minimum.accumulate(ticks["ask"][::-1])[::-1], np.inf)
+        start = np.searchsorted(ticks["time_msc"], seen, side="right")
+        return magic[np.where(above, max_bid[start] > level, min_ask[start] < level)]
+
+
+class TickFeed:
+    """
+    Incremental tick ingestion for the symbols of watched breakout signals
+    """
+
+    def __init__(self, terminal, capacity: int = 4096, batch: int = 10000):
+        """
+        :param terminal: MetaTrader5 module or MarketSnapshot
+        :param capacity: ticks kept per symbol
+        :param batch: ticks requested by one copy_ticks_from() call
+        """
+        self.terminal = terminal
+        self.capacity = capacity
+        self.batch = batch
+        self.rings: dict[str, TickRing] = {}
+        # time_msc последнего полученного тика, время сервера
+        self.cursors: dict[str, int] = {}
+        self.watchers: dict[str, Watchers] = {}
+        self._symbols: dict[int, str] = {}
+        self.ticks = 0
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def watch(self, magic: int, symbol: str, high: float | None, low: float | None, above: bool,
+              seen: int | None = None) -> bool:
+        """
+        Wake the signal when a tick crosses its level: bid above ``high`` or ask below ``low``
+        :param seen: time_msc of the tick the signal was checked with, newer ticks already
+            in the ring are checked by the next poll. By default only ticks pulled from now on count
+        :return: False when the symbol has no ticks and the signal has to be polled
+        """
+        level = high if above else low
+        if level is None:
+            self.unwatch(magic)
+            return False
+        if self._symbols.get(magic, symbol) != symbol:
+            self.unwatch(magic)
+        if symbol not in self.cursors and not self.subscribe(symbol):
+            return False
+        if seen is None:
+            seen = self.cursors[symbol]
+        self.watchers.setdefault(symbol, Watchers()).set(magic, level, above, seen)
+        self._symbols[magic] = symbol
+        return True
+
+    def unwatch(self, magic: int):
+        symbol = self._symbols.pop(magic, None)
+        if symbol is None:
+            return
+        watchers = self.watchers[symbol]
+        watchers.remove(magic)
+        if not watchers.levels:
+            # Символ без сигналов больше не запрашивается
+            del self.watchers[symbol]
+            self.cursors.pop(symbol, None)
+            self.rings.pop(symbol, None)
+
+    def subscribe(self, symbol: str) -> bool:
+        """
+        Start the cursor at the current tick, older ticks can't trigger anything
+        """
+        tick = self.terminal.symbol_info_tick(symbol)
+        if tick is None:
+            logger.warning(f"Tick feed: no tick for {symbol}, breakout signals are polled")
+            return False
+        self.cursors[symbol] = tick.time_msc
+        self.rings[symbol] = TickRing(self.capacity)
+        return True
+
+    def pull(self, symbol: str) -> np.ndarray:
+        """
+        Ticks of the symbol newer than the cursor
+        """
+        cursor = self.cursors[symbol]
+        parts = []
+        while True:
+            ticks = self.terminal.copy_ticks_from(symbol, cursor // 1000, self.batch, COPY_TICKS_INFO)
+            if ticks is None or not len(ticks):
+                break
+            received = len(ticks)
+            # Запрос идёт с точностью до секунды, уже полученные тики отбрасываются
+            ticks = ticks[ticks["time_msc"] > cursor]
+            if not len(ticks):
+                break
+            parts.append(ticks)
+            cursor = int(ticks["time_msc"][-1])
+            if received < self.batch:
+                break
+        self.cursors[symbol] = cursor
+        if not parts:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def poll(self) -> list[int]:
+        """
+        Pull new ticks of every watched symbol into its ring
+        :return: magic numbers of signals whose level was crossed by a tick they haven't seen
+        """
+        crossed = []
+        for symbol, watchers in list(self.watchers.items()):
+            ring = self.rings[symbol]
+            ticks = self.pull(symbol)
+            if len(ticks):
+                self.ticks += len(ticks)
+                ring.append(ticks)
+            last = ring.last_time()
+            # Без новых тиков проверяются только сигналы, переданные после тиков, уже лежащих в буфере
+            if last is None or watchers.oldest() >= last:
+                continue
+            crossed.extend(int(magic) for magic in watchers.crossed(ring.values()))
+            watchers.advance(last)
+        return crossed
+
+    def stats(self) -> dict:
+        return {"symbols": len(self.watchers), "signals": len(self._symbols), "ticks": self.ticks}
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from utils import clock
+
+
+class TradingCalendar:
+    """
+    Trading days of one symbol built from its D1 bars.
+
+    Bars are downloaded once and afterwards only the newest bars are appended,
+    at most once per ``refresh_interval`` seconds. Questions about trading days
+    are answered with a binary search over the array of bar open times.
+    """
+    history_days = 400
+
+    def __init__(self, symbol: str, refresh_interval: float = 60, store=None):
+        """
+        :param store: bar_store.BarStore, the history of closed bars is read from it instead of the terminal
+        """
+        self.symbol = symbol
+        self.refresh_interval = refresh_interval
+        self.store = store
+        self.times = np.empty(0, dtype=np.int64)
+        self.start: int | None = None
+        self._next_sync = 0.0
+        self._month: tuple[int, int] | None = None
+        self._prev_month_range: tuple[float, float] | None = None
+
+    def sync(self, terminal, since: datetime | None = None):
+        """
+        Append bars that appeared after the last loaded one.
+        History is loaded again only when ``since`` is older than the loaded range
+        """
+        now = clock.now()
+        if since is not None and (self.start is None or since.timestamp() < self.start):
+            since = min(since, now - timedelta(days=self.history_days))
+            if self.store is not None:
+                rates = self.store.rates_range(terminal, self.symbol, terminal.TIMEFRAME_D1, since, now)
+            else:
+                rates = terminal.copy_rates_range(self.symbol, terminal.TIMEFRAME_D1, since, now)
+            if rates is not None:
+                self.times = np.asarray(rates["time"], dtype=np.int64)
+                self.start = int(since.timestamp())
+                self._next_sync = now.timestamp() + self.refresh_interval
+            return
+
+        if now.timestamp() < self._next_sync:
+            return
+        if self.start is None:
+            return self.sync(terminal, now - timedelta(days=self.history_days))
+
+        last = datetime.fromtimestamp(self.times[-1]) if len(self.times) else datetime.fromtimestamp(self.start)
+        rates = terminal.copy_rates_range(self.symbol, terminal.TIMEFRAME_D1, last, now)
+        if rates is not None and len(rates):
+            new = np.asarray(rates["time"], dtype=np.int64)
+            # The last known bar comes again, keep only bars after it
+            keep = np.searchsorted(self.times, new[0], side="left")
+            self.times = np.concatenate((self.times[:keep], new))
+        self._next_sync = now.timestamp() + self.refresh_interval
+
+    def trading_days_since(self, _time: datetime) -> int:
+        """
+        Count of D1 bars opened from ``_time`` till now
+        """
+        first = np.searchsorted(self.times, int(_time.timestamp()), side="left")
+        last = np.searchsorted(self.times, int(clock.now().timestamp()), side="right")
+        return int(max(last - first, 0))
+
+    def nth_trading_day(self, year: int, month: int, n: int, within_month: bool = True) -> datetime | None:
+        """
+        Date of the n-th (starting from 1) trading day counted from the start of the month,
+        None if it didn't happen yet
+        :param within_month: None when the month ends before the n-th day, otherwise the count goes on
+        """
+        month_start = datetime(year=year, month=month, day=1)
+        first = np.searchsorted(self.times, int(month_start.timestamp()), side="left")
+        end = len(self.times)
+        if within_month:
+            month_end = (month_start + timedelta(days=32)).replace(day=1)
+            end = np.searchsorted(self.times, int(month_end.timestamp()), side="left")
+        if n < 1 or first + n - 1 >= end:
+            return None
+        return datetime.fromtimestamp(self.times[first + n - 1])
+
+    def last_trading_day(self) -> datetime | None:
+        return datetime.fromtimestamp(self.times[-1]) if len(self.times) else None
+
+    def previous_month_range(self, terminal) -> tuple[float, float]:
+        """
+        High and low of the previous MN1 bar, requested again when the month changes
+        """
+        now = clock.now()
+        month = (now.year, now.month)
+        if self._prev_month_range is None or self._month != month:
+            prev_bar = None
+            if self.store is not None:
+                # Закрытые месячные бары берутся из хранилища, у терминала запрашивается только текущий
+                rates = self.store.rates_range(
+                    terminal, self.symbol, terminal.TIMEFRAME_MN1, now - timedelta(days=self.history_days), now)
+                if rates is not None and len(rates):
+                    # Бар текущего месяца в первый день месяца может ещё не появиться, бар выбирается по времени
+                    prev_start = (datetime(now.year, now.month, 1) - timedelta(days=1)).replace(day=1)
+                    found = rates[rates["time"] == int(prev_start.timestamp())]
+                    if len(found):
+                        prev_bar = found[0]
+            if prev_bar is None:
+                prev_bar = terminal.copy_rates_from_pos(self.symbol, terminal.TIMEFRAME_MN1, 1, 1)[0]
+            self._prev_month_range = (prev_bar[2], prev_bar[3])
+            self._month = month
+        return self._prev_month_range
+
+
+class TradingCalendars:
+    """
+    Calendars of all symbols, shared by every signal on the same symbol
+    """
+
+    def __init__(self, refresh_interval: float = 60, store=None):
+        self.refresh_interval = refresh_interval
+        self.store = store
+        self.calendars: dict[str, TradingCalendar] = {}
+
+    def get(self, terminal, symbol: str, since: datetime | None = None) -> TradingCalendar:
+        calendar = self.calendars.get(symbol)
+        if calendar is None:
+            calendar = self.calendars[symbol] = TradingCalendar(symbol, self.refresh_interval, self.store)
+        calendar.sync(terminal, since)
+        return calendar
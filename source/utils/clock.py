@@ -0,0 +1,21 @@
+"""
+Source of the current time for signals.
+Live trading uses datetime.now(), the backtest replaces it with a virtual clock
+"""
+from datetime import datetime
+from typing import Callable
+
+_source: Callable[[], datetime] = datetime.now
+
+
+def now() -> datetime:
+    return _source()
+
+
+def set_source(source: Callable[[], datetime]):
+    global _source
+    _source = source
+
+
+def reset():
+    set_source(datetime.now)
@@ -24,4 +24,18 @@ class ServerStatusError(Exception):
         super().__init__(f"An error has occurred when expert was trying open a position: \n"
                          f"Error number: {status_code}\n"
                          f"Error description: {server_status_code.SERVER_STATUS_CODE.get(status_code)}\n")
-        self.status_code = status_code
\ No newline at end of file
+        self.status_code = status_code
+
+class TerminalDataError(Exception):
+    def __init__(self, function, error):
+        self.function = function
+        self.error = error
+        super().__init__(f"Terminal function {function} returned no data. Last error: {error}")
+
+
+class SignalNotReadyError(Exception):
+    def __init__(self, symbol, reason, delay=2):
+        self.symbol = symbol
+        self.reason = reason
+        self.delay = delay
+        super().__init__(f"Signal on {symbol} can't be handled now: {reason}. Retry in {delay} s")
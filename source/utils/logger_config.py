@@ -1,42 +1,156 @@
+"""
+Logging of the project.
+
+Records are put into a queue by the calling thread and written to the file and
+the console by a background QueueListener, so the trading thread never waits
+for disk or console I/O. Identical messages repeated within LOG_RATE_LIMIT
+seconds are dropped and counted, the next one after the window says how many
+were suppressed.
+
+Environment:
+    LOG_FILE        file name in logs/, project.log by default (one per supervisor worker)
+    LOG_LEVEL       DEBUG by default
+    LOG_FORMAT      "json" writes the file as JSON lines
+    LOG_RATE_LIMIT  seconds, 60 by default, 0 disables de-duplication
+"""
+import atexit
+import json
 import logging
-import logging.config
+import logging.handlers
 import os
+import queue
+import threading
 
 LOG_DIR = "logs"
-LOG_FILE = "project.log"
+# Отдельный файл для каждого процесса супервизора
+LOG_FILE = os.getenv("LOG_FILE", "project.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", 60))
 
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
-LOGGING_CONFIG = {
-    "version": 1,
-    "disable_existing_loggers": False,
-    "formatters": {
-        "standard": {
-            "format": "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-            "datefmt": "%Y-%m-%d %H:%M:%S",
-        },
-    },
-    "handlers": {
-        "file_handler": {
-            "class": "logging.handlers.TimedRotatingFileHandler",
-            "filename": os.path.join(LOG_DIR, LOG_FILE),
-            "when": "midnight",
-            "interval": 1,
-            "backupCount": 7,
-            "formatter": "standard",
-            "encoding": "utf-8"
-        },
-        "console_handler": {
-            "class": "logging.StreamHandler",
-            "formatter": "standard",
-        },
-    },
-    "root": {
-        "handlers": ["file_handler", "console_handler"],
-        "level": "DEBUG",
-    },
-}
-
-logging.config.dictConfig(LOGGING_CONFIG)
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message and exception
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Pass a message at most once per ``interval`` seconds per key.
+
+    The key is the logger, the level, the message template and its arguments,
+    the message is not formatted in the calling thread. The ``log_key`` extra
+    limits a message with changing values as one
+    (logger.debug(..., extra={"log_key": "working-day"})).
+    Warnings and errors are limited too: a failing request logs the same
+    error every second.
+    """
+
+    def __init__(self, interval: float = 60, max_keys: int = 10000):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        # key -> (время последней записи, число подавленных)
+        self.seen: dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, getattr(record, "log_key", None) or self.message_key(record))
+        now = record.created
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            if entry is not None and entry[1]:
+                record.suppressed = entry[1]
+                record.msg = f"{record.msg} (repeated {entry[1]} times)"
+            if len(self.seen) >= self.max_keys:
+                self.prune(now)
+            self.seen[key] = [now, 0]
+        return True
+
+    @staticmethod
+    def message_key(record: logging.LogRecord) -> tuple:
+        args = record.args
+        try:
+            hash(args)
+        except TypeError:
+            # Изменяемые аргументы (списки, словари) сравниваются по тексту
+            args = repr(args)
+        return record.msg, args
+
+    def prune(self, now: float):
+        for key in [key for key, entry in self.seen.items() if now - entry[0] >= self.interval]:
+            del self.seen[key]
+        if len(self.seen) >= self.max_keys:
+            self.seen.clear()
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that passes records to the listener as they are.
+    QueueHandler.prepare() formats the message in the calling thread so the record
+    can be pickled, the queue here stays in the process and formatting is left
+    to the listener thread
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def build_handlers(path: str, fmt: str = LOG_FORMAT) -> list[logging.Handler]:
+    standard = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S")
+    file_handler = logging.handlers.TimedRotatingFileHandler(
+        path, when="midnight", interval=1, backupCount=7, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter(datefmt="%Y-%m-%d %H:%M:%S") if fmt == "json" else standard)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(standard)
+    return [file_handler, console_handler]
+
+
+def start_queue_logging(
+        target: logging.Logger,
+        handlers: list[logging.Handler],
+        rate_limit: float = LOG_RATE_LIMIT
+) -> logging.handlers.QueueListener:
+    """
+    Attach a queue handler to ``target`` and start a listener thread that
+    passes the records to ``handlers``
+    """
+    records = queue.SimpleQueue()
+    queue_handler = LogQueueHandler(records)
+    if rate_limit > 0:
+        queue_handler.addFilter(RateLimitFilter(rate_limit))
+    target.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+# logging.config не используется: его импорт тянет socketserver и замедляет запуск
+logging.getLogger().setLevel(LOG_LEVEL)
+listener = start_queue_logging(logging.getLogger(), build_handlers(os.path.join(LOG_DIR, LOG_FILE)))
+# Записи из очереди дописываются при выходе
+atexit.register(listener.stop)
 logger = logging.getLogger(__name__)